@@ -0,0 +1,375 @@
+#!/usr/bin/env python3
+"""
+bench_move_pico_project.py
+move_pico_project.py の各フェーズの処理時間を計測するベンチマーク
+合成したPicoプロジェクトで、スループット（files/s, MB/s）とピークRSSを計測し、保存したベースラインと比較します
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import shutil
+import argparse
+import resource
+import tempfile
+import statistics
+import contextlib
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, asdict
+from pathlib import Path
+from typing import Optional, List, Dict, Any
+
+sys.path.insert(0, str(Path(__file__).parent.absolute()))
+from move_pico_project import PicoProjectMover  # noqa: E402
+
+INIT_DIR = "temp_project"
+PROJECT_NAME = "bench_project"
+DEFAULT_BASELINE = Path(__file__).parent.absolute() / ".bench" / "baseline.json"
+
+
+@dataclass
+class ProjectShape:
+    # 合成プロジェクトの形状
+    sources: int = 50            # ソースファイル数
+    depth: int = 3               # ソースを置くディレクトリの深さ
+    fanout: int = 4              # 1ディレクトリあたりのサブディレクトリ数
+    source_lines: int = 40       # 1ソースファイルの行数
+    build_objects: int = 200     # build/ 内のオブジェクトファイル数
+    object_size: int = 16 * 1024  # オブジェクトファイル1個のサイズ
+    gitignore_lines: int = 200   # .gitignore の行数（移動元・展開先それぞれ）
+    extensions: int = 100        # extensions.json の推奨拡張機能数（移動元・展開先それぞれ）
+    cmake_lines: int = 500       # CMakeLists.txt の行数
+
+
+SHAPES = {
+    "small": ProjectShape(),
+    "medium": ProjectShape(sources=500, depth=4, build_objects=2000, gitignore_lines=2000,
+                           extensions=2000, cmake_lines=3000),
+    "large": ProjectShape(sources=5000, depth=5, fanout=6, build_objects=20000, object_size=8 * 1024,
+                          gitignore_lines=10000, extensions=5000, cmake_lines=10000),
+}
+
+
+def _write(path: Path, text: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(text, encoding="utf-8")
+
+
+def _source_dirs(shape: ProjectShape) -> List[str]:
+    # 深さdepth・分岐数fanoutのディレクトリ名を列挙（ソースを割り当てる順）
+    dirs = [""]
+    level = [""]
+    for depth in range(shape.depth):
+        level = [f"{parent}/d{depth}_{i}".lstrip("/") for parent in level for i in range(shape.fanout)]
+        dirs.extend(level)
+        if len(dirs) >= shape.sources:
+            break
+    return dirs
+
+
+def generate_workspace(root: Path, shape: ProjectShape) -> None:
+    # root直下にワークスペース（.gitignore, .vscode）と初期化済みプロジェクトを生成
+    src = root / INIT_DIR
+    _write(root / ".gitignore", "".join(f"/workspace_ignore_{i}/\n" for i in range(shape.gitignore_lines)))
+    _write(root / ".vscode" / "extensions.json", json.dumps(
+        {"recommendations": [f"workspace.extension-{i}" for i in range(shape.extensions)]}, indent=4))
+
+    _write(src / ".gitignore", "".join(
+        f"/project_ignore_{i}/\n" if i % 2 else f"/workspace_ignore_{i}/\n" for i in range(shape.gitignore_lines)))
+    _write(src / ".vscode" / "extensions.json", json.dumps(
+        {"recommendations": [f"{'workspace' if i % 2 else 'project'}.extension-{i}"
+                             for i in range(shape.extensions)]}, indent=4))
+    _write(src / ".vscode" / "launch.json", json.dumps(
+        {"configurations": [{"name": "Pico Debug", "program": f"${{workspaceRoot}}/build/{INIT_DIR}.elf"}]}))
+
+    dirs = _source_dirs(shape)
+    sources = []
+    body = "".join(f"static int {INIT_DIR}_value_{i} = {i};\n" for i in range(shape.source_lines))
+    for i in range(shape.sources):
+        relative = Path(dirs[i % len(dirs)]) / f"src_{i}.c"
+        _write(src / relative, f'#include "{INIT_DIR}.h"\n{body}')
+        sources.append(relative.as_posix())
+    _write(src / f"{INIT_DIR}.c", f'#include "{INIT_DIR}.h"\nint main(void) {{ return 0; }}\n')
+    _write(src / f"{INIT_DIR}.h", f"#define {INIT_DIR.upper()}_H\n")
+
+    cmake = [
+        "cmake_minimum_required(VERSION 3.13)",
+        "include(pico_sdk_import.cmake)",
+        f"project({INIT_DIR} C CXX ASM)",
+        "pico_sdk_init()",
+        f"add_executable({INIT_DIR} {INIT_DIR}.c)",
+        f"pico_set_program_name({INIT_DIR} \"{INIT_DIR}\")",
+    ]
+    filler = max(shape.cmake_lines - len(cmake) - 2, 0)
+    for i in range(filler):
+        if i < len(sources):
+            cmake.append(f"target_sources({INIT_DIR} PRIVATE {sources[i]})")
+        else:
+            cmake.append(f"# {INIT_DIR} padding line {i}")
+    cmake.append(f"target_link_libraries({INIT_DIR} pico_stdlib)")
+    cmake.append(f"pico_add_extra_outputs({INIT_DIR})")
+    _write(src / "CMakeLists.txt", "\n".join(cmake) + "\n")
+    _write(src / "pico_sdk_import.cmake", "# pico_sdk_import.cmake\n")
+
+    build = src / "build"
+    _write(build / "CMakeCache.txt", f"CMAKE_HOME_DIRECTORY:INTERNAL={src}\n")
+    blob = os.urandom(shape.object_size)
+    objects = build / "CMakeFiles" / f"{INIT_DIR}.dir"
+    objects.mkdir(parents=True, exist_ok=True)
+    for i in range(shape.build_objects):
+        (objects / f"obj_{i}.c.obj").write_bytes(blob)
+
+
+def _tree_stats(path: Path) -> tuple[int, int]:
+    # path以下のファイル数と合計バイト数
+    if path.is_file():
+        return 1, path.stat().st_size
+    files = 0
+    size = 0
+    for dirpath, _, filenames in os.walk(path):
+        for name in filenames:
+            files += 1
+            size += os.lstat(os.path.join(dirpath, name)).st_size
+    return files, size
+
+
+def _sum_stats(paths: List[Path]) -> tuple[int, int]:
+    files = 0
+    size = 0
+    for path in paths:
+        if path.exists():
+            f, s = _tree_stats(path)
+            files += f
+            size += s
+    return files, size
+
+
+def _phase_setup(mover: PicoProjectMover, phase: str) -> None:
+    # 計測対象フェーズの前提となる処理（計測しない）
+    src_dir = mover.root_dir / INIT_DIR
+    if phase == "update_cmake_project_name":
+        mover.merge_gitignore(src_dir)
+        mover.merge_extensions_json(src_dir)
+        mover.cleanup_build_directory(src_dir)
+        mover.move_project_files(src_dir, mover.root_dir, INIT_DIR)
+
+
+def _phase_workload(root: Path, phase: str) -> tuple[int, int]:
+    # フェーズが扱うファイル数とバイト数（スループットの分母）
+    src_dir = root / INIT_DIR
+    if phase == "merge_gitignore":
+        return _sum_stats([src_dir / ".gitignore", root / ".gitignore"])
+    if phase == "merge_extensions_json":
+        return _sum_stats([src_dir / ".vscode" / "extensions.json", root / ".vscode" / "extensions.json"])
+    if phase == "cleanup_build_directory":
+        return _sum_stats([src_dir / "build"])
+    if phase == "update_cmake_project_name":
+        return _sum_stats([p for p in root.rglob("*") if p.name == "CMakeLists.txt" or p.suffix == ".cmake"])
+    return _sum_stats([src_dir])
+
+
+def _phase_run(mover: PicoProjectMover, phase: str) -> None:
+    src_dir = mover.root_dir / INIT_DIR
+    if phase == "merge_gitignore":
+        mover.merge_gitignore(src_dir)
+    elif phase == "merge_extensions_json":
+        mover.merge_extensions_json(src_dir)
+    elif phase == "cleanup_build_directory":
+        mover.cleanup_build_directory(src_dir)
+    elif phase == "move_project_files":
+        mover.move_project_files(src_dir, mover.root_dir, INIT_DIR)
+    elif phase == "update_cmake_project_name":
+        mover.update_cmake_project_name(INIT_DIR)
+    elif phase == "move_project":
+        mover.move_project(INIT_DIR)
+
+
+PHASES = [
+    "merge_gitignore",
+    "merge_extensions_json",
+    "cleanup_build_directory",
+    "move_project_files",
+    "update_cmake_project_name",
+    "move_project",
+]
+
+
+def run_once(base_dir: str, shape: Dict[str, Any], phase: str) -> Dict[str, Any]:
+    # 新しいワークスペースを生成して1フェーズを1回計測（ワーカープロセス内で実行）
+    root = Path(tempfile.mkdtemp(prefix="pico_bench_", dir=base_dir))
+    try:
+        generate_workspace(root, ProjectShape(**shape))
+        log = io.StringIO()
+        with contextlib.redirect_stdout(log):
+            mover = PicoProjectMover(root_dir=root, project_name=PROJECT_NAME)
+            _phase_setup(mover, phase)
+            files, size = _phase_workload(root, phase)
+            rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+            start = time.perf_counter()
+            _phase_run(mover, phase)
+            elapsed = time.perf_counter() - start
+        peak_rss_kb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return {"seconds": elapsed, "files": files, "bytes": size,
+                "peak_rss_kb": peak_rss_kb, "rss_growth_kb": peak_rss_kb - rss_before}
+    finally:
+        shutil.rmtree(root, ignore_errors=True)
+
+
+@dataclass
+class BenchResult:
+    # 1つの(ファイルシステム, 形状, フェーズ)の計測結果（複数回の中央値）
+    filesystem: str
+    shape: str
+    phase: str
+    seconds: float
+    files: int
+    bytes: int
+    files_per_s: float
+    mb_per_s: float
+    peak_rss_kb: int
+
+    @property
+    def key(self) -> str:
+        return f"{self.filesystem}/{self.shape}/{self.phase}"
+
+
+def run_benchmark(filesystems: Dict[str, Path], shapes: Dict[str, ProjectShape],
+                  phases: List[str], repeat: int) -> List[BenchResult]:
+    # 各計測はspawnした新しいプロセスで行い、ピークRSSが他の計測の影響を受けないようにする
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for fs_name, base_dir in filesystems.items():
+        for shape_name, shape in shapes.items():
+            for phase in phases:
+                runs = []
+                for _ in range(repeat):
+                    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+                        runs.append(executor.submit(run_once, str(base_dir), asdict(shape), phase).result())
+                seconds = statistics.median(run["seconds"] for run in runs)
+                files, size = runs[0]["files"], runs[0]["bytes"]
+                result = BenchResult(
+                    filesystem=fs_name, shape=shape_name, phase=phase, seconds=seconds,
+                    files=files, bytes=size,
+                    files_per_s=files / seconds if seconds > 0 else 0.0,
+                    mb_per_s=size / 1e6 / seconds if seconds > 0 else 0.0,
+                    peak_rss_kb=max(run["peak_rss_kb"] for run in runs))
+                print(f"{result.key:<52} {seconds * 1000:10.2f} ms "
+                      f"{result.files_per_s:12.0f} files/s {result.mb_per_s:9.1f} MB/s "
+                      f"{result.peak_rss_kb / 1024:8.1f} MiB", flush=True)
+                results.append(result)
+    return results
+
+
+def load_baseline(path: Path) -> Dict[str, Dict[str, Any]]:
+    if not path.exists():
+        return {}
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f).get("results", {})
+
+
+def save_baseline(path: Path, results: List[BenchResult]) -> None:
+    # 既存のベースラインに今回の結果を上書きマージして保存
+    baseline = load_baseline(path)
+    for result in results:
+        baseline[result.key] = asdict(result)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({"python": sys.version.split()[0], "results": baseline}, f, indent=2, sort_keys=True)
+        f.write('\n')
+    print(f"ベースラインを保存しました: {path}")
+
+
+def compare_baseline(results: List[BenchResult], baseline: Dict[str, Dict[str, Any]],
+                     threshold: float) -> List[str]:
+    # ベースラインとの比較を表示し、閾値を超えて遅くなった計測のキーを返す
+    regressions = []
+    print()
+    print(f"{'ベースラインとの比較':<44} {'前回':>10} {'今回':>10} {'比率':>7} {'RSS比':>7}")
+    for result in results:
+        base = baseline.get(result.key)
+        if base is None:
+            print(f"{result.key:<52} {'-':>10} {result.seconds * 1000:8.2f}ms  (新規)")
+            continue
+        ratio = result.seconds / base["seconds"] if base["seconds"] > 0 else 1.0
+        rss_ratio = result.peak_rss_kb / base["peak_rss_kb"] if base.get("peak_rss_kb") else 1.0
+        mark = ""
+        if ratio > 1.0 + threshold:
+            mark = "  低下"
+            regressions.append(result.key)
+        elif ratio < 1.0 - threshold:
+            mark = "  改善"
+        print(f"{result.key:<52} {base['seconds'] * 1000:8.2f}ms {result.seconds * 1000:8.2f}ms "
+              f"{ratio:6.2f}x {rss_ratio:6.2f}x{mark}")
+    return regressions
+
+
+def _default_filesystems() -> Dict[str, Path]:
+    # tmpfs（/dev/shm）と通常のファイルシステム（カレントディレクトリ）
+    filesystems = {}
+    if Path("/dev/shm").is_dir() and os.access("/dev/shm", os.W_OK):
+        filesystems["tmpfs"] = Path("/dev/shm")
+    filesystems["disk"] = Path.cwd()
+    return filesystems
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(
+        description="合成したPicoプロジェクトで move_pico_project.py の各フェーズを計測します",
+        epilog="使用例: ./bench_move_pico_project.py --shape medium --save-baseline")
+    parser.add_argument("--shape", action="append", choices=sorted(SHAPES),
+                        help="プロジェクトの形状 (複数指定可, 既定: small)")
+    parser.add_argument("--phase", action="append", choices=PHASES,
+                        help="計測するフェーズ (複数指定可, 既定: すべて)")
+    parser.add_argument("--fs", action="append", default=[], metavar="NAME=DIR",
+                        help="計測に使うディレクトリ (複数指定可, 既定: tmpfs=/dev/shm とカレントディレクトリ)")
+    parser.add_argument("--repeat", type=int, default=3, help="各計測の繰り返し回数（中央値を採用）")
+    for field_name, default in asdict(ProjectShape()).items():
+        parser.add_argument(f"--{field_name.replace('_', '-')}", type=int, default=None,
+                            help=f"形状の {field_name} を上書き (small: {default})")
+    parser.add_argument("--baseline", type=Path, default=DEFAULT_BASELINE, help="ベースラインのJSONファイル")
+    parser.add_argument("--save-baseline", action="store_true", help="今回の結果をベースラインとして保存")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="性能低下とみなす比率 (既定: 0.2 = 20%%遅化)")
+    parser.add_argument("--fail-on-regression", action="store_true",
+                        help="性能低下があれば終了コード1で終了")
+    parser.add_argument("--json", type=Path, help="計測結果をJSONで書き出すパス")
+    args = parser.parse_args(argv)
+
+    overrides = {name: getattr(args, name) for name in asdict(ProjectShape())
+                 if getattr(args, name) is not None}
+    shapes = {}
+    for name in args.shape or ["small"]:
+        shape = ProjectShape(**{**asdict(SHAPES[name]), **overrides})
+        shapes[name + ("+custom" if overrides else "")] = shape
+
+    filesystems = _default_filesystems()
+    if args.fs:
+        filesystems = {}
+        for pair in args.fs:
+            name, sep, directory = pair.partition("=")
+            if not sep or not name or not Path(directory).is_dir():
+                parser.error(f"--fs は NAME=DIR の形式で既存のディレクトリを指定してください: {pair}")
+            filesystems[name] = Path(directory)
+
+    results = run_benchmark(filesystems, shapes, args.phase or PHASES, max(args.repeat, 1))
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump([asdict(result) for result in results], f, indent=2)
+            f.write('\n')
+
+    regressions = compare_baseline(results, load_baseline(args.baseline), args.threshold)
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+    if regressions:
+        print(f"\n警告: {len(regressions)} 件の計測でベースラインより {args.threshold:.0%} 以上遅くなりました")
+        if args.fail_on_regression:
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
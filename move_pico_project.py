@@ -8,490 +8,5741 @@ DevContainer環境でPicoプロジェクトを移動するためのPythonスク
 import sys
 import os
 import re
+import io
+import errno
+import time
 import shutil
 import json
+import hashlib
+import difflib
+import uuid
+import threading
+import subprocess
+import argparse
+import select
+import stat
+import struct
+import contextlib
+import inspect
+import logging
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed
+from dataclasses import dataclass, field, asdict
 from pathlib import Path
 from typing import Optional, List, Dict, Any
 from datetime import datetime
 
 
+class PicoProjectError(Exception):
+    # プロジェクト移動を続行できないエラー（sys.exitの代わりに送出）
+    # codeはAPI/JSON-RPCの呼び出し元がエラーの種類を判別するための識別子、detailsは関連するパスなど
+    code = "error"
+
+    def __init__(self, message: str, **details: Any):
+        super().__init__(message)
+        self.details = details
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"code": self.code, "message": str(self),
+                "details": {key: str(value) if isinstance(value, Path) else value
+                            for key, value in self.details.items()}}
+
+
+class ProjectNotFoundError(PicoProjectError):
+    # 移動元に有効なPicoプロジェクトがない
+    code = "project_not_found"
+
+
+class ProjectExistsError(PicoProjectError):
+    # 展開先に既にプロジェクトがある
+    code = "project_exists"
+
+
+class InsufficientSpaceError(PicoProjectError):
+    # 展開先の空き容量が足りない
+    code = "insufficient_space"
+
+
+class JournalConflictError(PicoProjectError):
+    # 別の移動処理のジャーナルが残っている
+    code = "journal_conflict"
+
+
+class SyncBaseMissingError(PicoProjectError):
+    # --syncの基準となるマニフェストがない
+    code = "sync_base_missing"
+
+
+class TemplateNotFoundError(PicoProjectError):
+    # createの条件に合うテンプレートがない、または1つに絞れない
+    code = "template_not_found"
+
+
+class InvalidOptionError(PicoProjectError):
+    # APIに不明なオプションや不正な値が渡された
+    code = "invalid_option"
+
+
+# ライブラリとして使う場合の出力先（既定では何も出力しない）
+LOGGER = logging.getLogger("move_pico_project")
+LOGGER.addHandler(logging.NullHandler())
+
+
+# renameat2(2) のフラグ（展開先が存在する場合は失敗させる）
+AT_FDCWD = -100
+RENAME_NOREPLACE = 1
+
+
+def _load_renameat2():
+    # libcのrenameat2を取得（glibc 2.28未満やLinux以外ではNone）
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        import ctypes
+        libc = ctypes.CDLL(None, use_errno=True)
+        func = libc.renameat2
+    except (OSError, AttributeError):
+        return None
+    func.argtypes = [ctypes.c_int, ctypes.c_char_p,
+                     ctypes.c_int, ctypes.c_char_p, ctypes.c_uint]
+    func.restype = ctypes.c_int
+    return func
+
+
+_renameat2 = _load_renameat2()
+
+
+def _rename_noreplace(src: Path, dst: Path) -> None:
+    # 展開先を上書きしないrename（renameat2が使えない場合は存在確認してからrename）
+    global _renameat2
+    if _renameat2 is not None:
+        import ctypes
+        if _renameat2(AT_FDCWD, os.fsencode(src), AT_FDCWD, os.fsencode(dst), RENAME_NOREPLACE) == 0:
+            return
+        err = ctypes.get_errno()
+        if err not in (errno.ENOSYS, errno.EINVAL):
+            raise OSError(err, os.strerror(err), str(src), None, str(dst))
+        # ファイルシステムがフラグ未対応の場合は以降フォールバックを使う
+        _renameat2 = None
+
+    if os.path.lexists(dst):
+        raise FileExistsError(errno.EEXIST, os.strerror(errno.EEXIST), str(dst))
+    os.rename(src, dst)
+
+
+def _same_device(a: Path, b: Path) -> bool:
+    # 2つのパスが同じデバイス上にあるか（renameで移動できるか）を判定
+    try:
+        return os.stat(a).st_dev == os.stat(b).st_dev
+    except OSError:
+        return False
+
+
+# バックグラウンド削除用のゴミ箱ディレクトリ名（ワークスペース直下）
+TRASH_DIR_NAME = ".pico_trash"
+# createとアーカイブの取り込みで、名前を置換したプロジェクトを書き出す作業用ディレクトリ（ワークスペース直下）
+CREATE_DIR_NAME = ".pico_create"
+
+
+def _format_bytes(size: int) -> str:
+    # バイト数を人が読みやすい形式に変換
+    value = float(size)
+    for unit in ("B", "KB", "MB", "GB"):
+        if value < 1024 or unit == "GB":
+            return f"{value:.1f} {unit}" if unit != "B" else f"{int(value)} B"
+        value /= 1024
+    return f"{size} B"
+
+
+def move_to_trash(path: Path, trash_dir: Path) -> Optional[Path]:
+    # ディレクトリをゴミ箱へrenameする（別デバイスなどrenameできない場合はNone）
+    try:
+        trash_dir.mkdir(exist_ok=True)
+        target = trash_dir / f"{path.name}-{uuid.uuid4().hex[:12]}"
+        os.rename(path, target)
+        return target
+    except OSError:
+        return None
+
+
+class TrashReclaimer:
+    # ゴミ箱ディレクトリの中身をスレッドプールで並列に削除するクラス
+    # ディレクトリfd基準のunlink/rmdirを使い、パス解決のコストとシンボリックリンクの追従を避ける
+
+    LOCK_FILE = ".lock"
+    # バックグラウンド削除のログ（削除後もユーザーが確認できるよう削除対象から外す）
+    LOG_FILE = "reclaim.log"
+    KEEP_FILES = (LOCK_FILE, LOG_FILE)
+
+    def __init__(self, trash_dir: Path, workers: Optional[int] = None, progress: bool = True, log=None):
+        # log(message): 進捗の出力先（Noneの場合は標準出力）
+        self.trash_dir = trash_dir
+        self.workers = workers or min(32, (os.cpu_count() or 1) * 4)
+        self.progress = progress
+        self.log = log or (lambda message: print(message, flush=True))
+        self.files_removed = 0
+        self.dirs_removed = 0
+        self.bytes_freed = 0
+        self.errors: List[str] = []
+        self._lock = threading.Lock()
+        self._last_report = time.monotonic()
+
+    def _account(self, files: int, dirs: int, size: int) -> None:
+        # 削除件数を集計し、一定間隔で進捗を表示
+        with self._lock:
+            self.files_removed += files
+            self.dirs_removed += dirs
+            self.bytes_freed += size
+            now = time.monotonic()
+            if self.progress and now - self._last_report >= 0.5:
+                self._last_report = now
+                self.log(f"削除中: {self.files_removed} ファイル, {_format_bytes(self.bytes_freed)} 解放")
+
+    def _remove_at(self, parent_fd: int, name: str) -> None:
+        # parent_fd配下のnameを再帰的に削除
+        try:
+            fd = os.open(name, os.O_RDONLY | os.O_DIRECTORY | os.O_NOFOLLOW, dir_fd=parent_fd)
+        except NotADirectoryError:
+            size = os.stat(name, dir_fd=parent_fd, follow_symlinks=False).st_size
+            os.unlink(name, dir_fd=parent_fd)
+            self._account(1, 0, size)
+            return
+        except OSError as e:
+            if e.errno == errno.ELOOP:  # シンボリックリンク
+                os.unlink(name, dir_fd=parent_fd)
+                self._account(1, 0, 0)
+                return
+            raise
+
+        try:
+            files = 0
+            size = 0
+            with os.scandir(fd) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        self._remove_at(fd, entry.name)
+                        continue
+                    try:
+                        size += entry.stat(follow_symlinks=False).st_size
+                    except OSError:
+                        pass
+                    os.unlink(entry.name, dir_fd=fd)
+                    files += 1
+            self._account(files, 0, size)
+        finally:
+            os.close(fd)
+        os.rmdir(name, dir_fd=parent_fd)
+        self._account(0, 1, 0)
+
+    def _remove_subtree(self, path: Path) -> None:
+        # スレッドプールのタスク単位: pathを丸ごと削除
+        try:
+            parent_fd = os.open(path.parent, os.O_RDONLY | os.O_DIRECTORY)
+        except FileNotFoundError:
+            return
+        try:
+            self._remove_at(parent_fd, path.name)
+        except FileNotFoundError:
+            pass
+        except OSError as e:
+            with self._lock:
+                self.errors.append(f"{path}: {e}")
+        finally:
+            os.close(parent_fd)
+
+    def _collect_tasks(self, root: Path, depth: int = 2) -> List[Path]:
+        # 並列化の単位として、指定した深さまでのサブディレクトリのうち末端のものを列挙
+        # （親と子を同時に削除すると競合するため、親は子の削除後に呼び出し側でまとめて削除する）
+        tasks = []
+        try:
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        path = Path(entry.path)
+                        children = self._collect_tasks(path, depth - 1) if depth > 1 else []
+                        tasks.extend(children or [path])
+        except OSError:
+            pass
+        return tasks
+
+    def reclaim(self) -> bool:
+        # ゴミ箱を空にする（他のプロセスが削除中の場合はFalse）
+        if not self.trash_dir.is_dir():
+            return True
+
+        import fcntl
+        lock_path = self.trash_dir / self.LOCK_FILE
+        with open(lock_path, 'a') as lock_file:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                if self.progress:
+                    self.log("他のプロセスがゴミ箱を削除中です")
+                return False
+
+            # 削除中に新しく捨てられたものも拾えるよう、空になるまで繰り返す
+            while True:
+                entries = [p for p in self.trash_dir.iterdir() if p.name not in self.KEEP_FILES]
+                if not entries:
+                    break
+                # 深い部分から並列に削除し、残った浅い部分は最後にまとめて削除
+                subtrees = []
+                for entry in entries:
+                    if entry.is_dir() and not entry.is_symlink():
+                        subtrees.extend(self._collect_tasks(entry))
+                with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                    list(executor.map(self._remove_subtree, subtrees))
+                for entry in entries:
+                    self._remove_subtree(entry)
+                if self.errors:
+                    break
+
+        try:
+            lock_path.unlink()
+            self.trash_dir.rmdir()
+        except OSError:
+            pass
+
+        if self.progress:
+            self.log(f"ゴミ箱の削除が完了しました: {self.files_removed} ファイル, "
+                     f"{self.dirs_removed} ディレクトリ, {_format_bytes(self.bytes_freed)} 解放")
+            for error in self.errors:
+                self.log(f"警告: 削除に失敗: {error}")
+        return not self.errors
+
+
+def spawn_trash_reclaimer(root_dir: Path) -> int:
+    # ゴミ箱の削除を切り離したバックグラウンドプロセスで開始（PIDを返す、開始できなければOSError）
+    trash_dir = root_dir / TRASH_DIR_NAME
+    try:
+        log_file = open(trash_dir / TrashReclaimer.LOG_FILE, 'ab')
+    except OSError:
+        log_file = subprocess.DEVNULL
+    try:
+        process = subprocess.Popen(
+            [sys.executable, str(Path(__file__).absolute()),
+             "reclaim-trash", str(root_dir)],
+            stdin=subprocess.DEVNULL, stdout=log_file, stderr=subprocess.STDOUT,
+            start_new_session=True)
+        return process.pid
+    finally:
+        if log_file is not subprocess.DEVNULL:
+            log_file.close()
+
+
+class ParallelCopier:
+    # renameできない（デバイスをまたぐ）移動のためのコピーエンジン
+    # ツリーを1回だけ走査し、ファイルをスレッドプールでcopy_file_range/sendfileにより並列コピーして、
+    # パーミッションと更新日時は最後にまとめて適用する。移動元はコピーの検証が済んだ要素だけ削除する
+    # 失敗した要素は、このコピーで作成したファイルとディレクトリだけを削除する（既存のディレクトリの中身には触れない）
+
+    CHUNK_SIZE = 16 * 1024 * 1024  # copy_file_range/sendfile 1回あたりの最大バイト数
+    BUFFER_SIZE = 1024 * 1024      # どちらも使えない場合の読み書きバッファ
+
+    def __init__(self, workers: Optional[int] = None, store: Optional["ContentStore"] = None,
+                 before_write=None):
+        self.workers = workers or 16
+        # 指定した場合、ストアにある内容のファイルはバイトをコピーせずreflinkで作成する
+        self.store = store
+        # before_write(path): 既存のファイル・シンボリックリンクを上書きする直前に呼ばれる
+        # （既存のファイルやディレクトリをシンボリックリンクで置き換えることはしない）
+        self.before_write = before_write
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.max_concurrency = 0
+        self.methods: Dict[str, int] = {}
+        # コピー自体は成功したが、移動元を削除できなかったもの
+        self.cleanup_errors: List[str] = []
+        self._active = 0
+        self._lock = threading.Lock()
+
+    def _scan(self, src: Path, dst: Path, dirs: list, files: list, links: list) -> None:
+        # src以下を1回だけ走査して、作成するディレクトリ・コピーするファイル・シンボリックリンクを列挙
+        st = os.lstat(src)
+        if os.path.islink(src):
+            links.append((src, dst))
+            return
+        if not os.path.isdir(src):
+            self._check_regular(src, st)
+            files.append((src, dst, st))
+            return
+        dirs.append((src, dst, st))
+        stack = [(src, dst)]
+        while stack:
+            src_dir, dst_dir = stack.pop()
+            with os.scandir(src_dir) as entries:
+                for entry in entries:
+                    src_path, dst_path = Path(entry.path), dst_dir / entry.name
+                    entry_st = entry.stat(follow_symlinks=False)
+                    if entry.is_symlink():
+                        links.append((src_path, dst_path))
+                    elif entry.is_dir(follow_symlinks=False):
+                        dirs.append((src_path, dst_path, entry_st))
+                        stack.append((src_path, dst_path))
+                    else:
+                        self._check_regular(src_path, entry_st)
+                        files.append((src_path, dst_path, entry_st))
+
+    @staticmethod
+    def _check_regular(path: Path, st: os.stat_result) -> None:
+        # ソケットやFIFOなどはコピーできないため、その要素全体を失敗にする（何も作成する前に判定）
+        if not stat.S_ISREG(st.st_mode):
+            raise OSError(errno.EINVAL, "通常のファイルではないためコピーできません", str(path))
+
+    def _remove_created(self, created: List[Path]) -> None:
+        # 失敗した要素について、このコピーで作成したものだけを作成と逆の順に削除
+        for path in reversed(created):
+            try:
+                if os.path.isdir(path) and not os.path.islink(path):
+                    os.rmdir(path)
+                else:
+                    os.unlink(path)
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.cleanup_errors.append(f"作りかけの {path} の削除に失敗: {e}")
+
+    def _copy_data(self, src_fd: int, dst_fd: int, size: int) -> tuple[int, str]:
+        # カーネル内コピーを優先し、使えなければsendfile、最後に読み書きで複製
+        copied = 0
+        if hasattr(os, "copy_file_range"):
+            try:
+                while copied < size:
+                    n = os.copy_file_range(src_fd, dst_fd, min(self.CHUNK_SIZE, size - copied))
+                    if n == 0:
+                        break
+                    copied += n
+                if copied == size:
+                    return copied, "copy_file_range"
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP, errno.EPERM):
+                    raise
+        try:
+            while copied < size:
+                n = os.sendfile(dst_fd, src_fd, copied, min(self.CHUNK_SIZE, size - copied))
+                if n == 0:
+                    break
+                copied += n
+            if copied == size:
+                return copied, "sendfile"
+        except OSError as e:
+            if e.errno not in (errno.ENOSYS, errno.EINVAL, errno.EOPNOTSUPP):
+                raise
+        os.lseek(src_fd, copied, os.SEEK_SET)
+        os.lseek(dst_fd, copied, os.SEEK_SET)
+        while True:
+            data = os.read(src_fd, self.BUFFER_SIZE)
+            if not data:
+                break
+            copied += os.write(dst_fd, data)
+        return copied, "read/write"
+
+    def _copy_file(self, src: Path, dst: Path, st: os.stat_result) -> int:
+        # 1ファイルをコピーし、サイズが一致することを確認
+        with self._lock:
+            self._active += 1
+            self.max_concurrency = max(self.max_concurrency, self._active)
+        try:
+            # 同じディレクトリの一時ファイルに書き、検証できてから置き換える（既存のファイルを途中まで上書きしない）
+            tmp = dst.with_name(f".{dst.name}.{uuid.uuid4().hex[:8]}.tmp")
+            try:
+                if self.store is not None and self._clone_from_store(src, tmp, st):
+                    os.replace(tmp, dst)
+                    with self._lock:
+                        self.methods["reflink"] = self.methods.get("reflink", 0) + 1
+                    return st.st_size
+                tmp.unlink(missing_ok=True)
+                src_fd = os.open(src, os.O_RDONLY)
+                try:
+                    dst_fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+                    try:
+                        copied, method = self._copy_data(src_fd, dst_fd, st.st_size)
+                        if copied != st.st_size or os.fstat(dst_fd).st_size != st.st_size:
+                            raise OSError(errno.EIO, f"コピーしたサイズが一致しません ({copied} / {st.st_size})",
+                                          str(dst))
+                    finally:
+                        os.close(dst_fd)
+                finally:
+                    os.close(src_fd)
+                os.replace(tmp, dst)
+            except BaseException:
+                tmp.unlink(missing_ok=True)
+                raise
+        finally:
+            with self._lock:
+                self._active -= 1
+        with self._lock:
+            self.methods[method] = self.methods.get(method, 0) + 1
+        return copied
+
+    def _clone_from_store(self, src: Path, dst: Path, st: os.stat_result) -> bool:
+        # 移動元と同じ内容がストアにあれば、移動先をreflinkで作成
+        digest = ContentStore.hash_file(src)
+        return self.store.clone(digest, dst) and os.path.getsize(dst) == st.st_size
+
+    @staticmethod
+    def _apply_metadata(path: Path, st: os.stat_result) -> None:
+        os.chmod(path, st.st_mode & 0o7777)
+        os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+
+    def copy(self, pairs: List[tuple[Path, Path]]) -> Dict[Path, Optional[str]]:
+        # (移動元, 移動先)の組をコピーし、検証できた組の移動元を削除
+        # 戻り値: 移動元 -> エラー（成功した場合はNone）
+        start = time.perf_counter()
+        plans = {}
+        results: Dict[Path, Optional[str]] = {}
+        for src, dst in pairs:
+            dirs, files, links = [], [], []
+            try:
+                self._scan(src, dst, dirs, files, links)
+            except OSError as e:
+                results[src] = str(e)
+                continue
+            plans[src] = (dst, dirs, files, links)
+
+        # ディレクトリとシンボリックリンクを作成してから、ファイルを並列にコピー
+        # 要素ごとに、このコピーで新しく作成したパスを記録する
+        created: Dict[Path, List[Path]] = {src: [] for src in plans}
+        futures = {}
+        with ThreadPoolExecutor(max_workers=self.workers) as executor:
+            for src, (dst, dirs, files, links) in plans.items():
+                try:
+                    for _, dst_dir, _ in dirs:
+                        try:
+                            dst_dir.mkdir()
+                            created[src].append(dst_dir)
+                        except FileExistsError:
+                            if not dst_dir.is_dir() or dst_dir.is_symlink():
+                                raise
+                    for src_link, dst_link in links:
+                        existed = os.path.lexists(dst_link)
+                        if existed and not os.path.islink(dst_link):
+                            # 利用者のファイルやディレクトリをリンクで置き換えない（要素ごと失敗にして移動元を残す）
+                            raise OSError(errno.EEXIST, "既存のファイルをシンボリックリンクで置き換えません",
+                                          str(dst_link))
+                        if existed:
+                            if self.before_write is not None:
+                                self.before_write(dst_link)
+                            os.unlink(dst_link)
+                        os.symlink(os.readlink(src_link), dst_link)
+                        if not existed:
+                            created[src].append(dst_link)
+                    for _, dst_file, _ in files:
+                        if os.path.lexists(dst_file):
+                            if self.before_write is not None:
+                                self.before_write(dst_file)
+                        else:
+                            created[src].append(dst_file)
+                except OSError as e:
+                    results[src] = str(e)
+                    continue
+                for src_file, dst_file, st in files:
+                    futures[executor.submit(self._copy_file, src_file, dst_file, st)] = (src, st)
+
+            for future in as_completed(futures):
+                src, st = futures[future]
+                try:
+                    self.bytes += future.result()
+                    self.files += 1
+                except OSError as e:
+                    results.setdefault(src, str(e))
+
+            # メタデータをまとめて適用（ディレクトリは中身の作成が終わった後、深い順に）
+            for src, (dst, dirs, files, _) in plans.items():
+                if results.get(src):
+                    continue
+                try:
+                    for _, dst_file, st in files:
+                        self._apply_metadata(dst_file, st)
+                    for _, dst_dir, st in reversed(dirs):
+                        self._apply_metadata(dst_dir, st)
+                except OSError as e:
+                    results[src] = str(e)
+
+            # 検証できた組だけ移動元を削除（失敗した組は移動元を残し、作成したものだけを削除）
+            removals = {}
+            for src, (dst, dirs, _, _) in plans.items():
+                if results.get(src):
+                    self._remove_created(created[src])
+                    continue
+                results[src] = None
+                if dirs:
+                    removals[executor.submit(shutil.rmtree, src)] = src
+                else:
+                    removals[executor.submit(os.unlink, src)] = src
+            for future in as_completed(removals):
+                src = removals[future]
+                try:
+                    future.result()
+                except OSError as e:
+                    self.cleanup_errors.append(f"コピー後の移動元 {src} の削除に失敗: {e}")
+
+        self.seconds += time.perf_counter() - start
+        return results
+
+    def summary(self) -> str:
+        # コピーの件数・スループット・同時実行数の表示用文字列
+        rate = self.bytes / self.seconds if self.seconds > 0 else 0
+        methods = " / ".join(f"{name} {count}" for name, count in sorted(self.methods.items()))
+        return (f"{self.files} ファイル ({_format_bytes(self.bytes)}) を {self.seconds:.2f} 秒でコピーしました"
+                f"（{_format_bytes(int(rate))}/s, {self.workers} スレッド, 最大同時 {self.max_concurrency}"
+                f"{', ' + methods if methods else ''}）")
+
+
+class ContentStore:
+    # ファイル内容をハッシュで管理するローカルストア（移動したプロジェクト間の重複排除用）
+    # ファイルはFICLONE（reflink）で共有し、使えない場合は読み取り専用のファイルだけハードリンクで共有する
+    # ハードリンクで共有したblobは、権限を変えて書き換えられるとストアの内容も変わるため、使うたびに確かめる
+    # 各ワークスペースが参照する内容は roots/ に記録し、gc で参照されなくなった内容を削除する
+
+    FICLONE = 0x40049409  # ioctl(2): ファイルの内容をコピーオンライトで共有
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root or self.default_dir()
+        self.objects_dir = self.root / "objects"
+        self.roots_dir = self.root / "roots"
+        self.counts: Dict[str, int] = {}
+        self.bytes_shared = 0
+        # referencedで見つかった、ワークスペースがなくなった記録
+        self.stale_records: List[Path] = []
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def default_dir() -> Path:
+        # 環境変数PICO_STORE_DIR、なければ ~/.cache/pico_project_store
+        if os.environ.get("PICO_STORE_DIR"):
+            return Path(os.environ["PICO_STORE_DIR"])
+        cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache) / "pico_project_store"
+
+    @staticmethod
+    def hash_file(path: Path) -> str:
+        with open(path, 'rb') as f:
+            return hashlib.file_digest(f, "sha256").hexdigest()
+
+    def blob_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def has(self, digest: str) -> bool:
+        # 内容を信頼できるblobがあるか
+        # ハードリンクで共有中のblobは、書き込み可能になっていない・内容が変わっていないことを確かめてから使う
+        blob = self.blob_path(digest)
+        try:
+            st = os.stat(blob)
+            if st.st_nlink == 1:
+                return True
+            if not st.st_mode & 0o222 and self.hash_file(blob) == digest:
+                return True
+        except FileNotFoundError:
+            return False
+        # ストアからは外す（ワークスペースのファイルはそのまま残り、以降は共有しない）
+        blob.unlink(missing_ok=True)
+        self._count("corrupt")
+        return False
+
+    def usable_for(self, path: Path) -> bool:
+        # reflinkはストアとpathが同じファイルシステムにある場合だけ使える
+        self.objects_dir.mkdir(parents=True, exist_ok=True)
+        return _same_device(self.objects_dir, path)
+
+    def _count(self, method: str, size: int = 0) -> None:
+        with self._lock:
+            self.counts[method] = self.counts.get(method, 0) + 1
+            if method in ("reflink", "hardlink"):
+                self.bytes_shared += size
+
+    def _reflink(self, src: Path, dst: Path) -> bool:
+        # srcの内容をdst（新規作成）にreflinkする（未対応のファイルシステムではFalse）
+        import fcntl
+        try:
+            with open(src, 'rb') as s, open(dst, 'xb') as d:
+                fcntl.ioctl(d.fileno(), self.FICLONE, s.fileno())
+            return True
+        except OSError:
+            try:
+                os.unlink(dst)
+            except FileNotFoundError:
+                pass
+            return False
+
+    def _temp_path(self, near: Path) -> Path:
+        return near.with_name(f".{near.name}.{uuid.uuid4().hex[:8]}.tmp")
+
+    def clone(self, digest: str, dst: Path) -> bool:
+        # ストアの内容をdstにreflinkで作成（ParallelCopierから、バイトを書かずにファイルを作るために使う）
+        if not self.has(digest) or not self._reflink(self.blob_path(digest), dst):
+            return False
+        self._count("reflink", os.path.getsize(dst))
+        return True
+
+    def ingest(self, path: Path, digest: str, st: os.stat_result) -> bool:
+        # pathの内容をストアに追加（reflink、できなければ読み取り専用のファイルだけハードリンク）
+        # reflinkできないファイルシステムでは書き込み可能なファイルは共有できないため、コピーして容量を増やすことはしない
+        blob = self.blob_path(digest)
+        if self.has(digest):
+            return True
+        blob.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._temp_path(blob)
+        if self._reflink(path, tmp):
+            os.chmod(tmp, 0o444)
+        elif not st.st_mode & 0o222:
+            os.link(path, tmp)
+        else:
+            self._count("unshared")
+            return False
+        os.replace(tmp, blob)
+        self._count("stored")
+        return True
+
+    def materialize(self, path: Path, digest: str, st: os.stat_result) -> Optional[str]:
+        # pathをストアの内容を共有するファイルに置き換える（共有できなければNoneで、pathはそのまま）
+        blob = self.blob_path(digest)
+        tmp = self._temp_path(path)
+        if self._reflink(blob, tmp):
+            method = "reflink"
+            os.chmod(tmp, st.st_mode & 0o7777)
+            os.utime(tmp, ns=(st.st_atime_ns, st.st_mtime_ns))
+        elif not st.st_mode & 0o222 and (os.stat(blob).st_mode & 0o7777) == (st.st_mode & 0o7777):
+            # ハードリンクは内容と属性を共有するため、書き込めないファイルに限る
+            if os.path.samefile(blob, path):
+                return "hardlink"
+            method = "hardlink"
+            os.link(blob, tmp)
+        else:
+            self._count("unshared")
+            return None
+        os.replace(tmp, path)
+        self._count(method, st.st_size)
+        return method
+
+    def _root_record(self, workspace: Path) -> Path:
+        key = hashlib.sha256(os.fsencode(workspace.absolute())).hexdigest()[:16]
+        return self.roots_dir / f"{key}.json"
+
+    def register(self, workspace: Path, files: Dict[str, tuple[str, int, int]]) -> None:
+        # workspaceが参照する内容を記録（相対パス -> (ハッシュ, サイズ, 更新日時)）
+        record = self._root_record(workspace)
+        entries: Dict[str, Any] = {}
+        try:
+            with open(record, 'r', encoding='utf-8') as f:
+                entries = json.load(f).get("files", {})
+        except (OSError, ValueError):
+            pass
+        entries.update({relative: list(value) for relative, value in files.items()})
+        record.parent.mkdir(parents=True, exist_ok=True)
+        tmp = self._temp_path(record)
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"workspace": str(workspace.absolute()), "files": entries}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp, record)
+
+    def referenced(self, dry_run: bool = False) -> set:
+        # 現在も参照されている内容のハッシュ（記録したファイルがサイズ・更新日時とも変わっていないもの）
+        # ワークスペースがなくなった記録はstale_recordsに集め、dry_runでなければ削除する
+        digests = set()
+        self.stale_records = []
+        if not self.roots_dir.is_dir():
+            return digests
+        for record in self.roots_dir.glob("*.json"):
+            try:
+                with open(record, 'r', encoding='utf-8') as f:
+                    data = json.load(f)
+            except (OSError, ValueError):
+                continue
+            workspace = Path(data.get("workspace", ""))
+            if not workspace.is_dir():
+                self.stale_records.append(record)
+                if not dry_run:
+                    record.unlink()
+                continue
+            for relative, (digest, size, mtime_ns) in data.get("files", {}).items():
+                try:
+                    st = os.stat(workspace / relative)
+                except OSError:
+                    continue
+                if st.st_size == size and st.st_mtime_ns == mtime_ns:
+                    digests.add(digest)
+        return digests
+
+    def gc(self, dry_run: bool = False) -> tuple[int, int]:
+        # 参照されなくなった内容を削除（戻り値: 削除数, 解放したバイト数）
+        referenced = self.referenced(dry_run)
+        removed = 0
+        freed = 0
+        if not self.objects_dir.is_dir():
+            return removed, freed
+        for blob in self.objects_dir.glob("*/*"):
+            digest = blob.parent.name + blob.name
+            st = blob.stat()
+            # 作業中の一時ファイルと記録のある内容は残す
+            if blob.name.endswith(".tmp") and time.time() - st.st_mtime < 3600:
+                continue
+            if digest in referenced:
+                continue
+            if not dry_run:
+                blob.unlink()
+            removed += 1
+            if st.st_nlink == 1:
+                freed += st.st_size  # ハードリンクで共有中のblobは、ワークスペース側が残るため容量は空かない
+        return removed, freed
+
+
+class BuildTreeRelocationError(Exception):
+    # ビルドツリーを安全に書き換えられない場合のエラー（呼び出し側は削除にフォールバック）
+    pass
+
+
+_MASK64 = (1 << 64) - 1
+
+
+def _murmur_hash64a(data: bytes, seed: int = 0xDECAFBADDECAFBAD) -> int:
+    # ninja log v5/v6 がコマンドのハッシュに使うMurmurHash64A
+    m = 0xc6a4a7935bd1e995
+    r = 47
+    length = len(data)
+    h = seed ^ ((length * m) & _MASK64)
+    end = length - (length & 7)
+    for i in range(0, end, 8):
+        k = int.from_bytes(data[i:i + 8], 'little')
+        k = (k * m) & _MASK64
+        k ^= k >> r
+        k = (k * m) & _MASK64
+        h ^= k
+        h = (h * m) & _MASK64
+    if length & 7:
+        h ^= int.from_bytes(data[end:], 'little')
+        h = (h * m) & _MASK64
+    h ^= h >> r
+    h = (h * m) & _MASK64
+    h ^= h >> r
+    return h
+
+
+_RAPID_SECRET = (0x2d358dccaa6c78a5, 0x8bb84b93962eacc9, 0x4b33a62ed433d4a3)
+
+
+def _rapid_mum(a: int, b: int) -> tuple[int, int]:
+    r = a * b
+    return r & _MASK64, r >> 64
+
+
+def _rapid_mix(a: int, b: int) -> int:
+    lo, hi = _rapid_mum(a, b)
+    return lo ^ hi
+
+
+def _rapidhash(data: bytes, seed: int = 0xbdd89aa982704029) -> int:
+    # ninja log v7 がコマンドのハッシュに使うrapidhash
+    secret = _RAPID_SECRET
+    length = len(data)
+
+    def read64(pos: int) -> int:
+        return int.from_bytes(data[pos:pos + 8], 'little')
+
+    def read32(pos: int) -> int:
+        return int.from_bytes(data[pos:pos + 4], 'little')
+
+    seed ^= _rapid_mix(seed ^ secret[0], secret[1]) ^ length
+    if length <= 16:
+        if length >= 4:
+            last = length - 4
+            a = (read32(0) << 32) | read32(last)
+            delta = (length & 24) >> (length >> 3)
+            b = (read32(delta) << 32) | read32(last - delta)
+        elif length > 0:
+            a = (data[0] << 56) | (data[length >> 1] << 32) | data[length - 1]
+            b = 0
+        else:
+            a = b = 0
+    else:
+        p = 0
+        i = length
+        if i > 48:
+            see1 = see2 = seed
+            while i >= 96:
+                seed = _rapid_mix(read64(p) ^ secret[0], read64(p + 8) ^ seed)
+                see1 = _rapid_mix(read64(p + 16) ^ secret[1], read64(p + 24) ^ see1)
+                see2 = _rapid_mix(read64(p + 32) ^ secret[2], read64(p + 40) ^ see2)
+                seed = _rapid_mix(read64(p + 48) ^ secret[0], read64(p + 56) ^ seed)
+                see1 = _rapid_mix(read64(p + 64) ^ secret[1], read64(p + 72) ^ see1)
+                see2 = _rapid_mix(read64(p + 80) ^ secret[2], read64(p + 88) ^ see2)
+                p += 96
+                i -= 96
+            if i >= 48:
+                seed = _rapid_mix(read64(p) ^ secret[0], read64(p + 8) ^ seed)
+                see1 = _rapid_mix(read64(p + 16) ^ secret[1], read64(p + 24) ^ see1)
+                see2 = _rapid_mix(read64(p + 32) ^ secret[2], read64(p + 40) ^ see2)
+                p += 48
+                i -= 48
+            seed ^= see1 ^ see2
+        if i > 16:
+            seed = _rapid_mix(read64(p) ^ secret[2], read64(p + 8) ^ seed ^ secret[1])
+            if i > 32:
+                seed = _rapid_mix(read64(p + 16) ^ secret[2], read64(p + 24) ^ seed)
+        a = read64(p + i - 16)
+        b = read64(p + i - 8)
+    a ^= secret[1]
+    b ^= seed
+    a, b = _rapid_mum(a, b)
+    return _rapid_mix(a ^ secret[0] ^ length, b ^ secret[1])
+
+
+# ninja logのバージョンとコマンドハッシュ関数の対応
+NINJA_LOG_HASHES = {
+    5: _murmur_hash64a,
+    6: _murmur_hash64a,
+    7: _rapidhash,
+}
+
+
+def _ninja_shell_escape(path: str) -> str:
+    # ninjaが$in/$outを展開する際のシェルエスケープ
+    if re.fullmatch(r'[A-Za-z0-9_+\-./]*', path):
+        return path
+    return "'" + path.replace("'", "'\\''") + "'"
+
+
+def _ninja_canonicalize(path: str) -> str:
+    # ninjaのCanonicalizePath相当（./ と ../ を畳み込む）
+    absolute = path.startswith('/')
+    parts: List[str] = []
+    for part in path.split('/'):
+        if part in ('', '.'):
+            continue
+        if part == '..' and parts and parts[-1] != '..':
+            parts.pop()
+            continue
+        parts.append(part)
+    result = '/'.join(parts)
+    return '/' + result if absolute else (result or '.')
+
+
+class NinjaManifest:
+    # build.ninjaを最小限に解釈し、各出力のコマンド文字列を評価するクラス
+    # (.ninja_log のコマンドハッシュを検証・再計算するために使う)
+
+    _VAR_CHARS = re.compile(r'[A-Za-z0-9_-]+')
+
+    def __init__(self, build_dir: Path):
+        self.build_dir = build_dir
+        self.rules: Dict[str, Dict[str, list]] = {"phony": {}}
+        self.commands: Dict[str, str] = {}
+
+    @staticmethod
+    def _logical_lines(text: str):
+        # $による行継続を結合した論理行を返す
+        pending = None
+        for raw in text.replace('\r\n', '\n').split('\n'):
+            if pending is not None:
+                raw = pending + raw.lstrip(' ')
+            trailing = len(raw) - len(raw.rstrip('$'))
+            if trailing % 2 == 1:
+                pending = raw[:-1]
+                continue
+            pending = None
+            yield raw
+        if pending is not None:
+            yield pending
+
+    def _parse_eval(self, text: str, pos: int, path: bool) -> tuple[list, int]:
+        # ninjaの評価文字列を(変数参照か, 文字列)の列に分解
+        parts: list = []
+        literal = []
+        while pos < len(text):
+            ch = text[pos]
+            if path and ch in ' :|':
+                break
+            if ch != '$':
+                literal.append(ch)
+                pos += 1
+                continue
+            pos += 1
+            if pos >= len(text):
+                break
+            ch = text[pos]
+            if ch in '$ :':
+                literal.append(ch)
+                pos += 1
+            elif ch == '{':
+                close = text.index('}', pos)
+                if literal:
+                    parts.append((False, ''.join(literal)))
+                    literal = []
+                parts.append((True, text[pos + 1:close]))
+                pos = close + 1
+            else:
+                match = self._VAR_CHARS.match(text, pos)
+                if not match:
+                    raise BuildTreeRelocationError(f"build.ninjaの構文を解釈できません: {text[:60]}")
+                if literal:
+                    parts.append((False, ''.join(literal)))
+                    literal = []
+                parts.append((True, match.group()))
+                pos = match.end()
+        if literal:
+            parts.append((False, ''.join(literal)))
+        return parts, pos
+
+    def _parse_paths(self, text: str, pos: int) -> tuple[List[list], int]:
+        # 空白区切りのパス列を、区切り記号(: や |)の手前まで読む
+        paths = []
+        while True:
+            while pos < len(text) and text[pos] == ' ':
+                pos += 1
+            if pos >= len(text) or text[pos] in ':|':
+                return paths, pos
+            parts, pos = self._parse_eval(text, pos, path=True)
+            paths.append(parts)
+
+    @staticmethod
+    def _evaluate(parts: list, lookup) -> str:
+        return ''.join(lookup(value) if is_var else value for is_var, value in parts)
+
+    def load(self, manifest: Path, scope: Optional[Dict[str, str]] = None) -> None:
+        # マニフェストを読み込み、各出力に対するコマンドを評価して記録
+        scope = {} if scope is None else scope
+        text = manifest.read_text(encoding='utf-8')
+        lines = list(self._logical_lines(text))
+        index = 0
+
+        def read_bindings() -> Dict[str, list]:
+            nonlocal index
+            bindings = {}
+            while index < len(lines) and lines[index].startswith((' ', '\t')):
+                # 値の末尾の空白はninjaでも値の一部として残る
+                line = lines[index].lstrip()
+                index += 1
+                if not line.strip() or line.startswith('#'):
+                    continue
+                key, _, value = line.partition('=')
+                bindings[key.strip()] = self._parse_eval(value.lstrip(' '), 0, path=False)[0]
+            return bindings
+
+        while index < len(lines):
+            line = lines[index]
+            index += 1
+            stripped = line.strip()
+            if not stripped or stripped.startswith('#'):
+                continue
+            keyword = stripped.split(' ', 1)[0]
+
+            if keyword == 'rule':
+                self.rules[stripped.split(None, 1)[1].strip()] = read_bindings()
+            elif keyword == 'build':
+                self._load_edge(stripped[len('build'):], read_bindings(), scope)
+            elif keyword in ('include', 'subninja'):
+                target = self._evaluate(self._parse_eval(stripped.split(None, 1)[1], 0, path=False)[0],
+                                        lambda name: scope.get(name, ''))
+                child_scope = scope if keyword == 'include' else dict(scope)
+                self.load(self.build_dir / target, child_scope)
+            elif keyword in ('pool', 'default'):
+                read_bindings()
+            elif '=' in stripped:
+                key, _, value = line.lstrip().partition('=')
+                parts = self._parse_eval(value.lstrip(' '), 0, path=False)[0]
+                scope[key.strip()] = self._evaluate(parts, lambda name: scope.get(name, ''))
+            else:
+                raise BuildTreeRelocationError(f"build.ninjaの構文を解釈できません: {stripped[:60]}")
+
+    def _load_edge(self, text: str, raw_bindings: Dict[str, list], scope: Dict[str, str]) -> None:
+        # build行1つを解釈し、出力ごとのコマンドを評価
+        outputs, pos = self._parse_paths(text, 0)
+        implicit_outputs: List[list] = []
+        if text.startswith('|', pos) and not text.startswith('||', pos):
+            implicit_outputs, pos = self._parse_paths(text, pos + 1)
+        if not text.startswith(':', pos):
+            raise BuildTreeRelocationError(f"build行を解釈できません: {text[:60]}")
+        rule_match = re.match(r'\s*([A-Za-z0-9_.-]+)', text[pos + 1:])
+        if not rule_match:
+            raise BuildTreeRelocationError(f"build行のルールを解釈できません: {text[:60]}")
+        rule_name = rule_match.group(1)
+        pos = pos + 1 + rule_match.end()
+        inputs, pos = self._parse_paths(text, pos)
+
+        if rule_name == 'phony':
+            return
+        rule = self.rules.get(rule_name)
+        if rule is None:
+            raise BuildTreeRelocationError(f"未定義のルールです: {rule_name}")
+
+        # 辺の変数はファイルスコープで即時評価される
+        bindings = {key: self._evaluate(parts, lambda name: scope.get(name, ''))
+                    for key, parts in raw_bindings.items()}
+
+        def path_lookup(name: str) -> str:
+            return bindings[name] if name in bindings else scope.get(name, '')
+
+        out_paths = [_ninja_canonicalize(self._evaluate(p, path_lookup)) for p in outputs]
+        implicit_out_paths = [_ninja_canonicalize(self._evaluate(p, path_lookup)) for p in implicit_outputs]
+        in_paths = [_ninja_canonicalize(self._evaluate(p, path_lookup)) for p in inputs]
+
+        def lookup(name: str, depth: int = 0) -> str:
+            if depth > 32:
+                raise BuildTreeRelocationError(f"変数 {name} の展開が循環しています")
+            if name == 'in':
+                return ' '.join(_ninja_shell_escape(p) for p in in_paths)
+            if name == 'in_newline':
+                return '\n'.join(_ninja_shell_escape(p) for p in in_paths)
+            if name == 'out':
+                return ' '.join(_ninja_shell_escape(p) for p in out_paths)
+            if name in bindings:
+                return bindings[name]
+            if name in rule:
+                return self._evaluate(rule[name], lambda inner: lookup(inner, depth + 1))
+            return scope.get(name, '')
+
+        command = lookup('command')
+        rspfile_content = lookup('rspfile_content')
+        if rspfile_content:
+            command += ";rspfile=" + rspfile_content
+        for out_path in out_paths + implicit_out_paths:
+            self.commands[out_path] = command
+
+
+class BuildTreeRelocator:
+    # 移動元のCMake/Ninjaビルドツリーを、移動先のパスと新しいプロジェクト名に合わせて書き換えるクラス
+    # 書き換えは移動前（ビルドツリーがまだ移動元にある間）に行い、失敗時は呼び出し側がツリーを削除する
+
+    # 書き換え対象とするテキストファイルの拡張子/ファイル名
+    TEXT_SUFFIXES = {".txt", ".ninja", ".json", ".d", ".cmake", ".make", ".rsp", ".includecache"}
+    TEXT_NAMES = {"CMakeCache.txt", "build.ninja", "compile_commands.json", "Makefile"}
+    # 独自形式で書き換えるninjaのログ
+    NINJA_LOG = ".ninja_log"
+    NINJA_DEPS = ".ninja_deps"
+
+    def __init__(self, build_dir: Path, old_src: Path, new_src: Path, old_name: str, new_name: str):
+        self.build_dir = build_dir
+        self.old_src = old_src
+        self.new_src = new_src
+        self.old_name = old_name
+        self.new_name = new_name
+        self.files_rewritten = 0
+        self.paths_renamed = 0
+        self.outputs_reused = 0
+        self.outputs_total = 0
+        self._old_prefix = ""
+        self._new_prefix = ""
+        self._path_re: Optional[re.Pattern] = None
+        self._name_re = re.compile(rf'\b{re.escape(old_name)}\b')
+        self._object_dir_re = re.compile(rf'CMakeFiles/{re.escape(old_name)}\.dir\b')
+
+    def _read_cache(self) -> Dict[str, str]:
+        # CMakeCache.txtを KEY -> VALUE の辞書として読む
+        cache_file = self.build_dir / "CMakeCache.txt"
+        if not cache_file.is_file():
+            raise BuildTreeRelocationError("CMakeCache.txt がありません")
+        entries = {}
+        with open(cache_file, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.rstrip('\n')
+                if not line or line.startswith(('#', '//')):
+                    continue
+                key, sep, value = line.partition('=')
+                if sep:
+                    entries[key.split(':', 1)[0]] = value
+        return entries
+
+    def _check_cache(self) -> None:
+        # キャッシュがこの移動元ディレクトリで構成されたNinjaビルドであることを確認
+        cache = self._read_cache()
+        home = cache.get("CMAKE_HOME_DIRECTORY", "")
+        candidates = [(str(self.old_src), str(self.new_src)),
+                      (os.path.realpath(self.old_src), os.path.realpath(self.new_src))]
+        for old_prefix, new_prefix in candidates:
+            if home == old_prefix:
+                self._old_prefix, self._new_prefix = old_prefix, new_prefix
+                break
+        else:
+            raise BuildTreeRelocationError(f"ビルドツリーは別のソース({home})で構成されています")
+
+        if cache.get("CMAKE_CACHEFILE_DIR") != f"{self._old_prefix}/{self.build_dir.name}":
+            raise BuildTreeRelocationError("ビルドディレクトリがソースディレクトリ直下にありません")
+        if "Ninja" not in cache.get("CMAKE_GENERATOR", ""):
+            raise BuildTreeRelocationError("Ninja以外のジェネレータには対応していません")
+        if self._name_re.search(self._new_prefix):
+            raise BuildTreeRelocationError(
+                f"移動先のパスに旧プロジェクト名 {self.old_name} が含まれています")
+        self._path_re = re.compile(rf'{re.escape(self._old_prefix)}(?=/|$|[^\w.-])')
+
+    def rewrite_path(self, text: str) -> str:
+        # 移動元パスを移動先パスに置換
+        return self._path_re.sub(lambda _: self._new_prefix, text)
+
+    def rewrite_full(self, text: str) -> str:
+        # パスとプロジェクト名の両方を置換（CMakeが再生成する内容と同じになる）
+        return self._name_re.sub(lambda _: self.new_name, self.rewrite_path(text))
+
+    def rewrite_neutral(self, text: str) -> str:
+        # 意味を変えない置換のみ（パスとオブジェクトディレクトリ名）
+        return self._object_dir_re.sub(lambda _: f"CMakeFiles/{self.new_name}.dir",
+                                       self.rewrite_path(text))
+
+    def _iter_text_files(self) -> List[Path]:
+        # 書き換え対象のテキストファイルを列挙（NULバイトを含むものはバイナリとして除外）
+        files = []
+        for dirpath, dirnames, filenames in os.walk(self.build_dir):
+            for filename in filenames:
+                if filename in (self.NINJA_LOG, self.NINJA_DEPS):
+                    continue
+                if filename not in self.TEXT_NAMES and Path(filename).suffix not in self.TEXT_SUFFIXES:
+                    continue
+                path = Path(dirpath) / filename
+                with open(path, 'rb') as f:
+                    if b'\0' in f.read(8192):
+                        continue
+                files.append(path)
+        return files
+
+    def _rewrite_ninja_log(self, manifest: NinjaManifest) -> Optional[bytes]:
+        # .ninja_log の出力パスを書き換え、意味の変わらないコマンドはハッシュを再計算する
+        log_file = self.build_dir / self.NINJA_LOG
+        if not log_file.is_file():
+            return None
+        lines = log_file.read_text(encoding='utf-8').splitlines()
+        if not lines:
+            return None
+        version_match = re.fullmatch(r'# ninja log v(\d+)', lines[0])
+        if not version_match:
+            raise BuildTreeRelocationError(".ninja_log の形式を認識できません")
+        hash_func = NINJA_LOG_HASHES.get(int(version_match.group(1)))
+
+        hash_cache: Dict[str, Optional[str]] = {}
+        output = [lines[0]]
+        for line in lines[1:]:
+            fields = line.split('\t')
+            if len(fields) != 5:
+                output.append(line)
+                continue
+            out_path, logged_hash = fields[3], fields[4]
+            new_hash = logged_hash
+            command = manifest.commands.get(out_path)
+            self.outputs_total += 1
+            if hash_func and command is not None:
+                if command not in hash_cache:
+                    hash_cache[command] = None
+                    # 変更前のコマンドでハッシュが一致し、名前の置換がパス以外に影響しない場合のみ再利用
+                    new_command = self.rewrite_full(command)
+                    if new_command == self.rewrite_neutral(command):
+                        hash_cache[command] = format(hash_func(new_command.encode('utf-8')), 'x')
+                if hash_cache[command] and format(hash_func(command.encode('utf-8')), 'x') == logged_hash:
+                    new_hash = hash_cache[command]
+                    self.outputs_reused += 1
+            fields[3] = self.rewrite_full(out_path)
+            fields[4] = new_hash
+            output.append('\t'.join(fields))
+        return ('\n'.join(output) + '\n').encode('utf-8')
+
+    def _rewrite_ninja_deps(self) -> Optional[bytes]:
+        # .ninja_deps のパスレコードを書き換える（依存レコードはそのまま）
+        deps_file = self.build_dir / self.NINJA_DEPS
+        if not deps_file.is_file():
+            return None
+        data = deps_file.read_bytes()
+        header = b"# ninjadeps\n"
+        if not data.startswith(header) or len(data) < len(header) + 4:
+            raise BuildTreeRelocationError(".ninja_deps の形式を認識できません")
+        version = int.from_bytes(data[len(header):len(header) + 4], 'little')
+        if version not in (3, 4):
+            raise BuildTreeRelocationError(f".ninja_deps のバージョン {version} には対応していません")
+
+        output = bytearray(data[:len(header) + 4])
+        pos = len(header) + 4
+        next_id = 0
+        seen = set()
+        while pos + 4 <= len(data):
+            size = int.from_bytes(data[pos:pos + 4], 'little')
+            is_deps = bool(size & 0x80000000)
+            size &= 0x7FFFFFFF
+            record = data[pos + 4:pos + 4 + size]
+            if len(record) != size:
+                break  # 書き込み途中で切れたレコードはninjaも無視する
+            pos += 4 + size
+            if is_deps:
+                output += data[pos - 4 - size:pos]
+                continue
+
+            checksum = int.from_bytes(record[-4:], 'little')
+            if checksum != (~next_id) & 0xFFFFFFFF:
+                raise BuildTreeRelocationError(".ninja_deps のチェックサムが一致しません")
+            path = record[:-4].rstrip(b'\0').decode('utf-8')
+            new_path = self.rewrite_full(path).encode('utf-8')
+            if new_path in seen:
+                raise BuildTreeRelocationError(f".ninja_deps のパスが重複します: {new_path!r}")
+            seen.add(new_path)
+            padding = (4 - len(new_path) % 4) % 4
+            body = new_path + b'\0' * padding + record[-4:]
+            output += len(body).to_bytes(4, 'little') + body
+            next_id += 1
+        return bytes(output)
+
+    def _rename_paths(self) -> None:
+        # 旧プロジェクト名を含むファイル/ディレクトリ名を新しい名前に変更（深い方から）
+        for dirpath, dirnames, filenames in os.walk(self.build_dir, topdown=False):
+            for name in dirnames + filenames:
+                if not self._name_re.search(name):
+                    continue
+                src = Path(dirpath) / name
+                _rename_noreplace(src, src.with_name(self._name_re.sub(self.new_name, name)))
+                self.paths_renamed += 1
+
+    def relocate(self) -> None:
+        # ビルドツリーを書き換える（検証と新しい内容の生成を先に済ませてから書き込む）
+        self._check_cache()
+
+        manifest = NinjaManifest(self.build_dir)
+        manifest.load(self.build_dir / "build.ninja")
+        new_log = self._rewrite_ninja_log(manifest)
+        new_deps = self._rewrite_ninja_deps()
+
+        rewrites = []
+        for path in self._iter_text_files():
+            content = path.read_text(encoding='utf-8')
+            updated = self.rewrite_full(content)
+            if updated != content:
+                rewrites.append((path, updated))
+
+        for path, updated in rewrites:
+            st = path.stat()
+            with open(path, 'w', encoding='utf-8') as f:
+                f.write(updated)
+            # ninjaの依存ファイルは更新日時を保ち、不要な再生成を避ける
+            if path.suffix == ".d":
+                os.utime(path, ns=(st.st_atime_ns, st.st_mtime_ns))
+            self.files_rewritten += 1
+        if new_log is not None:
+            (self.build_dir / self.NINJA_LOG).write_bytes(new_log)
+        if new_deps is not None:
+            (self.build_dir / self.NINJA_DEPS).write_bytes(new_deps)
+
+        self._rename_paths()
+
+
+class CMakeRenamer:
+    # CMakeファイルを字句解析し、コマンド引数中のターゲット参照だけを書き換えるクラス
+    # コメント・ブラケットコメントには触れず、引数の一部分として現れる無関係な文字列も置換しない
+
+    _IDENTIFIER = re.compile(r'[A-Za-z_][A-Za-z0-9_]*')
+    _BRACKET_OPEN = re.compile(r'\[(=*)\[')
+    # project()が定義する変数（旧名_SOURCE_DIR など）も合わせて置換する
+    _PROJECT_SUFFIXES = ("SOURCE_DIR", "BINARY_DIR", "IS_TOP_LEVEL", "DESCRIPTION",
+                         "HOMEPAGE_URL", "VERSION", "VERSION_MAJOR", "VERSION_MINOR",
+                         "VERSION_PATCH", "VERSION_TWEAK")
+
+    def __init__(self, renames: Dict[str, str], rename_files: bool = False):
+        # renames: 旧名 -> 新名
+        # rename_files: ファイル名も変更する場合はTrue（temp_project.c のような参照も置換する）
+        self.renames = renames
+        suffixes = "|".join(self._PROJECT_SUFFIXES)
+        names = "|".join(re.escape(name) for name in sorted(renames, key=len, reverse=True))
+        if rename_files:
+            self._reference = re.compile(rf'(?<![\w-])({names})(_(?:{suffixes}))?(?![\w-])')
+        else:
+            self._reference = re.compile(rf'(?<![\w./-])({names})(_(?:{suffixes}))?(?![\w.-])')
+
+    def may_match(self, text: str) -> bool:
+        # 置換対象の名前を含む可能性があるか（字句解析を省略するための事前判定）
+        return any(name in text for name in self.renames)
+
+    def _rename_argument(self, text: str, command: str, counts: Dict[str, int]) -> str:
+        # 1つの引数の中のターゲット参照を置換
+        if not self.may_match(text):
+            return text
+        updated, count = self._reference.subn(
+            lambda m: self.renames[m.group(1)] + (m.group(2) or ""), text)
+        if count:
+            counts[command] = counts.get(command, 0) + count
+        return updated
+
+    def _skip_bracket(self, text: str, pos: int) -> Optional[int]:
+        # posが [=[ の形のブラケット開始なら、対応する閉じ括弧の直後の位置を返す
+        match = self._BRACKET_OPEN.match(text, pos)
+        if not match:
+            return None
+        close = text.find(f"]{match.group(1)}]", match.end())
+        return len(text) if close < 0 else close + len(match.group(1)) + 2
+
+    def _skip_comment(self, text: str, pos: int) -> int:
+        # posの # から始まるコメントの終端位置を返す
+        end = self._skip_bracket(text, pos + 1)
+        if end is not None:
+            return end
+        newline = text.find('\n', pos)
+        return len(text) if newline < 0 else newline
+
+    def _rewrite_arguments(self, text: str, pos: int, command: str,
+                           out: List[str], counts: Dict[str, int]) -> int:
+        # コマンドの引数部分（開き括弧の直後から）を書き換え、閉じ括弧の直後の位置を返す
+        depth = 1
+        length = len(text)
+        while pos < length:
+            ch = text[pos]
+            if ch in ' \t\r\n':
+                start = pos
+                while pos < length and text[pos] in ' \t\r\n':
+                    pos += 1
+                out.append(text[start:pos])
+            elif ch == '#':
+                end = self._skip_comment(text, pos)
+                out.append(text[pos:end])
+                pos = end
+            elif ch == '(':
+                depth += 1
+                out.append(ch)
+                pos += 1
+            elif ch == ')':
+                depth -= 1
+                out.append(ch)
+                pos += 1
+                if depth == 0:
+                    return pos
+            elif ch == '"':
+                end = pos + 1
+                while end < length and text[end] != '"':
+                    end += 2 if text[end] == '\\' else 1
+                end = min(end, length)
+                out.append('"' + self._rename_argument(text[pos + 1:end], command, counts))
+                if end < length:
+                    out.append('"')
+                pos = end + 1
+            elif ch == '[' and self._BRACKET_OPEN.match(text, pos):
+                match = self._BRACKET_OPEN.match(text, pos)
+                end = self._skip_bracket(text, pos)
+                closing = len(match.group(1)) + 2
+                body_end = max(match.end(), end - closing)
+                out.append(match.group())
+                out.append(self._rename_argument(text[match.end():body_end], command, counts))
+                out.append(text[body_end:end])
+                pos = end
+            else:
+                start = pos
+                while pos < length and text[pos] not in ' \t\r\n()#"':
+                    pos += 2 if text[pos] == '\\' else 1
+                pos = min(pos, length)
+                out.append(self._rename_argument(text[start:pos], command, counts))
+        return pos
+
+    def rewrite(self, text: str) -> tuple[str, Dict[str, int]]:
+        # ファイル全体を1パスで走査し、(書き換え後の内容, コマンド別の置換数)を返す
+        out: List[str] = []
+        counts: Dict[str, int] = {}
+        pos = 0
+        length = len(text)
+        while pos < length:
+            ch = text[pos]
+            if ch == '#':
+                end = self._skip_comment(text, pos)
+                out.append(text[pos:end])
+                pos = end
+                continue
+            match = self._IDENTIFIER.match(text, pos) if (ch.isalpha() or ch == '_') else None
+            if match:
+                paren = match.end()
+                while paren < length and text[paren] in ' \t':
+                    paren += 1
+                if paren < length and text[paren] == '(':
+                    out.append(text[pos:paren + 1])
+                    pos = self._rewrite_arguments(text, paren + 1, match.group().lower(), out, counts)
+                    continue
+                out.append(match.group())
+                pos = match.end()
+                continue
+            out.append(ch)
+            pos += 1
+        return ''.join(out), counts
+
+
+class ProjectRenamer:
+    # 移動したツリーから旧名を1回の走査で探し、内容の置換とファイル/ディレクトリ名の変更を一括で適用するクラス
+    # 旧名の集合は接頭辞木に畳み込んだ1つの正規表現で照合するため、
+    # 走査コストは置換する名前の数によらずファイルのバイト数に比例する
+
+    SNIFF_SIZE = 8192
+    # 内容を書き換えないファイル（CMakeファイルはCMakeRenamerが構文を見て処理する）
+    SKIP_CONTENT_NAMES = {"CMakeLists.txt"}
+    SKIP_CONTENT_SUFFIXES = {".cmake"}
+    SKIP_DIRS = {".git", TRASH_DIR_NAME}
+
+    def __init__(self, renames: Dict[str, str], before_write=None, on_rename=None, on_warning=None):
+        # before_write(path): 内容を書き換える直前に呼ばれる
+        # on_rename(src, dst): パスを変更した直後に呼ばれる
+        # on_warning(message): 処理を続けられる失敗の通知（Noneの場合は標準出力に表示）
+        self.renames = renames
+        self.before_write = before_write
+        self.on_rename = on_rename
+        self.on_warning = on_warning or (lambda message: print(f"警告: {message}"))
+        self._byte_renames = {old.encode('utf-8'): new.encode('utf-8') for old, new in renames.items()}
+        trie = self._trie_pattern(sorted(self._byte_renames))
+        self._content_re = re.compile(rb'(?<![A-Za-z0-9_])' + trie + rb'(?![A-Za-z0-9_])')
+        names = "|".join(re.escape(name) for name in sorted(renames, key=len, reverse=True))
+        self._name_re = re.compile(rf'(?<![A-Za-z0-9_])(?:{names})(?![A-Za-z0-9_])')
+        # 走査結果のインデックス
+        self.content_hits: Dict[Path, List[tuple[int, int, bytes]]] = {}
+        self.path_renames: List[tuple[Path, Path]] = []
+        self.files_scanned = 0
+        self.bytes_scanned = 0
+        self.binary_skipped = 0
+
+    @staticmethod
+    def _trie_pattern(words: List[bytes]) -> bytes:
+        # 単語の集合を接頭辞木にまとめた正規表現を作る（分岐は共通接頭辞ごとに1回だけ）
+        trie: Dict[Any, Any] = {}
+        for word in words:
+            node = trie
+            for byte in word:
+                node = node.setdefault(byte, {})
+            node[None] = {}
+
+        def build(node: Dict[Any, Any]) -> bytes:
+            terminal = None in node
+            branches = [re.escape(bytes([byte])) + build(child)
+                        for byte, child in sorted((k, v) for k, v in node.items() if k is not None)]
+            if not branches:
+                return b''
+            if len(branches) == 1 and not terminal:
+                return branches[0]
+            group = b'(?:' + b'|'.join(branches) + b')'
+            return group + b'?' if terminal else group
+
+        return build(trie)
+
+    def _skip_content(self, path: Path) -> bool:
+        return path.name in self.SKIP_CONTENT_NAMES or path.suffix in self.SKIP_CONTENT_SUFFIXES
+
+    def _scan_file(self, path: Path) -> None:
+        # ファイルをmmapして照合し、ヒット位置をインデックスに記録
+        import mmap
+        with open(path, 'rb') as f:
+            size = os.fstat(f.fileno()).st_size
+            if size == 0:
+                return
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as data:
+                if b'\0' in data[:self.SNIFF_SIZE]:
+                    self.binary_skipped += 1
+                    return
+                self.files_scanned += 1
+                self.bytes_scanned += size
+                hits = [(m.start(), m.end(), self._byte_renames[m.group()])
+                        for m in self._content_re.finditer(data)]
+        if hits:
+            self.content_hits[path] = hits
+
+    def scan_entries(self, entries) -> None:
+        # 走査済みの(パス, 種類)の列から、内容のヒットと変更すべきパスを記録
+        for path, kind in entries:
+            self._visit_name(path)
+            if kind == "file":
+                self._visit_file(path)
+
+    def scan(self, roots: List[Path]) -> None:
+        # 指定したパス以下を1回だけ走査し、内容のヒットと変更すべきパスを記録
+        for root in roots:
+            if root.is_symlink():
+                continue
+            if root.is_file():
+                self._visit_file(root)
+            elif root.is_dir():
+                self._visit_dir(root)
+            self._visit_name(root)
+
+    def _visit_name(self, path: Path) -> None:
+        new_name = self._name_re.sub(lambda m: self.renames[m.group()], path.name)
+        if new_name != path.name:
+            self.path_renames.append((path, path.with_name(new_name)))
+
+    def _visit_file(self, path: Path) -> None:
+        if self._skip_content(path):
+            return
+        try:
+            self._scan_file(path)
+        except (OSError, ValueError) as e:
+            self.on_warning(f"{path} の走査に失敗: {e}")
+
+    def _visit_dir(self, root: Path) -> None:
+        for dirpath, dirnames, filenames in os.walk(root):
+            # ビルドツリー（CMakeCache.txtがあるディレクトリ）とVCSの管理領域は対象外
+            dirnames[:] = [d for d in dirnames
+                           if d not in self.SKIP_DIRS
+                           and not os.path.exists(os.path.join(dirpath, d, "CMakeCache.txt"))]
+            for name in dirnames:
+                self._visit_name(Path(dirpath) / name)
+            for name in filenames:
+                path = Path(dirpath) / name
+                self._visit_name(path)
+                if not path.is_symlink():
+                    self._visit_file(path)
+
+    def _apply_content(self, path: Path, hits: List[tuple[int, int, bytes]]) -> None:
+        # ヒット位置を使って置換後の内容を組み立て、一時ファイル経由で置き換える
+        data = path.read_bytes()
+        pieces = []
+        last = 0
+        for start, end, replacement in hits:
+            pieces.append(data[last:start])
+            pieces.append(replacement)
+            last = end
+        pieces.append(data[last:])
+        if self.before_write:
+            self.before_write(path)
+        tmp_path = path.with_name(f".{path.name}.rename-tmp")
+        with open(tmp_path, 'wb') as f:
+            f.write(b''.join(pieces))
+        shutil.copymode(path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def rename_content(self, data: bytes) -> bytes:
+        # メモリ上の内容に置換を適用（バイナリはそのまま）
+        if b'\0' in data[:self.SNIFF_SIZE]:
+            return data
+        return self._content_re.sub(lambda m: self._byte_renames[m.group()], data)
+
+    def rename_stream(self, reader, writer, chunk_size: int) -> int:
+        # readerから一定サイズずつ読みながら置換してwriterに書き出し、書き出したバイト数を返す
+        # 区切りをまたぐ名前を取りこぼさないよう、末尾の（最長の名前+1）バイトは次に読んだ分と続けて照合する
+        keep = max(len(old) for old in self._byte_renames) + 1
+        data = reader.read(chunk_size)
+        written = 0
+        if b'\0' in data[:self.SNIFF_SIZE]:
+            while data:
+                writer.write(data)
+                written += len(data)
+                data = reader.read(chunk_size)
+            return written
+        pos = 0
+        while True:
+            chunk = reader.read(chunk_size)
+            data += chunk
+            limit = len(data) if not chunk else len(data) - keep
+            pieces = []
+            last = pos
+            for m in self._content_re.finditer(data, pos):
+                if m.start() >= limit:
+                    break
+                pieces.append(data[last:m.start()])
+                pieces.append(self._byte_renames[m.group()])
+                last = m.end()
+            end = max(last, limit)
+            pieces.append(data[last:end])
+            out = b''.join(pieces)
+            writer.write(out)
+            written += len(out)
+            if not chunk:
+                return written
+            # 直前の1バイトは名前の境界の判定のために残す
+            if end > 0:
+                data, pos = data[end - 1:], 1
+
+    def rename_path(self, relative: str) -> str:
+        # 相対パスの各要素に名前の変更を適用したパス
+        return "/".join(self._name_re.sub(lambda m: self.renames[m.group()], part)
+                        for part in relative.split("/"))
+
+    def apply(self) -> tuple[int, int]:
+        # 内容の置換とパスの変更を一括で適用し、(置換箇所数, 変更したパス数)を返す
+        replaced = 0
+        for path, hits in sorted(self.content_hits.items()):
+            try:
+                self._apply_content(path, hits)
+                replaced += len(hits)
+            except OSError as e:
+                self.on_warning(f"{path} の書き換えに失敗: {e}")
+
+        renamed = 0
+        # 深い階層から変更し、親ディレクトリの変更で子のパスが無効にならないようにする
+        for src, dst in sorted(self.path_renames, key=lambda item: len(item[0].parts), reverse=True):
+            try:
+                _rename_noreplace(src, dst)
+                if self.on_rename:
+                    self.on_rename(src, dst)
+                renamed += 1
+            except OSError as e:
+                self.on_warning(f"{src.name} の名前変更に失敗: {e}")
+        return replaced, renamed
+
+
+class CompilerCache:
+    # 移動したプロジェクトにccacheを組み込み、ビルドのたびにSDKを含めて再コンパイルしないようにする
+    # キャッシュはワークスペース外のディレクトリに置き、CMakeLists.txtのproject()の前でコンパイラランチャーとして設定する
+    # CMakeLists.txtはコミットされるため、キャッシュの場所は書き込まず、構成時の$CCACHE_DIRから決める
+    # --ccache-dirで指定したディレクトリはコミットしない .pico_ccache.cmake に置き、$CCACHE_DIRより優先する
+    # CCACHE_BASEDIRでワークスペース配下のパスを相対化し、作業ディレクトリもキーに含めないため、
+    # 同じ名前のプロジェクトであれば、別の場所やビルドディレクトリを作り直した後のビルドでもヒットする
+
+    BEGIN_MARKER = "# >>> move_pico_project.py --ccache >>>"
+    END_MARKER = "# <<< move_pico_project.py --ccache <<<"
+    BASELINE_FILE = ".pico_ccache.json"
+    LOCAL_FILE = ".pico_ccache.cmake"
+    _DIR_PATTERN = re.compile(r'^set\(PICO_CCACHE_DIR "((?:[^"\\]|\\.)*)"\)', re.MULTILINE)
+
+    def __init__(self, cache_dir: Optional[Path] = None):
+        # cache_dirを指定した場合だけ .pico_ccache.cmake に書き出す
+        self.override_dir = Path(cache_dir).absolute() if cache_dir else None
+        self.cache_dir = self.override_dir or self.default_dir().absolute()
+
+    @staticmethod
+    def default_dir() -> Path:
+        # 環境変数CCACHE_DIR、なければccacheの既定と同じ ~/.cache/ccache
+        if os.environ.get("CCACHE_DIR"):
+            return Path(os.environ["CCACHE_DIR"])
+        cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache) / "ccache"
+
+    def block(self) -> str:
+        # CMakeLists.txtに挿入する設定（ccacheがなければ何もしない、利用者ごとのパスは含めない）
+        return "\n".join([
+            self.BEGIN_MARKER,
+            "# コンパイラキャッシュ（ワークスペースのパスに依存しないキーで、以前のビルド結果を再利用）",
+            "# キャッシュの場所は .pico_ccache.cmake（コミットしない）、$CCACHE_DIR、ccacheの既定の順",
+            "find_program(PICO_CCACHE_PROGRAM ccache)",
+            "if(PICO_CCACHE_PROGRAM)",
+            f"    include(${{CMAKE_CURRENT_LIST_DIR}}/{self.LOCAL_FILE} OPTIONAL)",
+            "    if(NOT PICO_CCACHE_DIR AND DEFINED ENV{CCACHE_DIR})",
+            '        set(PICO_CCACHE_DIR "$ENV{CCACHE_DIR}")',
+            "    endif()",
+            "    set(PICO_CCACHE_ENV",
+            '        "CCACHE_BASEDIR=${CMAKE_SOURCE_DIR}"',
+            "        CCACHE_NOHASHDIR=true",
+            "        CCACHE_COMPILERCHECK=content)",
+            "    if(PICO_CCACHE_DIR)",
+            '        list(APPEND PICO_CCACHE_ENV "CCACHE_DIR=${PICO_CCACHE_DIR}")',
+            "    endif()",
+            "    set(PICO_CCACHE_LAUNCHER ${CMAKE_COMMAND} -E env ${PICO_CCACHE_ENV} ${PICO_CCACHE_PROGRAM})",
+            "    set(CMAKE_C_COMPILER_LAUNCHER ${PICO_CCACHE_LAUNCHER})",
+            "    set(CMAKE_CXX_COMPILER_LAUNCHER ${PICO_CCACHE_LAUNCHER})",
+            "endif()",
+            self.END_MARKER,
+        ]) + "\n"
+
+    def write_local(self, root_dir: Path) -> None:
+        # --ccache-dirで指定したディレクトリを .pico_ccache.cmake に書き出す（指定がなければ削除）
+        path = root_dir / self.LOCAL_FILE
+        if self.override_dir is None:
+            path.unlink(missing_ok=True)
+            return
+        quoted = re.sub(r'([\\"$])', r'\\\1', self.override_dir.as_posix())
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write("# move_pico_project.py --ccache-dir で指定したキャッシュ（利用者ごとの設定のためコミットしない）\n")
+            f.write(f'set(PICO_CCACHE_DIR "{quoted}")\n')
+
+    @classmethod
+    def _find_block(cls, content: str) -> Optional[tuple[int, int]]:
+        start = content.find(cls.BEGIN_MARKER)
+        if start < 0:
+            return None
+        end = content.find(cls.END_MARKER, start)
+        if end < 0:
+            return None
+        end += len(cls.END_MARKER)
+        if content.startswith("\n", end):
+            end += 1
+        return start, end
+
+    def inject(self, content: str) -> Optional[str]:
+        # project()の前に設定を挿入（既にあれば置き換え、project()がなければNone）
+        found = self._find_block(content)
+        if found:
+            return content[:found[0]] + self.block() + content[found[1]:]
+        match = re.search(r'^[ \t]*project\s*\(', content, re.MULTILINE | re.IGNORECASE)
+        if not match:
+            return None
+        return content[:match.start()] + self.block() + content[match.start():]
+
+    @classmethod
+    def configured(cls, root_dir: Path) -> Optional["CompilerCache"]:
+        # CMakeLists.txtに挿入済みの設定と .pico_ccache.cmake から、使用しているキャッシュを取得
+        try:
+            content = (root_dir / "CMakeLists.txt").read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            return None
+        if not cls._find_block(content):
+            return None
+        try:
+            local = (root_dir / cls.LOCAL_FILE).read_text(encoding='utf-8')
+        except (OSError, UnicodeDecodeError):
+            return cls()
+        match = cls._DIR_PATTERN.search(local)
+        return cls(Path(re.sub(r'\\(.)', r'\1', match.group(1)))) if match else cls()
+
+    def stats(self) -> Optional[Dict[str, int]]:
+        # ccacheの統計カウンタ（ccacheがない・古い場合はNone）
+        program = shutil.which("ccache")
+        if program is None:
+            return None
+        env = dict(os.environ, CCACHE_DIR=str(self.cache_dir))
+        try:
+            result = subprocess.run([program, "--print-stats"], env=env, capture_output=True,
+                                    text=True, timeout=30)
+        except (OSError, subprocess.TimeoutExpired):
+            return None
+        if result.returncode != 0:
+            return None
+        counters = {}
+        for line in result.stdout.splitlines():
+            key, _, value = line.partition("\t")
+            if value.strip().isdigit():
+                counters[key] = int(value)
+        return counters
+
+    @staticmethod
+    def hit_rate(before: Dict[str, int], after: Dict[str, int]) -> tuple[int, int]:
+        # 2つの統計の間のヒット数とミス数
+        def delta(key: str) -> int:
+            return after.get(key, 0) - before.get(key, 0)
+        hits = delta("direct_cache_hit") + delta("preprocessed_cache_hit")
+        return hits, delta("cache_miss")
+
+    def record_baseline(self, root_dir: Path) -> bool:
+        # 移動時点の統計を記録（ccache-statsで移動後のビルドのヒット率を出すための基準）
+        counters = self.stats()
+        if counters is None:
+            return False
+        with open(root_dir / self.BASELINE_FILE, 'w', encoding='utf-8') as f:
+            json.dump({"cache_dir": str(self.cache_dir), "stats": counters,
+                       "recorded_at": datetime.now().isoformat()}, f, indent=2)
+            f.write('\n')
+        return True
+
+
+class ProjectRenderer:
+    # 生成されたプロジェクトのファイルを、移動処理と同じ規則で名前を置き換えながら書き出す（createとアーカイブの取り込みで共用）
+    # CMakeファイルはCMakeRenamer、その他はProjectRenamerで置換し、マージされる .gitignore と .vscode/extensions.json、
+    # VCS管理領域は移動処理と同じく内容を置き換えない
+
+    MERGED_FILES = (".gitignore", ".vscode/extensions.json")
+
+    def __init__(self, renames: Dict[str, str], rename_files: bool = True):
+        self.renames = renames
+        self.rename_files = rename_files
+        self.cmake_renamer = CMakeRenamer(renames, rename_files=rename_files)
+        self.renamer = ProjectRenamer(renames) if renames else None
+        # CMakeファイルで置換した箇所の数（0なら移動処理と同じく置換対象が見つからなかったと警告する）
+        self.cmake_changes = 0
+
+    def _in_skipped_dir(self, relative: str) -> bool:
+        return any(part in ProjectRenamer.SKIP_DIRS for part in relative.split("/")[:-1])
+
+    def target(self, relative: str) -> str:
+        # 書き出し先の相対パス（ファイル/ディレクトリ名の置換後）
+        if self.renamer is None or not self.rename_files or self._in_skipped_dir(relative):
+            return relative
+        return self.renamer.rename_path(relative)
+
+    @staticmethod
+    def is_cmake(relative: str) -> bool:
+        name = relative.rsplit("/", 1)[-1]
+        return name == "CMakeLists.txt" or name.endswith(".cmake")
+
+    def renames_content(self, relative: str) -> bool:
+        # 内容の置換が必要なファイルかどうか
+        if self.renamer is None or relative in self.MERGED_FILES or self._in_skipped_dir(relative):
+            return False
+        return self.is_cmake(relative) or self.rename_files
+
+    def render(self, relative: str, data: bytes) -> bytes:
+        # 1ファイルの内容に置換を適用
+        if not self.renames_content(relative):
+            return data
+        if self.is_cmake(relative):
+            text = data.decode('utf-8')
+            if self.cmake_renamer.may_match(text):
+                text, counts = self.cmake_renamer.rewrite(text)
+                self.cmake_changes += sum(counts.values())
+                return text.encode('utf-8')
+            return data
+        return self.renamer.rename_content(data)
+
+    def render_stream(self, relative: str, reader, writer, chunk_size: int) -> int:
+        # 1ファイルの内容を一定サイズずつ置換しながら書き出し、書き出したバイト数を返す
+        # CMakeファイルは構文単位で書き換えるため、内容をまとめて読んで置換する
+        if self.renames_content(relative) and self.is_cmake(relative):
+            data = self.render(relative, reader.read())
+            writer.write(data)
+            return len(data)
+        if self.renames_content(relative):
+            return self.renamer.rename_stream(reader, writer, chunk_size)
+        written = 0
+        while chunk := reader.read(chunk_size):
+            writer.write(chunk)
+            written += len(chunk)
+        return written
+
+
+class TemplateCache:
+    # 拡張機能が生成したプロジェクトを、SDKバージョン・ボード・オプションをキーにして保存するテンプレートキャッシュ
+    # 移動前のtemp_projectから取り込み（harvest）、createでは生成と移動を経ずに名前を置き換えながら1回だけ書き出す
+
+    METADATA_FILE = "template.json"
+    FILES_DIR = "files"
+    _SET_PATTERN = re.compile(r'^\s*set\(\s*(sdkVersion|toolchainVersion|picotoolVersion|PICO_BOARD)\s+([^\s)]+)',
+                              re.MULTILINE)
+    _PROJECT_PATTERN = re.compile(r'^\s*project\(\s*([A-Za-z0-9_.+-]+)([^)]*)\)', re.MULTILINE | re.IGNORECASE)
+
+    def __init__(self, root: Optional[Path] = None):
+        self.root = root or self.default_dir()
+
+    @staticmethod
+    def default_dir() -> Path:
+        # 環境変数PICO_TEMPLATE_DIR、なければ ~/.cache/pico_project_templates
+        if os.environ.get("PICO_TEMPLATE_DIR"):
+            return Path(os.environ["PICO_TEMPLATE_DIR"])
+        cache = os.environ.get("XDG_CACHE_HOME") or Path.home() / ".cache"
+        return Path(cache) / "pico_project_templates"
+
+    @classmethod
+    def describe(cls, cmake_text: str, name: str) -> Dict[str, Any]:
+        # 生成されたCMakeLists.txtから、テンプレートを選ぶためのSDKバージョン・ボード・オプションを取り出す
+        settings = dict(cls._SET_PATTERN.findall(cmake_text))
+        options: Dict[str, str] = {}
+        project = cls._PROJECT_PATTERN.search(cmake_text)
+        if project:
+            options["languages"] = " ".join(project.group(2).split()) or "C CXX"
+        for key in ("toolchainVersion", "picotoolVersion"):
+            if key in settings:
+                options[key] = settings[key]
+        target = re.escape(name)
+        for stdio in ("uart", "usb"):
+            match = re.search(rf'pico_enable_stdio_{stdio}\(\s*{target}\s+(\w+)\s*\)', cmake_text)
+            if match:
+                options[f"stdio_{stdio}"] = match.group(1)
+        libraries = set()
+        for match in re.finditer(rf'target_link_libraries\(\s*{target}\s+([^)]*)\)', cmake_text):
+            libraries.update(arg for arg in match.group(1).split()
+                             if arg not in ("PRIVATE", "PUBLIC", "INTERFACE") and not arg.startswith("#"))
+        options["libraries"] = " ".join(sorted(libraries))
+        return {"sdk_version": settings.get("sdkVersion", "unknown"),
+                "board": settings.get("PICO_BOARD", "pico"),
+                "options": options}
+
+    @staticmethod
+    def key(description: Dict[str, Any]) -> str:
+        data = json.dumps([description["sdk_version"], description["board"], description["options"]],
+                          sort_keys=True, ensure_ascii=False)
+        return hashlib.sha256(data.encode('utf-8')).hexdigest()[:16]
+
+    def harvest(self, project_dir: Path, name: Optional[str] = None) -> Dict[str, Any]:
+        # 移動前のプロジェクト（ビルドツリーとVCS管理領域を除く）をテンプレートとして保存し、メタデータを返す
+        # 同じキーのテンプレートは新しい内容で置き換える
+        name = name or project_dir.name
+        description = self.describe((project_dir / "CMakeLists.txt").read_text(encoding='utf-8'), name)
+        key = self.key(description)
+        self.root.mkdir(parents=True, exist_ok=True)
+        work = self.root / f".tmp-{uuid.uuid4().hex[:8]}"
+        files = []
+        try:
+            for path in _walk_project_files([project_dir]):
+                relative = path.relative_to(project_dir)
+                target = work / self.FILES_DIR / relative
+                target.parent.mkdir(parents=True, exist_ok=True)
+                shutil.copy2(path, target, follow_symlinks=False)
+                files.append(relative.as_posix())
+            metadata = {"key": key, "placeholder": name, **description, "files": sorted(files),
+                        "harvested_at": datetime.now().isoformat()}
+            with open(work / self.METADATA_FILE, 'w', encoding='utf-8') as f:
+                json.dump(metadata, f, ensure_ascii=False, indent=2)
+                f.write('\n')
+            # 置き換えは rename で行い、読み込み中のcreateが不完全なテンプレートを見ないようにする
+            target_dir = self.root / key
+            old = self.root / f".old-{uuid.uuid4().hex[:8]}"
+            if target_dir.exists():
+                os.rename(target_dir, old)
+            os.rename(work, target_dir)
+            shutil.rmtree(old, ignore_errors=True)
+        except BaseException:
+            shutil.rmtree(work, ignore_errors=True)
+            raise
+        return metadata
+
+    def templates(self) -> List[Dict[str, Any]]:
+        # 保存済みのテンプレートのメタデータ（新しい順）
+        found = []
+        if not self.root.is_dir():
+            return found
+        for metadata_path in self.root.glob(f"*/{self.METADATA_FILE}"):
+            try:
+                with open(metadata_path, 'r', encoding='utf-8') as f:
+                    found.append(json.load(f))
+            except (OSError, ValueError):
+                continue
+        return sorted(found, key=lambda m: m.get("harvested_at", ""), reverse=True)
+
+    def find(self, key: Optional[str] = None, sdk_version: Optional[str] = None, board: Optional[str] = None,
+             options: Optional[Dict[str, str]] = None) -> List[Dict[str, Any]]:
+        # 条件に合うテンプレート（keyは先頭一致、optionsは指定したものだけ比較）
+        matches = []
+        for metadata in self.templates():
+            if key and not metadata["key"].startswith(key):
+                continue
+            if sdk_version and metadata["sdk_version"] != sdk_version:
+                continue
+            if board and metadata["board"] != board:
+                continue
+            if any(metadata["options"].get(k) != v for k, v in (options or {}).items()):
+                continue
+            matches.append(metadata)
+        return matches
+
+    def select(self, key: Optional[str] = None, sdk_version: Optional[str] = None, board: Optional[str] = None,
+               options: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        # 条件に合うテンプレートを1つ選ぶ（ない・複数ある場合はTemplateNotFoundError）
+        matches = self.find(key, sdk_version, board, options)
+        if not matches:
+            raise TemplateNotFoundError(
+                f"条件に合うテンプレートが {self.root} にありません"
+                "（--harvest を指定して一度移動すると、そのプロジェクトがテンプレートとして保存されます）",
+                cache=self.root)
+        if len(matches) > 1:
+            raise TemplateNotFoundError(
+                f"条件に合うテンプレートが {len(matches)} 個あります。キーまたはオプションで絞り込んでください: "
+                + ", ".join(self.summary(m) for m in matches),
+                candidates=[m["key"] for m in matches])
+        return matches[0]
+
+    @staticmethod
+    def summary(metadata: Dict[str, Any]) -> str:
+        options = " ".join(f"{k}={v}" for k, v in sorted(metadata["options"].items()))
+        return f"{metadata['key']} (SDK {metadata['sdk_version']}, ボード {metadata['board']}, {options})"
+
+    def render(self, metadata: Dict[str, Any], dst_dir: Path, renames: Dict[str, str],
+               rename_files: bool = True) -> tuple[int, int]:
+        # テンプレートを名前を置き換えながらdst_dirに書き出し、(ファイル数, バイト数)を返す
+        files_dir = self.root / metadata["key"] / self.FILES_DIR
+        renderer = ProjectRenderer(renames, rename_files)
+        written = 0
+        size = 0
+        for relative in metadata["files"]:
+            src = files_dir / relative
+            dst = dst_dir / renderer.target(relative)
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            if src.is_symlink():
+                os.symlink(os.readlink(src), dst)
+                continue
+            data = renderer.render(relative, src.read_bytes())
+            with open(dst, 'wb') as f:
+                f.write(data)
+            shutil.copymode(src, dst)
+            written += 1
+            size += len(data)
+        return written, size
+
+
+# 取り込めるアーカイブの拡張子
+ARCHIVE_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz", ".tar.zst", ".tzst", ".zip")
+
+
+def is_archive(path: Path) -> bool:
+    # 取り込み元としてアーカイブが指定されたかどうか（拡張子で判定）
+    return path.name.lower().endswith(ARCHIVE_SUFFIXES) and path.is_file()
+
+
+@dataclass
+class ArchiveMember:
+    # アーカイブの1メンバー（kindは "file" / "dir" / "symlink" / "other"、readerはファイルの場合だけ有効）
+    name: str
+    kind: str
+    size: int
+    mode: int
+    mtime: float
+    linkname: str = ""
+    reader: Any = None
+
+
+class ArchiveSource:
+    # tar(.gz/.bz2/.xz/.zst)とzipのメンバーを、展開せずに先頭から1つずつ読み出す
+    # tarはストリームとして読むため、読まなかったメンバー（build/など）の内容はメモリにもディスクにも展開しない
+    # .zstは標準ライブラリで読めないため、zstdコマンドの出力をパイプで受け取る
+
+    def __init__(self, path: Path):
+        self.path = path
+
+    def members(self):
+        name = self.path.name.lower()
+        if name.endswith(".zip"):
+            yield from self._zip_members()
+        elif name.endswith((".tar.zst", ".tzst")):
+            yield from self._zstd_members()
+        else:
+            import tarfile
+            with tarfile.open(self.path, "r|*") as archive:
+                yield from self._tar_members(archive)
+
+    @staticmethod
+    def _tar_members(archive):
+        for info in archive:
+            if info.isfile():
+                kind = "file"
+            elif info.isdir():
+                kind = "dir"
+            elif info.issym():
+                kind = "symlink"
+            else:
+                kind = "other"
+            yield ArchiveMember(info.name, kind, info.size, info.mode, info.mtime, info.linkname,
+                                archive.extractfile(info) if kind == "file" else None)
+
+    def _zstd_members(self):
+        import tarfile
+        program = shutil.which("zstd")
+        if program is None:
+            raise PicoProjectError(f"{self.path.name} を読むには zstd コマンドが必要です", path=self.path)
+        process = subprocess.Popen([program, "-dc", str(self.path)], stdout=subprocess.PIPE)
+        try:
+            with tarfile.open(fileobj=process.stdout, mode="r|") as archive:
+                yield from self._tar_members(archive)
+        finally:
+            process.stdout.close()
+            if process.wait() != 0:
+                raise PicoProjectError(f"{self.path.name} の展開に失敗しました (zstd: {process.returncode})",
+                                       path=self.path)
+
+    def _zip_members(self):
+        import zipfile
+        with zipfile.ZipFile(self.path) as archive:
+            for info in archive.infolist():
+                mode = info.external_attr >> 16
+                if info.is_dir():
+                    kind = "dir"
+                elif mode and (mode & 0o170000) == 0o120000:
+                    kind = "symlink"
+                else:
+                    kind = "file"
+                mtime = datetime(*info.date_time).timestamp()
+                if kind == "symlink":
+                    yield ArchiveMember(info.filename, kind, info.file_size, mode & 0o7777, mtime,
+                                        archive.read(info).decode('utf-8'))
+                    continue
+                with archive.open(info) if kind == "file" else contextlib.nullcontext() as reader:
+                    yield ArchiveMember(info.filename, kind, info.file_size, (mode & 0o7777) or 0o644,
+                                        mtime, reader=reader)
+
+
+class ArchiveImporter:
+    # アーカイブのプロジェクトを、メンバーを1つずつ読みながら名前を置き換えてdst_dirに書き出す
+    # build/ 以下は読まずに読み飛ばす。STREAM_LIMITを超えるメンバーは一定サイズずつ置換しながら
+    # 書き出すため、メモリ使用量はアーカイブやメンバーのサイズによらない
+    # 取り除くディレクトリと旧プロジェクト名は、書き出しの前にメンバーの一覧を1回読み通して決める
+    # （tarは先頭から順にしか読めず、最初のメンバーやCMakeLists.txtの位置に依存しないようにするため）
+
+    STREAM_LIMIT = 16 * 1024 * 1024
+    CHUNK_SIZE = 1024 * 1024
+
+    def __init__(self, source: ArchiveSource, strip_components: Optional[int] = None, on_warning=None):
+        # strip_components: 先頭から取り除くパス要素の数（Noneの場合は、すべてのメンバーが
+        #                   1つのディレクトリの中にあればそのディレクトリを取り除く）
+        self.source = source
+        self.strip_components = strip_components
+        self.on_warning = on_warning or (lambda message: print(f"警告: {message}"))
+        self.prefix: Optional[str] = None
+        self.project: Optional[str] = None
+        self.renderer: Optional[ProjectRenderer] = None
+        self.files = 0
+        self.bytes = 0
+        self.skipped = 0
+
+    @staticmethod
+    def _parts(name: str) -> Optional[List[str]]:
+        # メンバー名のパス要素（ワークスペースの外を指すものはNone）
+        parts = [part for part in name.replace("\\", "/").split("/") if part not in ("", ".")]
+        if ".." in parts or name.startswith("/"):
+            return None
+        return parts
+
+    def scan(self) -> None:
+        # メンバーの一覧から取り除くディレクトリを決め、その直下のCMakeLists.txtのproject()から旧プロジェクト名を取得
+        # 内容はCMakeLists.txtだけを読む（tarでは残りのメンバーのヘッダーを読み飛ばすだけ）
+        depth = (self.strip_components or 1) + 1
+        first: Optional[List[str]] = None
+        tops = set()
+        nested = True
+        cmake_texts: Dict[str, bytes] = {}
+        for member in self.source.members():
+            parts = self._parts(member.name)
+            if not parts:
+                continue
+            first = first or parts
+            tops.add(parts[0])
+            if len(parts) == 1 and member.kind != "dir":
+                nested = False
+            if parts[-1] == "CMakeLists.txt" and len(parts) <= depth and member.kind == "file" \
+                    and member.size <= self.STREAM_LIMIT:
+                cmake_texts["/".join(parts)] = member.reader.read()
+        if first is None:
+            raise PicoProjectError(f"{self.source.path.name} にファイルがありません", path=self.source.path)
+        if self.strip_components is not None:
+            self.prefix = "/".join(first[:self.strip_components])
+        else:
+            self.prefix = tops.pop() if len(tops) == 1 and nested else ""
+        cmake_file = f"{self.prefix}/CMakeLists.txt" if self.prefix else "CMakeLists.txt"
+        text = cmake_texts.get(cmake_file, b"").decode('utf-8', errors='replace')
+        match = TemplateCache._PROJECT_PATTERN.search(text)
+        self.project = match.group(1) if match else None
+
+    def _relative(self, name: str) -> Optional[str]:
+        # メンバー名を取り除く部分を除いた相対パスに変換（ワークスペースの外を指すものはNone）
+        parts = self._parts(name)
+        if parts is None:
+            self.on_warning(f"ワークスペースの外を指すメンバー {name} は取り込みません")
+            return None
+        strip = len(self.prefix.split("/")) if self.prefix else 0
+        if self.prefix and "/".join(parts[:strip]) != self.prefix:
+            raise PicoProjectError(
+                f"{self.source.path.name} のメンバー {name} が {self.prefix}/ の外にあります"
+                "（--strip-components で取り除く階層を指定してください）", member=name)
+        relative = "/".join(parts[strip:])
+        return relative or None
+
+    def original_name(self) -> str:
+        # アーカイブ内のプロジェクト名（CMakeLists.txtのproject()、なければ取り除いたディレクトリ名かアーカイブ名）
+        if self.project:
+            return self.project
+        if self.prefix:
+            return self.prefix.rsplit("/", 1)[-1]
+        name = self.source.path.name
+        for suffix in ARCHIVE_SUFFIXES:
+            if name.lower().endswith(suffix):
+                return name[:-len(suffix)]
+        return name
+
+    def extract(self, dst_dir: Path, renderer_for) -> None:
+        # メンバーを名前を置き換えながらdst_dirに書き出す
+        # renderer_for(original_name): アーカイブ内のプロジェクト名から、置換に使うProjectRendererを作る
+        # シンボリックリンクは、他のメンバーの書き出し先を外へ向けられないよう、すべてのファイルを書き出した後に作る
+        self.scan()
+        renderer = self.renderer = renderer_for(self.original_name())
+        links: List[tuple[str, Path, str]] = []
+        for member in self.source.members():
+            relative = self._relative(member.name)
+            if relative is None:
+                continue
+            if relative == "build" or relative.startswith("build/"):
+                self.skipped += 1
+                continue
+            dst = dst_dir / renderer.target(relative)
+            if member.kind == "dir":
+                dst.mkdir(parents=True, exist_ok=True)
+                continue
+            if member.kind == "symlink":
+                links.append((relative, dst, member.linkname))
+                continue
+            if member.kind != "file":
+                self.on_warning(f"通常のファイルではない {relative} は取り込みません")
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            fd = os.open(dst, os.O_WRONLY | os.O_CREAT | os.O_TRUNC | os.O_NOFOLLOW, 0o644)
+            with open(fd, 'wb') as f:
+                if member.size <= self.STREAM_LIMIT:
+                    data = renderer.render(relative, member.reader.read())
+                    f.write(data)
+                    self.bytes += len(data)
+                else:
+                    self.bytes += renderer.render_stream(relative, member.reader, f, self.CHUNK_SIZE)
+            os.chmod(dst, member.mode & 0o7777 or 0o644)
+            os.utime(dst, (member.mtime, member.mtime))
+            self.files += 1
+        self._create_links(dst_dir, links)
+
+    def _create_links(self, dst_dir: Path, links: List[tuple[str, Path, str]]) -> None:
+        # シンボリックリンクを作り、作成済みのリンクをたどった実際のパスがdst_dirの外になるものは取り込まない
+        # 後から作ったリンクで先に作ったリンクの指す先が変わることがあるため、最後にすべてを確かめ直す
+        # （確認と削除は、作成時にリンクをたどって決めた実際の場所で行う）
+        root = os.path.realpath(dst_dir)
+
+        def inside(path: str) -> bool:
+            return os.path.commonpath([root, os.path.realpath(path)]) == root
+
+        def reject(relative: str) -> None:
+            self.on_warning(f"ワークスペースの外を指すシンボリックリンク {relative} は取り込みません")
+
+        created: List[tuple[str, str]] = []
+        for relative, dst, target in links:
+            if os.path.isabs(target) or not inside(dst.parent):
+                reject(relative)
+                continue
+            dst.parent.mkdir(parents=True, exist_ok=True)
+            parent = os.path.realpath(dst.parent)
+            if not inside(os.path.join(parent, target)):
+                reject(relative)
+                continue
+            path = os.path.join(parent, dst.name)
+            try:
+                os.symlink(target, path)
+            except FileExistsError:
+                self.on_warning(f"{relative} は既に存在するため、シンボリックリンクを作成しません")
+                continue
+            created.append((relative, path))
+        changed = True
+        while changed:
+            changed = False
+            for relative, path in list(created):
+                if not inside(path):
+                    reject(relative)
+                    os.unlink(path)
+                    created.remove((relative, path))
+                    changed = True
+
+
+# JSONC（コメント・末尾カンマ付きJSON）の字句
+_JSONC_TOKEN = re.compile(r'''
+    (?P<ws>[ \t\r\n]+)
+  | (?P<comment>//[^\n]*|/\*.*?\*/)
+  | (?P<string>"(?:[^"\\\n]|\\.)*")
+  | (?P<number>-?(?:0|[1-9][0-9]*)(?:\.[0-9]+)?(?:[eE][+-]?[0-9]+)?)
+  | (?P<literal>true|false|null)
+  | (?P<punct>[{}\[\]:,])
+''', re.VERBOSE | re.DOTALL)
+
+
+class JsoncError(ValueError):
+    # JSONCとして解釈できない
+    pass
+
+
+@dataclass
+class JsoncMember:
+    # オブジェクトのメンバー（配列の要素ではkeyがNone）と、その前後のコメント
+    key: Optional[str]
+    value: Any
+    comments: List[str]
+    trailing: Optional[str] = None
+
+
+class JsoncContainer:
+    # JSONCのオブジェクト/配列（コメントを保持したまま編集・出力できる）
+
+    def __init__(self, kind: str):
+        self.kind = kind  # "object" または "array"
+        self.members: List[JsoncMember] = []
+        # 閉じ括弧の直前にあるコメント
+        self.end_comments: List[str] = []
+
+    def to_python(self) -> Any:
+        if self.kind == "object":
+            return {m.key: _jsonc_value(m.value) for m in self.members}
+        return [_jsonc_value(m.value) for m in self.members]
+
+
+@dataclass
+class JsoncScalar:
+    # 文字列・数値・リテラル（元の表記を保持）
+    raw: str
+
+    def to_python(self) -> Any:
+        return json.loads(self.raw)
+
+
+@dataclass
+class JsoncDocument:
+    # 値の前後のコメントを含むJSONC文書全体
+    value: Any
+    comments: List[str]
+    end_comments: List[str]
+    indent: str = "\t"
+
+
+def _jsonc_value(node: Any) -> Any:
+    return node.to_python()
+
+
+def _jsonc_canonical(node: Any) -> str:
+    # 表記やコメントの違いを無視した比較用の文字列
+    return json.dumps(_jsonc_value(node), sort_keys=True, ensure_ascii=False)
+
+
+def parse_jsonc(text: str) -> JsoncDocument:
+    # JSONCを1パスで字句解析し、コメントを保持した木を作る
+    tokens = []  # (種類, 文字列, 直前に改行があるか)
+    newline = True
+    pos = 0
+    while pos < len(text):
+        m = _JSONC_TOKEN.match(text, pos)
+        if m is None:
+            line = text.count("\n", 0, pos) + 1
+            raise JsoncError(f"{line}行目: 解釈できない文字 {text[pos]!r}")
+        pos = m.end()
+        if m.lastgroup == "ws":
+            newline = newline or "\n" in m.group()
+            continue
+        tokens.append((m.lastgroup, m.group(), newline))
+        newline = False
+
+    position = 0
+
+    def peek() -> tuple[str, str, bool]:
+        return tokens[position] if position < len(tokens) else ("eof", "", True)
+
+    def take_comments() -> List[str]:
+        nonlocal position
+        comments = []
+        while peek()[0] == "comment":
+            comments.append(peek()[1])
+            position += 1
+        return comments
+
+    def expect(value: str) -> None:
+        nonlocal position
+        kind, token, _ = peek()
+        if token != value or kind != "punct":
+            raise JsoncError(f"'{value}' が必要な位置に {token or '終端'!r} があります")
+        position += 1
+
+    def parse_value() -> Any:
+        nonlocal position
+        kind, token, _ = peek()
+        if kind == "punct" and token in "{[":
+            return parse_container()
+        if kind in ("string", "number", "literal"):
+            position += 1
+            return JsoncScalar(token)
+        raise JsoncError(f"値が必要な位置に {token or '終端'!r} があります")
+
+    def parse_container() -> JsoncContainer:
+        nonlocal position
+        opening = peek()[1]
+        closing = "}" if opening == "{" else "]"
+        container = JsoncContainer("object" if opening == "{" else "array")
+        position += 1
+        pending: List[str] = []
+        last: Optional[JsoncMember] = None
+        while True:
+            kind, token, newline_before = peek()
+            if kind == "comment":
+                position += 1
+                if last is not None and last.trailing is None and not newline_before:
+                    last.trailing = token  # 値と同じ行のコメント
+                else:
+                    pending.append(token)
+                continue
+            if kind == "punct" and token == closing:
+                position += 1
+                container.end_comments = pending
+                return container
+            if kind == "punct" and token == ",":
+                position += 1
+                continue
+            if kind == "eof":
+                raise JsoncError(f"'{closing}' がありません")
+            key = None
+            if container.kind == "object":
+                if kind != "string":
+                    raise JsoncError(f"キーが必要な位置に {token!r} があります")
+                key = json.loads(token)
+                position += 1
+                pending += take_comments()
+                expect(":")
+                pending += take_comments()
+            last = JsoncMember(key, parse_value(), pending)
+            pending = []
+            container.members.append(last)
+
+    comments = take_comments()
+    if peek()[0] == "eof":
+        raise JsoncError("値がありません")
+    value = parse_value()
+    end_comments = take_comments()
+    if peek()[0] != "eof":
+        raise JsoncError(f"値の後に余分な {peek()[1]!r} があります")
+    indent = re.search(r"\n([ \t]+)\S", text)
+    return JsoncDocument(value, comments, end_comments, indent.group(1) if indent else "\t")
+
+
+def dump_jsonc(document: JsoncDocument) -> str:
+    # JSONC文書をコメント付きで出力（1行に1メンバー、インデントは元の文書に合わせる）
+    indent = document.indent
+
+    def dump(node: Any, level: int) -> str:
+        if isinstance(node, JsoncScalar):
+            return node.raw
+        opening, closing = ("{", "}") if node.kind == "object" else ("[", "]")
+        if not node.members and not node.end_comments:
+            return opening + closing
+        inner = indent * (level + 1)
+        lines = [opening]
+        for i, member in enumerate(node.members):
+            lines.extend(inner + comment for comment in member.comments)
+            line = inner
+            if member.key is not None:
+                line += json.dumps(member.key, ensure_ascii=False) + ": "
+            line += dump(member.value, level + 1)
+            if i < len(node.members) - 1:
+                line += ","
+            if member.trailing:
+                line += " " + member.trailing
+            lines.append(line)
+        lines.extend(inner + comment for comment in node.end_comments)
+        lines.append(indent * level + closing)
+        return "\n".join(lines)
+
+    parts = list(document.comments)
+    parts.append(dump(document.value, 0))
+    parts.extend(document.end_comments)
+    return "\n".join(parts) + "\n"
+
+
+class ConfigMergeStrategy(ABC):
+    # 設定ファイルのマージ方法（展開先の内容と移動元の内容からマージ結果を作る）
+
+    @abstractmethod
+    def merge(self, dst_text: Optional[str], src_text: str) -> str:
+        # dst_text: 展開先の内容（ファイルがなければNone）、src_text: 移動元の内容
+        ...
+
+
+class JsoncMerge(ConfigMergeStrategy):
+    # JSONCの深いマージ
+    # オブジェクトはキーごとに再帰的にマージし、値が衝突した場合は移動元を優先する
+    # keyedに指定したパスの配列は要素のキー（例: launch.jsonのname）で突き合わせてマージし、
+    # unionに指定したパスの配列は順序を保って重複を除いた和集合にする（それ以外の配列は移動元で置き換え）
+
+    def __init__(self, keyed: Optional[Dict[str, str]] = None, union: tuple = ()):
+        self.keyed = keyed or {}
+        self.union = set(union)
+
+    def merge(self, dst_text: Optional[str], src_text: str) -> str:
+        src = parse_jsonc(src_text)
+        if dst_text is None or not dst_text.strip():
+            return dump_jsonc(src)
+        dst = parse_jsonc(dst_text)
+        before = dump_jsonc(dst)
+        dst.value = self._merge(dst.value, src.value, "")
+        dst.comments += [c for c in src.comments if c not in dst.comments]
+        dst.end_comments += [c for c in src.end_comments if c not in dst.end_comments]
+        merged = dump_jsonc(dst)
+        # 移動元から何も加わらなければ、展開先の表記をそのまま保つ
+        return dst_text if merged == before else merged
+
+    @staticmethod
+    def _merge_comments(dst: JsoncMember, src: JsoncMember) -> None:
+        dst.comments += [c for c in src.comments if c not in dst.comments]
+        if dst.trailing is None:
+            dst.trailing = src.trailing
+
+    def _merge(self, dst: Any, src: Any, path: str) -> Any:
+        if not (isinstance(dst, JsoncContainer) and isinstance(src, JsoncContainer) and dst.kind == src.kind):
+            # 型が異なる値やスカラーは移動元を優先
+            return dst if isinstance(dst, JsoncScalar) and dst == src else src
+
+        if dst.kind == "object":
+            members = {m.key: m for m in dst.members}
+            for member in src.members:
+                current = members.get(member.key)
+                if current is None:
+                    dst.members.append(member)
+                    members[member.key] = member
+                    continue
+                child = f"{path}.{member.key}" if path else member.key
+                current.value = self._merge(current.value, member.value, child)
+                self._merge_comments(current, member)
+        elif path in self.keyed:
+            key = self.keyed[path]
+            items = {}
+            for item in dst.members:
+                item_key = self._item_key(item, key)
+                if item_key is not None:
+                    items[item_key] = item
+            for item in src.members:
+                item_key = self._item_key(item, key)
+                current = items.get(item_key) if item_key is not None else None
+                if current is None:
+                    dst.members.append(item)
+                    if item_key is not None:
+                        items[item_key] = item
+                    continue
+                current.value = self._merge(current.value, item.value, f"{path}[]")
+                self._merge_comments(current, item)
+        elif path in self.union:
+            seen = {_jsonc_canonical(item.value) for item in dst.members}
+            for item in src.members:
+                canonical = _jsonc_canonical(item.value)
+                if canonical not in seen:
+                    seen.add(canonical)
+                    dst.members.append(item)
+        else:
+            return src
+
+        dst.end_comments += [c for c in src.end_comments if c not in dst.end_comments]
+        return dst
+
+    @staticmethod
+    def _item_key(item: JsoncMember, key: str) -> Optional[str]:
+        # 配列要素（オブジェクト）の突き合わせに使うキーの値
+        if isinstance(item.value, JsoncContainer) and item.value.kind == "object":
+            for member in item.value.members:
+                if member.key == key and isinstance(member.value, JsoncScalar):
+                    return member.value.raw
+        return None
+
+
+class GitignoreMerge(ConfigMergeStrategy):
+    # .gitignoreのマージ（展開先の行・順序・コメントはそのまま残し、移動元にしかない行を順序どおり末尾に追加）
+    # 展開先で「!パターン」として除外を取り消しているパターンは、移動元にあっても追加しない
+
+    def merge(self, dst_text: Optional[str], src_text: str) -> str:
+        dst_lines = (dst_text or "").splitlines()
+        existing = {line.strip() for line in dst_lines if line.strip()}
+        negated = {line[1:] for line in existing if line.startswith("!")}
+
+        added: List[str] = []
+        comments: List[str] = []
+        for raw in src_text.splitlines():
+            line = raw.strip()
+            if not line or line in existing:
+                continue
+            if line.startswith("#"):
+                comments.append(line)  # 直後に追加する行がある場合だけ残す
+                continue
+            if not line.startswith("!") and line in negated:
+                continue
+            added.extend(comments)
+            comments = []
+            added.append(line)
+            existing.add(line)
+
+        if not added:
+            return dst_text if dst_text is not None else ""
+        while dst_lines and not dst_lines[-1].strip():
+            dst_lines.pop()
+        if dst_lines:
+            dst_lines.append("")
+        return "\n".join(dst_lines + added) + "\n"
+
+
+# ファイル名ごとのマージ方法（register_merge_strategyで追加・変更できる）
+MERGE_STRATEGIES: Dict[str, ConfigMergeStrategy] = {
+    ".gitignore": GitignoreMerge(),
+    "extensions.json": JsoncMerge(union=("recommendations", "unwantedRecommendations")),
+    "settings.json": JsoncMerge(),
+    "launch.json": JsoncMerge(keyed={"configurations": "name", "compounds": "name"}),
+    "tasks.json": JsoncMerge(keyed={"tasks": "label", "inputs": "id"}),
+    "c_cpp_properties.json": JsoncMerge(keyed={"configurations": "name"}),
+    "cmake-kits.json": JsoncMerge(keyed={"": "name"}),
+}
+
+
+def register_merge_strategy(file_name: str, strategy: ConfigMergeStrategy) -> None:
+    # file_nameという名前の設定ファイルのマージ方法を登録
+    MERGE_STRATEGIES[file_name] = strategy
+
+
+class MergeCache:
+    # 設定ファイルのマージの入力と出力の内容ハッシュ
+    # 入力（移動元と展開先）が前回と同じで、展開先が前回の出力のままならマージを省略する
+    FILE_NAME = ".pico_merge_cache.json"
+
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        self.path = root_dir / self.FILE_NAME
+        self.entries: Dict[str, Dict[str, str]] = {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                self.entries = json.load(f)
+        except (OSError, ValueError):
+            self.entries = {}
+
+    @staticmethod
+    def digest(data: Optional[bytes]) -> str:
+        return hashlib.sha256(data).hexdigest() if data is not None else "-"
+
+    def _key(self, dst: Path) -> str:
+        try:
+            return dst.relative_to(self.root_dir).as_posix()
+        except ValueError:
+            return str(dst)
+
+    def is_current(self, dst: Path, src_hash: str, dst_hash: str) -> bool:
+        entry = self.entries.get(self._key(dst))
+        return entry is not None and entry.get("src") == src_hash and entry.get("out") == dst_hash
+
+    def record(self, dst: Path, src_hash: str, dst_hash: str, out_hash: str) -> None:
+        self.entries[self._key(dst)] = {"src": src_hash, "dst": dst_hash, "out": out_hash}
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(self.entries, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp, self.path)
+
+
+def merge3(base: List[str], ours: List[str], theirs: List[str],
+           labels: tuple[str, str] = ("workspace", "project")) -> tuple[List[str], int]:
+    # 行単位の3方向マージ（戻り値: マージ結果の行, 競合の数）
+    # 両方が基準から変更していない範囲を同期点とし、その間の差分を片方だけの変更なら採用、両方なら競合とする
+    def matches(other: List[str]) -> List[tuple[int, int, int]]:
+        return difflib.SequenceMatcher(None, base, other, autojunk=False).get_matching_blocks()
+
+    ours_blocks, theirs_blocks = matches(ours), matches(theirs)
+    regions = []
+    i = j = 0
+    while i < len(ours_blocks) and j < len(theirs_blocks):
+        base_a, ours_start, length_a = ours_blocks[i]
+        base_b, theirs_start, length_b = theirs_blocks[j]
+        low = max(base_a, base_b)
+        high = min(base_a + length_a, base_b + length_b)
+        if low < high:
+            regions.append((low, high, ours_start + low - base_a, theirs_start + low - base_b))
+        if base_a + length_a < base_b + length_b:
+            i += 1
+        else:
+            j += 1
+    regions.append((len(base), len(base), len(ours), len(theirs)))
+
+    merged: List[str] = []
+    conflicts = 0
+    base_pos = ours_pos = theirs_pos = 0
+    for base_start, base_end, ours_start, theirs_start in regions:
+        base_chunk = base[base_pos:base_start]
+        ours_chunk = ours[ours_pos:ours_start]
+        theirs_chunk = theirs[theirs_pos:theirs_start]
+        if ours_chunk == theirs_chunk or theirs_chunk == base_chunk:
+            merged.extend(ours_chunk)
+        elif ours_chunk == base_chunk:
+            merged.extend(theirs_chunk)
+        else:
+            conflicts += 1
+            merged.append(f"<<<<<<< {labels[0]}\n")
+            merged.extend(line if line.endswith("\n") else line + "\n" for line in ours_chunk)
+            merged.append("=======\n")
+            merged.extend(line if line.endswith("\n") else line + "\n" for line in theirs_chunk)
+            merged.append(f">>>>>>> {labels[1]}\n")
+        length = base_end - base_start
+        merged.extend(base[base_start:base_end])
+        base_pos, ours_pos, theirs_pos = base_end, ours_start + length, theirs_start + length
+    return merged, conflicts
+
+
+class SyncManifest:
+    # --syncで比較に使うマニフェスト（.envと同じワークスペース直下の.pico_sync/に保存）
+    # 展開したファイルごとに、サイズ・更新日時・内容ハッシュと、3方向マージの基準にする生成時の内容を記録する
+    DIR_NAME = ".pico_sync"
+
+    def __init__(self, root_dir: Path):
+        self.root_dir = root_dir
+        self.dir = root_dir / self.DIR_NAME
+        self.path = self.dir / "manifest.json"
+        self.objects_dir = self.dir / "objects"
+        # 相対パス -> {"base", "hash", "size", "mtime_ns"}（利用者が削除したファイルは"deleted"）
+        self.files: Dict[str, Dict[str, Any]] = {}
+
+    def exists(self) -> bool:
+        return self.path.exists()
+
+    def load(self) -> None:
+        with open(self.path, 'r', encoding='utf-8') as f:
+            self.files = json.load(f).get("files", {})
+
+    def _object_path(self, digest: str) -> Path:
+        return self.objects_dir / digest[:2] / digest[2:]
+
+    def store_object(self, data: bytes) -> str:
+        # 内容をハッシュをキーにして保存し、ハッシュを返す
+        digest = MergeCache.digest(data)
+        path = self._object_path(digest)
+        if not path.exists():
+            path.parent.mkdir(parents=True, exist_ok=True)
+            tmp = path.with_name(path.name + ".tmp")
+            tmp.write_bytes(data)
+            os.replace(tmp, path)
+        return digest
+
+    def read_object(self, digest: Optional[str]) -> Optional[bytes]:
+        if digest is None:
+            return None
+        try:
+            return self._object_path(digest).read_bytes()
+        except OSError:
+            return None
+
+    def current_digest(self, relative: str) -> Optional[str]:
+        # ワークスペースのファイルの内容ハッシュ（サイズと更新日時が記録どおりならファイルを読まない）
+        path = self.root_dir / relative
+        try:
+            st = os.lstat(path)
+        except FileNotFoundError:
+            return None
+        entry = self.files.get(relative)
+        if entry and entry.get("size") == st.st_size and entry.get("mtime_ns") == st.st_mtime_ns:
+            return entry["hash"]
+        return MergeCache.digest(path.read_bytes())
+
+    def entry(self, relative: str, base: str) -> Dict[str, Any]:
+        # 現在のワークスペースの状態から記録を作る
+        path = self.root_dir / relative
+        st = os.lstat(path)
+        return {"base": base, "hash": MergeCache.digest(path.read_bytes()),
+                "size": st.st_size, "mtime_ns": st.st_mtime_ns}
+
+    def save(self) -> None:
+        # マニフェストを書き込み、参照されなくなった基準の内容を削除
+        self.dir.mkdir(parents=True, exist_ok=True)
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump({"version": 1, "files": self.files}, f, indent=2, sort_keys=True)
+            f.write('\n')
+        os.replace(tmp, self.path)
+        referenced = {entry["base"] for entry in self.files.values()}
+        if self.objects_dir.is_dir():
+            for path in self.objects_dir.glob("*/*"):
+                if path.parent.name + path.name not in referenced:
+                    path.unlink()
+
+
+def _walk_project_files(roots: List[Path]) -> List[Path]:
+    # roots以下のファイルを列挙（ビルドツリーとVCS管理領域は除外）
+    files = []
+    for root in roots:
+        if root.is_file() or root.is_symlink():
+            files.append(root)
+            continue
+        for dirpath, dirnames, filenames in os.walk(root):
+            dirnames[:] = [d for d in dirnames
+                           if d not in ProjectRenamer.SKIP_DIRS
+                           and not os.path.exists(os.path.join(dirpath, d, "CMakeCache.txt"))]
+            files.extend(Path(dirpath) / name for name in filenames)
+    return files
+
+
+def _write_file_atomic(path: Path, data: bytes, mode_from: Optional[Path] = None) -> None:
+    # 一時ファイルに書いてからrenameで置き換える（パーミッションはmode_fromに合わせる）
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex[:8]}.tmp")
+    tmp.write_bytes(data)
+    if mode_from is not None:
+        shutil.copymode(mode_from, tmp)
+    os.replace(tmp, path)
+
+
+class MoveJournal:
+    # 移動処理の各ステップとファイル操作を記録する先行書き込みジャーナル
+    # 記録は1件ごとにOSへ書き出し、fsyncはステップ完了時とSYNC_INTERVAL件ごとにまとめて行う
+    # （書き換え前のバックアップだけは、書き換えより先に必ずfsyncする）
+
+    DIR_NAME = ".pico_move"
+    FILE_NAME = "journal.jsonl"
+    BACKUP_DIR = "backup"
+    SYNC_INTERVAL = 64
+
+    def __init__(self, root_dir: Path):
+        self.dir = root_dir / self.DIR_NAME
+        self.path = self.dir / self.FILE_NAME
+        self.backup_dir = self.dir / self.BACKUP_DIR
+        self.records: List[Dict[str, Any]] = []
+        self._file = None
+        self._unsynced = 0
+        self._lock = threading.Lock()
+        self._backed_up = set()
+
+    def exists(self) -> bool:
+        return self.path.is_file()
+
+    def load(self) -> List[Dict[str, Any]]:
+        # 記録を読み込む（書き込み途中で切れた最後の行は無視）
+        self.records = []
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    self.records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    break
+        self._backed_up = {r["path"] for r in self.records if r.get("op") == "backup"}
+        return self.records
+
+    @property
+    def header(self) -> Dict[str, Any]:
+        if self.records and self.records[0].get("op") == "begin":
+            return self.records[0]
+        return {}
+
+    def completed_steps(self) -> Dict[str, Dict[str, Any]]:
+        # 完了したステップ名 -> 記録
+        return {r["name"]: r for r in self.records if r.get("op") == "step"}
+
+    def open(self) -> None:
+        self.dir.mkdir(exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def append(self, record: Dict[str, Any], sync: bool = False) -> None:
+        # 記録を1件追加（syncがFalseならfsyncはまとめて行う）
+        if self._file is None:
+            return
+        with self._lock:
+            self._file.write(json.dumps(record, ensure_ascii=False) + "\n")
+            self._file.flush()
+            self.records.append(record)
+            self._unsynced += 1
+            if sync or self._unsynced >= self.SYNC_INTERVAL:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def sync(self) -> None:
+        if self._file is None:
+            return
+        with self._lock:
+            if self._unsynced:
+                os.fsync(self._file.fileno())
+                self._unsynced = 0
+
+    def backup(self, path: Path) -> None:
+        # 書き換え・削除の前に元の内容を保存（同じパスは最初の1回だけ）
+        if self._file is None:
+            return
+        key = str(path)
+        with self._lock:
+            if key in self._backed_up:
+                return
+            self._backed_up.add(key)
+            backup_name = None
+            link = os.readlink(path) if path.is_symlink() else None
+            if link is None and path.is_file():
+                self.backup_dir.mkdir(exist_ok=True)
+                backup_name = f"{len(self.records):06d}-{path.name}"
+                with open(path, 'rb') as src, open(self.backup_dir / backup_name, 'wb') as dst:
+                    shutil.copyfileobj(src, dst)
+                    dst.flush()
+                    os.fsync(dst.fileno())
+        record = {"op": "backup", "path": key, "backup": backup_name}
+        if link is not None:
+            record["link"] = link
+        self.append(record, sync=True)
+
+    def close(self) -> None:
+        if self._file is not None:
+            self.sync()
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        # 正常終了またはロールバック後にジャーナルとバックアップを削除
+        self.close()
+        shutil.rmtree(self.dir, ignore_errors=True)
+
+
+class Tracer:
+    # 各フェーズとファイル操作の所要時間・カウンタ・エラーを記録する計測レイヤー
+    # 記録した内容はJSONのサマリー、またはChromeのtrace event形式で書き出す
+
+    def __init__(self):
+        self.started_at = datetime.now().isoformat()
+        self.origin_ns = time.perf_counter_ns()
+        self.spans: List[Dict[str, Any]] = []
+        self.counters: Dict[str, int] = {}
+        self.errors: List[Dict[str, Any]] = []
+        self._lock = threading.Lock()
+        self._local = threading.local()
+
+    def _stack(self) -> List[str]:
+        # スレッドごとの実行中スパン名のスタック
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    @contextlib.contextmanager
+    def span(self, name: str, category: str = "op", **args):
+        # withブロックの所要時間を記録（例外が発生した場合はエラーとしても記録）
+        stack = self._stack()
+        stack.append(name)
+        start = time.perf_counter_ns()
+        error = None
+        try:
+            yield
+        except BaseException as e:
+            error = f"{type(e).__name__}: {e}"
+            raise
+        finally:
+            end = time.perf_counter_ns()
+            stack.pop()
+            record = {"name": name, "cat": category, "start_ns": start - self.origin_ns,
+                      "dur_ns": end - start, "tid": threading.get_ident(), "args": args}
+            if error is not None:
+                record["error"] = error
+                self.error(error, span=name)
+            with self._lock:
+                self.spans.append(record)
+
+    def count(self, name: str, value: int = 1) -> None:
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def error(self, message: str, span: Optional[str] = None) -> None:
+        # エラー（警告として処理を続けたものを含む）を、実行中のスパンと一緒に記録
+        stack = self._stack()
+        with self._lock:
+            self.errors.append({"span": span or (stack[-1] if stack else None), "message": str(message),
+                                "at_ms": (time.perf_counter_ns() - self.origin_ns) / 1e6})
+
+    def summary(self) -> Dict[str, Any]:
+        # フェーズごとの所要時間、操作ごとの回数と合計時間、カウンタ、エラーをまとめる
+        with self._lock:
+            spans = sorted(self.spans, key=lambda s: s["start_ns"])
+            counters = dict(self.counters)
+            errors = list(self.errors)
+        phases = [{"name": s["name"], "seconds": s["dur_ns"] / 1e9, **({"error": s["error"]} if "error" in s else {})}
+                  for s in spans if s["cat"] == "phase"]
+        operations: Dict[str, Dict[str, Any]] = {}
+        for s in spans:
+            if s["cat"] == "phase":
+                continue
+            op = operations.setdefault(s["name"], {"count": 0, "seconds": 0.0, "max_seconds": 0.0})
+            op["count"] += 1
+            op["seconds"] += s["dur_ns"] / 1e9
+            op["max_seconds"] = max(op["max_seconds"], s["dur_ns"] / 1e9)
+        total_ns = max((s["start_ns"] + s["dur_ns"] for s in spans), default=0)
+        return {
+            "started_at": self.started_at,
+            "total_seconds": total_ns / 1e9,
+            "phases": phases,
+            "operations": operations,
+            "counters": counters,
+            "errors": errors,
+        }
+
+    def chrome_trace(self) -> Dict[str, Any]:
+        # chrome://tracing や Perfetto で開けるtrace event形式
+        pid = os.getpid()
+        with self._lock:
+            spans = list(self.spans)
+            counters = dict(self.counters)
+            errors = list(self.errors)
+        events = []
+        for s in spans:
+            args = {key: str(value) for key, value in s["args"].items()}
+            if "error" in s:
+                args["error"] = s["error"]
+            events.append({"name": s["name"], "cat": s["cat"], "ph": "X", "pid": pid, "tid": s["tid"],
+                           "ts": s["start_ns"] / 1000, "dur": s["dur_ns"] / 1000, "args": args})
+        for e in errors:
+            events.append({"name": "error", "cat": "error", "ph": "i", "s": "p", "pid": pid, "tid": 0,
+                           "ts": e["at_ms"] * 1000, "args": {"span": e["span"], "message": e["message"]}})
+        end_us = max((s["start_ns"] + s["dur_ns"] for s in spans), default=0) / 1000
+        if counters:
+            events.append({"name": "counters", "ph": "C", "pid": pid, "tid": 0, "ts": end_us, "args": counters})
+        return {"traceEvents": events, "displayTimeUnit": "ms",
+                "otherData": {"started_at": self.started_at}}
+
+    def write(self, path: Path, trace_format: str = "summary") -> None:
+        # trace_format: "summary"（JSONのサマリー）または "chrome"（trace event形式）
+        data = self.chrome_trace() if trace_format == "chrome" else self.summary()
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False, indent=None if trace_format == "chrome" else 2)
+            f.write('\n')
+
+
+@dataclass
+class IndexEntry:
+    # ファイルインデックスの1要素（種類, サイズ, inode, デバイス, 更新日時）
+    kind: str
+    size: int
+    inode: int
+    device: int
+    mtime_ns: int
+
+
+class FileIndex:
+    # os.scandirで1回だけ走査したファイルシステムのインデックス
+    # 各フェーズは存在確認やディレクトリ一覧をここから引き、移動などの操作に合わせて更新する
+
+    def __init__(self):
+        self.entries: Dict[Path, IndexEntry] = {}
+        # 一覧を取得済みのディレクトリ -> 子の名前（挿入順を保つためdictを使う）
+        self.children: Dict[Path, Dict[str, None]] = {}
+
+    @staticmethod
+    def _entry(st: os.stat_result, kind: str) -> IndexEntry:
+        return IndexEntry(kind, st.st_size, st.st_ino, st.st_dev, st.st_mtime_ns)
+
+    @staticmethod
+    def _kind(entry: os.DirEntry) -> str:
+        if entry.is_symlink():
+            return "symlink"
+        return "dir" if entry.is_dir(follow_symlinks=False) else "file"
+
+    def scan(self, root: Path, recursive: bool = True) -> None:
+        # rootを走査してインデックスに追加（recursiveがFalseなら直下の一覧のみ）
+        try:
+            st = os.stat(root)
+        except FileNotFoundError:
+            return
+        self.entries[root] = self._entry(st, "dir" if os.path.isdir(root) else "file")
+        if self.entries[root].kind != "dir":
+            return
+        stack = [root]
+        while stack:
+            directory = stack.pop()
+            names: Dict[str, None] = {}
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    kind = self._kind(entry)
+                    path = Path(entry.path)
+                    self.entries[path] = self._entry(entry.stat(follow_symlinks=False), kind)
+                    names[entry.name] = None
+                    if recursive and kind == "dir":
+                        stack.append(path)
+            self.children[directory] = names
+
+    def covers(self, path: Path) -> bool:
+        # pathの存在を（stat無しで）判定できるか
+        return path.parent in self.children or path in self.children
+
+    def get(self, path: Path) -> Optional[IndexEntry]:
+        return self.entries.get(path)
+
+    def exists(self, path: Path) -> bool:
+        return path in self.entries
+
+    def is_dir(self, path: Path) -> bool:
+        entry = self.entries.get(path)
+        return entry is not None and entry.kind == "dir"
+
+    def list_dir(self, path: Path) -> List[Path]:
+        return [path / name for name in self.children.get(path, {})]
+
+    def walk(self, path: Path, prune=None):
+        # path以下の(パス, 要素)を深さ優先で列挙（path自身を含む）
+        # prune(path, entry)が真を返した要素は、その子孫ごと列挙しない
+        stack = [path]
+        while stack:
+            current = stack.pop()
+            entry = self.entries.get(current)
+            if entry is None or (prune is not None and prune(current, entry)):
+                continue
+            yield current, entry
+            stack.extend(reversed(self.list_dir(current)))
+
+    def tree_stats(self, path: Path) -> tuple[int, int]:
+        # path以下のファイル数と合計バイト数
+        files = 0
+        size = 0
+        for _, entry in self.walk(path):
+            if entry.kind != "dir":
+                files += 1
+                size += entry.size
+        return files, size
+
+    def add(self, path: Path, kind: str, size: int = 0) -> None:
+        # 新しく作成したファイル/ディレクトリを登録
+        parent = self.entries.get(path.parent)
+        self.entries[path] = IndexEntry(kind, size, 0, parent.device if parent else 0, time.time_ns())
+        self.children.setdefault(path.parent, {})[path.name] = None
+        if kind == "dir":
+            self.children.setdefault(path, {})
+
+    def remove(self, path: Path) -> None:
+        # pathとその子孫をインデックスから削除
+        for current, _ in list(self.walk(path)):
+            self.entries.pop(current, None)
+            self.children.pop(current, None)
+        self.children.get(path.parent, {}).pop(path.name, None)
+
+    def move(self, src: Path, dst: Path) -> None:
+        # src以下の要素をdst以下に付け替える
+        moved = list(self.walk(src))
+        listed = {current: self.children.get(current) for current, _ in moved}
+        self.remove(src)
+        for current, entry in moved:
+            new_path = dst / current.relative_to(src) if current != src else dst
+            self.entries[new_path] = entry
+            if listed[current] is not None:
+                self.children[new_path] = listed[current]
+        self.children.setdefault(dst.parent, {})[dst.name] = None
+
+
 class PicoProjectMover:
     # Picoプロジェクト移動を管理するクラス
 
-    def __init__(self, root_dir: Path = None):
-        self.root_dir = root_dir or Path(__file__).parent.absolute()
-        self.project_name = self._get_project_name()
+    def __init__(self, root_dir: Path = None, project_name: Optional[str] = None,
+                 logger: Optional[logging.Logger] = None):
+        self.root_dir = root_dir or Path(__file__).parent.absolute()
+        # 進捗と警告の出力先（Noneの場合は標準出力にprint）
+        self.logger = logger
+        # 各フェーズとファイル操作の計測（trace_pathを指定するとmove_projectの終了時に書き出す）
+        self.tracer = Tracer()
+        self.trace_path: Optional[Path] = None
+        self.trace_format = "summary"
+        self.project_name = project_name or self._get_project_name()
+        # Trueの場合、buildディレクトリはゴミ箱へrenameしてバックグラウンドで削除する
+        self.background_cleanup = False
+        # Trueの場合、ゴミ箱の削除完了まで待つ（並列削除は行う）
+        self.wait_cleanup = False
+        self._trash_pending = False
+        # Trueの場合、buildディレクトリを削除せずパスを書き換えてソースと一緒に移動する
+        self.keep_build = False
+        self._build_preserved = False
+        # Trueの場合、移動したファイルの内容とファイル名に残る旧プロジェクト名も変更する
+        self.rename_files = True
+        # 旧プロジェクト名以外に置換する名前（旧名 -> 新名）
+        self.extra_renames: Dict[str, str] = {}
+        # move_project_filesで展開先に移動したパス
+        self.moved_items: List[Path] = []
+        # 進捗を記録するジャーナル（execute中のみ有効）
+        self.journal: Optional[MoveJournal] = None
+        # 移動元と展開先を1回だけ走査したインデックス（execute/plan中のみ有効）
+        self.index: Optional[FileIndex] = None
+        # 設定ファイルのマージ結果のキャッシュ（初回のマージ時に読み込む）
+        self._merge_cache: Optional[MergeCache] = None
+        # Trueの場合、移動完了時に--sync用のマニフェストを記録する（展開したファイルの内容を複製するため指定時のみ）
+        self.record_manifest = False
+        # ワークスペースの設定ファイルとマージした.vscodeのファイル -> マニフェストの基準にするプロジェクト側の内容のハッシュ
+        self._sync_bases: Dict[Path, str] = {}
+        # デバイスをまたぐ移動で使うコピースレッド数（Noneは既定値）
+        self.copy_workers: Optional[int] = None
+        # Trueの場合、移動したファイルをコンテンツストアと共有して重複を排除する（store_dirがNoneなら既定の場所）
+        self.dedupe = False
+        self.store_dir: Optional[Path] = None
+        self._store: Optional[ContentStore] = None
+        # Trueの場合、CMakeLists.txtにccacheを組み込む（ccache_dirがNoneなら既定のキャッシュ）
+        self.ccache = False
+        self.ccache_dir: Optional[Path] = None
+        # Trueの場合、移動前のプロジェクトをcreate用のテンプレートとして保存する（template_dirがNoneなら既定の場所）
+        self.harvest = False
+        self.template_dir: Optional[Path] = None
+
+    def _get_project_name(self) -> str:
+        # 環境変数またはディレクトリ名からプロジェクト名を取得
+        project_name = os.environ.get('PROJECT_NAME')
+        if not project_name:
+            self._warn("PROJECT_NAME環境変数が設定されていません")
+            self._print("フォルダ名から自動取得します...")
+            project_name = self.root_dir.name
+        return project_name
+
+    def _print_header(self):
+        # ヘッダー情報を表示
+        self._print("=" * 50)
+        self._print("プロジェクト移動用スクリプト")
+        self._print("=" * 50)
+        self._print(f"プロジェクト名: {self.project_name}")
+        self._print(f"ルートディレクトリ: {self.root_dir}")
+        self._print()
+
+    def validate_arguments(self, args: List[str]) -> str:
+        # コマンドライン引数を検証
+        if len(args) < 2:
+            raise InvalidOptionError("初期化されたプロジェクトディレクトリ名を指定してください"
+                                     "（使用例: ./move_pico_project.py temp_project）")
+        return args[1]
+
+    def _print(self, message: str = "", level: int = logging.INFO) -> None:
+        # 進捗を表示（loggerを指定した場合は標準出力には書かずloggerへ出力）
+        if self.logger is None:
+            print(message)
+        elif message:
+            self.logger.log(level, message)
+
+    def _warn(self, message: str, level: str = "警告") -> None:
+        # 警告を表示し、処理を続けたエラーとして計測にも記録
+        if self.logger is None:
+            print(f"{level}: {message}")
+        else:
+            self.logger.log(logging.ERROR if level == "エラー" else logging.WARNING, message)
+        self.tracer.error(message)
+
+    def _tree_stats(self, path: Path) -> tuple[int, int]:
+        # インデックスからpath以下のファイル数とバイト数を取得（インデックスがなければ0）
+        if self.index is not None and self.index.exists(path):
+            return self.index.tree_stats(path)
+        return 0, 0
+
+    def _remove_tree(self, path: Path) -> None:
+        # ディレクトリツリーを削除して計測に記録
+        files, size = self._tree_stats(path)
+        self._index_remove(path)
+        with self.tracer.span("rmtree", path=str(path), files=files):
+            shutil.rmtree(path)
+        self.tracer.count("dirs_removed")
+        self.tracer.count("files_deleted", files)
+        self.tracer.count("bytes_deleted", size)
+
+    def _exists(self, path: Path) -> bool:
+        # インデックスがあればstatせずに存在を判定
+        if self.index is not None and self.index.covers(path):
+            return self.index.exists(path)
+        return path.exists()
+
+    def _is_dir(self, path: Path) -> bool:
+        if self.index is not None and self.index.covers(path):
+            return self.index.is_dir(path)
+        return path.is_dir()
+
+    def _list_dir(self, path: Path) -> List[Path]:
+        if self.index is not None and path in self.index.children:
+            return self.index.list_dir(path)
+        return list(path.iterdir())
+
+    def _index_add(self, path: Path, kind: str = "file") -> None:
+        if self.index is not None and not self.index.exists(path):
+            self.index.add(path, kind)
+
+    def _index_remove(self, path: Path) -> None:
+        if self.index is not None:
+            self.index.remove(path)
+
+    def _index_move(self, src: Path, dst: Path) -> None:
+        if self.index is not None:
+            self.index.move(src, dst)
+
+    def build_index(self, init_dir: str) -> FileIndex:
+        # 移動元ツリー全体と、展開先のうち移動処理が参照する部分を1回だけ走査
+        src_dir = self.root_dir / init_dir
+        index = FileIndex()
+        with self.tracer.span("index", "phase"):
+            index.scan(self.root_dir, recursive=False)
+            if index.is_dir(self.root_dir / ".vscode"):
+                index.scan(self.root_dir / ".vscode", recursive=False)
+            index.scan(src_dir)
+        self.tracer.count("entries_indexed", len(index.entries))
+        self.index = index
+        return index
+
+    def compile_plan(self, init_dir: str) -> Dict[str, Any]:
+        # インデックスから移動計画（マージ/移動/削除/書き換え操作の一覧）を作成
+        index = self.index or self.build_index(init_dir)
+        src_dir = self.root_dir / init_dir
+        dst_dir = self.root_dir
+        errors = []
+        if not index.exists(src_dir / "CMakeLists.txt"):
+            errors.append(f"{src_dir} に有効なPicoプロジェクトが見つかりません（CMakeLists.txt が存在しません）")
+        if index.exists(dst_dir / "CMakeLists.txt"):
+            errors.append(f"{dst_dir} には既にプロジェクトが存在します")
+
+        src_entry = index.get(src_dir)
+        dst_entry = index.get(dst_dir)
+        same_device = bool(src_entry and dst_entry and src_entry.device == dst_entry.device)
+        method = "rename" if same_device else "copy"
+
+        operations: List[Dict[str, Any]] = []
+        if self.harvest:
+            operations.append({"step": "harvest", "op": "harvest", "path": str(src_dir),
+                               "cache": str(TemplateCache(self.template_dir).root)})
+        operations.append({"step": "env", "op": "write", "path": str(dst_dir / ".env")})
+        if index.exists(src_dir / ".gitignore"):
+            operations.append({"step": "gitignore", "op": "merge",
+                               "src": str(src_dir / ".gitignore"), "dst": str(dst_dir / ".gitignore")})
+        if index.exists(src_dir / ".vscode" / "extensions.json"):
+            operations.append({"step": "extensions", "op": "merge",
+                               "src": str(src_dir / ".vscode" / "extensions.json"),
+                               "dst": str(dst_dir / ".vscode" / "extensions.json")})
+        merged = set()
+        for src, dst in self._vscode_merge_targets(src_dir):
+            operations.append({"step": "vscode", "op": "merge", "src": str(src), "dst": str(dst)})
+            merged.add(src)
+        if index.exists(src_dir / "build"):
+            files, size = index.tree_stats(src_dir / "build")
+            operations.append({"step": "build", "op": "relocate" if self.keep_build else "delete",
+                               "path": str(src_dir / "build"), "files": files, "bytes": size})
+
+        total_files = 0
+        total_bytes = 0
+        cmake_files = []
+        for item in index.list_dir(src_dir):
+            if item.name == ".gitignore" or (item.name == "build" and not self.keep_build):
+                continue
+            sources = [item]
+            if item.name == ".vscode" and index.is_dir(item):
+                sources = [child for child in index.list_dir(item)
+                           if child.name != "extensions.json" and child not in merged]
+            for source in sources:
+                target = dst_dir / source.relative_to(src_dir)
+                files, size = index.tree_stats(source)
+                total_files += files
+                total_bytes += size
+                operations.append({"step": "move", "op": "move", "src": str(source), "dst": str(target),
+                                   "method": method, "files": files, "bytes": size})
+                if source.name == "build":
+                    continue
+                for path, entry in index.walk(source):
+                    if entry.kind == "file" and (path.name == "CMakeLists.txt" or path.suffix == ".cmake"):
+                        cmake_files.append(str(dst_dir / path.relative_to(src_dir)))
+
+        operations.append({"step": "cmake", "op": "rewrite", "files": sorted(cmake_files)})
+        if self.ccache:
+            operations.append({"step": "ccache", "op": "inject", "path": str(dst_dir / "CMakeLists.txt"),
+                               "cache_dir": str(CompilerCache(self.ccache_dir).cache_dir)})
+        renames = self._rename_map(init_dir)
+        if self.rename_files and renames:
+            operations.append({"step": "rename", "op": "rewrite_references", "renames": renames})
+        if self.dedupe:
+            operations.append({"step": "dedupe", "op": "dedupe", "store": str(self.content_store.root),
+                               "files": total_files})
+        if index.exists(dst_dir / "build") and not self.keep_build:
+            operations.append({"step": "artifacts", "op": "delete", "path": str(dst_dir / "build")})
+
+        required_bytes = 0 if same_device else total_bytes
+        try:
+            free_bytes = shutil.disk_usage(dst_dir).free
+        except OSError:
+            free_bytes = None
+        enough_space = free_bytes is None or free_bytes >= required_bytes
+        if not enough_space:
+            errors.append(f"空き容量が不足しています（必要: {_format_bytes(required_bytes)}, "
+                          f"空き: {_format_bytes(free_bytes)}）")
+
+        return {
+            "init_dir": init_dir,
+            "project_name": self.project_name,
+            "source": str(src_dir),
+            "destination": str(dst_dir),
+            "same_device": same_device,
+            "files": total_files,
+            "bytes": total_bytes,
+            "required_bytes": required_bytes,
+            "free_bytes": free_bytes,
+            "enough_space": enough_space,
+            "errors": errors,
+            "operations": operations,
+        }
+
+    def validate_directories(self, init_dir: str) -> tuple[Path, Path]:
+        # ディレクトリの存在と状態を検証
+        src_dir = self.root_dir / init_dir
+        dst_dir = self.root_dir
+
+        self._print(f"移動元: {src_dir}")
+        self._print(f"展開先: {dst_dir}")
+        self._print()
+
+        # CMakeLists.txtの存在確認
+        cmake_file = src_dir / "CMakeLists.txt"
+        if not self._exists(cmake_file):
+            raise ProjectNotFoundError(
+                f"{src_dir} に有効なPicoプロジェクトが見つかりません（CMakeLists.txt が存在しません）", path=src_dir)
+
+        # 既存プロジェクトの確認
+        existing_cmake = dst_dir / "CMakeLists.txt"
+        if self._exists(existing_cmake):
+            raise ProjectExistsError(
+                f"{dst_dir} には既にプロジェクトが存在します（既存のプロジェクトを削除してから実行してください）",
+                path=dst_dir)
+
+        return src_dir, dst_dir
+
+    def harvest_template(self, src_dir: Path) -> None:
+        # 移動前のプロジェクトをcreate用のテンプレートとしてキャッシュに保存
+        cache = TemplateCache(self.template_dir)
+        try:
+            metadata = cache.harvest(src_dir)
+        except (OSError, UnicodeDecodeError) as e:
+            self._warn(f"テンプレートの保存に失敗: {e}")
+            return
+        self.tracer.count("template_files", len(metadata["files"]))
+        self._print(f"テンプレート {metadata['key']} を保存しました（SDK {metadata['sdk_version']}, "
+                    f"ボード {metadata['board']}, {len(metadata['files'])} ファイル）")
+
+    def create_from_template(self, metadata: Dict[str, Any]) -> None:
+        # テンプレートから名前を置き換えながら作業用ディレクトリに1回だけ書き出し、通常の展開処理で配置する
+        def render(stage: Path) -> None:
+            cache = TemplateCache(self.template_dir)
+            self._print(f"テンプレート {metadata['key']} から {self.project_name} を作成中...")
+            files, size = cache.render(metadata, stage, self._rename_map(metadata["placeholder"]),
+                                       rename_files=self.rename_files)
+            self.tracer.count("files_rendered", files)
+            self.tracer.count("bytes_rendered", size)
+
+        self._execute_staged(render)
+
+    def import_archive(self, archive: Path, original_name: Optional[str] = None,
+                       strip_components: Optional[int] = None) -> None:
+        # tar/zipのプロジェクトを、メンバーを読みながら名前を置き換えて作業用ディレクトリに書き出し、通常の展開処理で配置する
+        # original_name: アーカイブ内のプロジェクト名（Noneの場合はCMakeLists.txtのproject()の名前）
+        def render(stage: Path) -> None:
+            self._print(f"{archive.name} を取り込み中...")
+            importer = ArchiveImporter(ArchiveSource(archive), strip_components, on_warning=self._warn)
+            importer.extract(stage, lambda name: ProjectRenderer(
+                self._rename_map(original_name or name), self.rename_files))
+            old_name = original_name or importer.original_name()
+            if importer.renderer.renames and importer.renderer.cmake_changes == 0:
+                self._warn("置換対象が見つかりませんでした")
+                self._print(f"検索対象: '{old_name}' → '{self.project_name}'")
+            self.tracer.count("files_imported", importer.files)
+            self.tracer.count("bytes_imported", importer.bytes)
+            self.tracer.count("archive_members_skipped", importer.skipped)
+            self._print(f"{importer.files} ファイル ({_format_bytes(importer.bytes)}) を書き出しました"
+                        f"（build/ の {importer.skipped} 個は読み飛ばし）")
+
+        self._execute_staged(render)
+
+    def _execute_staged(self, render) -> None:
+        # render(stage)で名前を置換済みのプロジェクトを作業用ディレクトリに書き出し、通常の展開処理で配置する
+        # 作業用ディレクトリはプロジェクト名と同じ名前にするため、展開処理での内容の書き換えは発生しない
+        # （同じファイルシステム内のrenameとマージだけになる）。中断後は書き出しをやり直さずに再開する
+        stage = self.root_dir / CREATE_DIR_NAME / self.project_name
+        init_dir = stage.relative_to(self.root_dir).as_posix()
+        journal = MoveJournal(self.root_dir)
+        resuming = False
+        if journal.exists():
+            journal.load()
+            resuming = journal.header.get("init_dir") == init_dir
+        if not resuming:
+            if self._exists(self.root_dir / "CMakeLists.txt"):
+                raise ProjectExistsError(
+                    f"{self.root_dir} には既にプロジェクトが存在します（既存のプロジェクトを削除してから実行してください）",
+                    path=self.root_dir)
+            if stage.exists():
+                shutil.rmtree(stage)
+            stage.mkdir(parents=True)
+            try:
+                with self.tracer.span("render", "phase"):
+                    render(stage)
+            except BaseException:
+                shutil.rmtree(self.root_dir / CREATE_DIR_NAME, ignore_errors=True)
+                raise
+
+        # 置換は書き出し時に済んでいるため、展開処理では名前を変更しない
+        extra_renames, self.extra_renames = self.extra_renames, {}
+        harvest, self.harvest = self.harvest, False
+        try:
+            self.execute(init_dir)
+        except BaseException:
+            # 移動を始める前に失敗した場合は、再開できないため作業用ディレクトリを残さない
+            if not journal.exists():
+                shutil.rmtree(self.root_dir / CREATE_DIR_NAME, ignore_errors=True)
+            raise
+        finally:
+            self.extra_renames = extra_renames
+            self.harvest = harvest
+        shutil.rmtree(self.root_dir / CREATE_DIR_NAME, ignore_errors=True)
+
+    def create_env_file(self) -> None:
+        # 環境変数ファイルを作成
+        env_file = self.root_dir / ".env"
+        self._backup_before_write(env_file)
+        try:
+            with open(env_file, 'w', encoding='utf-8') as f:
+                f.write(f"PROJECT_NAME={self.project_name}\n")
+            self._index_add(env_file)
+            self.tracer.count("files_written")
+            self._print(f".env ファイルを作成しました")
+        except IOError as e:
+            self._warn(f".envファイルの作成に失敗しました: {e}")
+
+    def _merge_config_file(self, src: Path, dst: Path) -> Optional[str]:
+        # MERGE_STRATEGIESに従ってsrcをdstへマージし、srcを削除
+        # 戻り値: "written"（書き込んだ）/ "unchanged"（結果が同じため書き込まず）/
+        #         "cached"（前回と同じ入力のため省略）/ None（失敗）
+        strategy = MERGE_STRATEGIES[dst.name]
+        try:
+            src_data = src.read_bytes()
+            dst_data = dst.read_bytes() if self._exists(dst) else None
+        except OSError as e:
+            self._warn(f"{src.name} の読み込みに失敗: {e}")
+            return None
+        src_hash = MergeCache.digest(src_data)
+        dst_hash = MergeCache.digest(dst_data)
+
+        if self.merge_cache.is_current(dst, src_hash, dst_hash):
+            result = "cached"
+        else:
+            try:
+                with self.tracer.span("merge", path=str(dst)):
+                    merged = strategy.merge(dst_data.decode('utf-8') if dst_data is not None else None,
+                                            src_data.decode('utf-8'))
+            except (JsoncError, UnicodeDecodeError) as e:
+                self._warn(f"{src.name} のマージに失敗: {e}")
+                return None
+            merged_data = merged.encode('utf-8')
+            result = "unchanged"
+            if merged_data != dst_data:
+                # 結果が展開先と同じなら書き込まない（更新日時を保つ）
+                self._backup_before_write(dst)
+                try:
+                    with open(dst, 'wb') as f:
+                        f.write(merged_data)
+                except OSError as e:
+                    self._warn(f"{dst.name} のマージに失敗: {e}")
+                    return None
+                self._index_add(dst)
+                self.tracer.count("files_written")
+                result = "written"
+            try:
+                self.merge_cache.record(dst, src_hash, dst_hash, MergeCache.digest(merged_data))
+            except OSError as e:
+                self._warn(f"マージキャッシュの保存に失敗: {e}")
+
+        # 移動元のファイルを削除
+        self._backup_before_write(src)
+        try:
+            src.unlink()
+            self._index_remove(src)
+        except OSError as e:
+            self._warn(f"移動元{src.name}の削除に失敗: {e}")
+        return result
+
+    @property
+    def merge_cache(self) -> MergeCache:
+        if self._merge_cache is None:
+            self._merge_cache = MergeCache(self.root_dir)
+        return self._merge_cache
+
+    def merge_gitignore(self, src_dir: Path) -> None:
+        # gitignoreファイルをマージ（展開先の順序を保ち、移動元にしかない行を追加）
+        src_gitignore = src_dir / ".gitignore"
+        dst_gitignore = self.root_dir / ".gitignore"
+
+        if not self._exists(src_gitignore):
+            return
+
+        self._print(".gitignore をマージ中...")
+        if self._merge_config_file(src_gitignore, dst_gitignore) is not None:
+            self._print(".gitignore のマージが完了しました")
+
+    def merge_extensions_json(self, src_dir: Path) -> None:
+        # extensions.jsonファイルをマージ（順序を保って重複削除）
+        src_vscode_dir = src_dir / ".vscode"
+        dst_vscode_dir = self.root_dir / ".vscode"
+        src_extensions = src_vscode_dir / "extensions.json"
+        dst_extensions = dst_vscode_dir / "extensions.json"
+
+        if not self._exists(src_extensions):
+            return
+
+        self._print("extensions.json をマージ中...")
+
+        # .vscodeディレクトリが存在しない場合は作成
+        if not self._exists(dst_vscode_dir):
+            try:
+                dst_vscode_dir.mkdir(parents=True, exist_ok=True)
+                self._index_add(dst_vscode_dir, "dir")
+            except OSError as e:
+                self._warn(f".vscodeディレクトリの作成に失敗: {e}")
+                return
+
+        if self._merge_config_file(src_extensions, dst_extensions) is None:
+            return
+        self._print("extensions.json のマージが完了しました")
+        try:
+            recommendations = parse_jsonc(dst_extensions.read_text(encoding='utf-8')).value.to_python()
+            self._print(f"推奨拡張機能数: {len(recommendations.get('recommendations', []))}")
+        except (OSError, JsoncError, AttributeError):
+            pass
+
+        # .vscodeディレクトリが空の場合は削除
+        try:
+            if self._exists(src_vscode_dir) and not self._list_dir(src_vscode_dir):
+                src_vscode_dir.rmdir()
+                self._index_remove(src_vscode_dir)
+        except OSError as e:
+            self._warn(f"移動元.vscodeディレクトリの削除に失敗: {e}")
+
+    def _vscode_merge_targets(self, src_dir: Path) -> List[tuple[Path, Path]]:
+        # 移動元と展開先の両方にあり、マージ方法が登録されている.vscode内のファイル
+        src_vscode_dir = src_dir / ".vscode"
+        dst_vscode_dir = self.root_dir / ".vscode"
+        if not self._is_dir(src_vscode_dir) or not self._is_dir(dst_vscode_dir):
+            return []
+        targets = []
+        for src in self._list_dir(src_vscode_dir):
+            dst = dst_vscode_dir / src.name
+            if (src.name != "extensions.json" and src.name in MERGE_STRATEGIES
+                    and not self._is_dir(src) and self._exists(dst) and not self._is_dir(dst)):
+                targets.append((src, dst))
+        return targets
+
+    def _record_sync_base(self, src: Path, dst: Path) -> Optional[str]:
+        # マージする前のプロジェクト側の内容を--syncの基準として保存
+        # （マージ結果を基準にすると、次回の--syncで利用者の設定がプロジェクトの内容で上書きされる）
+        if not self.record_manifest:
+            return None
+        try:
+            data = src.read_bytes()
+        except OSError:
+            return None
+        renames = self._rename_map(src.parent.parent.name) if self.rename_files else {}
+        if renames:
+            data = ProjectRenamer(renames).rename_content(data)
+        return SyncManifest(self.root_dir).store_object(data)
+
+    def merge_vscode_configs(self, src_dir: Path) -> None:
+        # extensions.json以外の.vscode内の設定ファイルを、上書きせずに展開先へマージ
+        targets = self._vscode_merge_targets(src_dir)
+        if not targets:
+            return
+        self._print(".vscode の設定ファイルをマージ中...")
+        for src, dst in targets:
+            base = self._record_sync_base(src, dst)
+            result = self._merge_config_file(src, dst)
+            if result is not None:
+                self.moved_items.append(dst)  # 旧プロジェクト名の変更対象に含める
+                if base is not None:
+                    self._sync_bases[dst] = base
+                    self._journal({"op": "sync_base", "path": str(dst), "base": base})
+            if result == "written":
+                self._print(f".vscode/{dst.name} をマージしました")
+            elif result is not None:
+                self._print(f".vscode/{dst.name} は変更ありません")
+
+    def cleanup_build_directory(self, src_dir: Path) -> None:
+        # ビルドディレクトリを削除
+        build_dir = src_dir / "build"
+        if self._exists(build_dir):
+            if self.keep_build and self.relocate_build_tree(src_dir):
+                return
+            self._print(f"{build_dir} ディレクトリを削除中...")
+            self._journal({"op": "delete", "path": str(build_dir)})
+            if self._trash_directory(build_dir):
+                return
+            try:
+                self._remove_tree(build_dir)
+                self._print("ビルドディレクトリを削除しました")
+            except OSError as e:
+                self._warn(f"ビルドディレクトリの削除に失敗: {e}")
+
+    def relocate_build_tree(self, src_dir: Path) -> bool:
+        # ビルドツリーを移動先のパスと新しいプロジェクト名に合わせて書き換える
+        # 安全に書き換えられない場合はFalseを返し、呼び出し側で削除する
+        build_dir = src_dir / "build"
+        self._print(f"{build_dir} を移動先に合わせて書き換え中...")
+        relocator = BuildTreeRelocator(build_dir, src_dir, self.root_dir,
+                                       src_dir.name, self.project_name)
+        try:
+            with self.tracer.span("relocate_build", path=str(build_dir)):
+                relocator.relocate()
+        except BuildTreeRelocationError as e:
+            self._warn(f"ビルドツリーを安全に書き換えられないため削除します: {e}")
+            return False
+        except (OSError, ValueError) as e:
+            self._warn(f"ビルドツリーの書き換えに失敗したため削除します: {e}")
+            return False
+
+        # 展開先に残っている古いbuildディレクトリは移動の妨げになるので先に削除
+        self.cleanup_build_artifacts()
+        self._build_preserved = True
+        self._journal({"op": "relocate_build", "path": str(build_dir)})
+        self.tracer.count("build_files_rewritten", relocator.files_rewritten)
+
+        self._print("ビルドツリーを書き換えました")
+        self._print(f"書き換えたファイル: {relocator.files_rewritten} / "
+                    f"名前を変更したパス: {relocator.paths_renamed}")
+        if relocator.outputs_total:
+            self._print(f"再利用できるビルド結果: {relocator.outputs_reused} / {relocator.outputs_total}")
+        return True
+
+    def _trash_directory(self, path: Path) -> bool:
+        # background_cleanup有効時、ディレクトリをゴミ箱へ移して即座に戻る
+        if not self.background_cleanup:
+            return False
+        with self.tracer.span("trash", path=str(path)):
+            trashed = move_to_trash(path, self.root_dir / TRASH_DIR_NAME)
+        if trashed is None:
+            self._print("ゴミ箱へ移動できないため、その場で削除します")
+            return False
+        self._index_remove(path)
+        self.tracer.count("dirs_trashed")
+        self._trash_pending = True
+        self._print(f"{path.name} をゴミ箱へ移動しました（削除は後で行います）")
+        return True
+
+    def reclaim_trash(self) -> None:
+        # ゴミ箱に移したディレクトリを削除（wait_cleanupでなければバックグラウンドで実行）
+        if not self._trash_pending:
+            return
+        self._trash_pending = False
+        trash_dir = self.root_dir / TRASH_DIR_NAME
+        if self.wait_cleanup:
+            self._print("ゴミ箱を削除中...")
+            TrashReclaimer(trash_dir, log=self._print).reclaim()
+            return
+        try:
+            pid = spawn_trash_reclaimer(self.root_dir)
+        except OSError as e:
+            self._warn(f"バックグラウンド削除の開始に失敗: {e}")
+            return
+        self._print(f"バックグラウンドでゴミ箱を削除しています (PID {pid}, "
+                    f"ログ: {trash_dir / TrashReclaimer.LOG_FILE})")
+
+    def move_project_files(self, src_dir: Path, dst_dir: Path, init_dir: str) -> None:
+        # プロジェクトファイルを移動
+        if not self._is_dir(src_dir):
+            self._print(f"移動元ディレクトリ {init_dir} はありません（移動済み）")
+            return
+
+        self._print("プロジェクトファイルを移動中...")
+
+        moved_count = None
+        # 同一デバイス上ならrenameだけで公開する高速パス
+        if self._same_device(src_dir, dst_dir):
+            moved_count = self._publish_by_rename(src_dir, dst_dir)
+        if moved_count is None:
+            moved_count = self._move_items_individually(src_dir, dst_dir)
+
+        self._print(f"{moved_count} 個のファイル/ディレクトリを移動しました")
+
+        # 移動元ディレクトリを削除
+        try:
+            src_dir.rmdir()
+            self._index_remove(src_dir)
+            self.tracer.count("dirs_removed")
+            self._print(f"移動元ディレクトリ {init_dir} を削除しました")
+        except OSError as e:
+            self._warn(f"移動元ディレクトリの削除に失敗: {e}")
+
+    def _same_device(self, a: Path, b: Path) -> bool:
+        # インデックスのデバイス番号で比較（なければstat）
+        if self.index is not None:
+            entry_a, entry_b = self.index.get(a), self.index.get(b)
+            if entry_a and entry_b:
+                return entry_a.device == entry_b.device
+        return _same_device(a, b)
+
+    def _plan_renames(self, src_dir: Path, dst_dir: Path) -> Optional[List[tuple[Path, Path, bool]]]:
+        # rename高速パスで行う(移動元, 移動先, 上書き可否)の一覧を作成
+        # 移動元ディレクトリ自体をステージング領域として扱う（マージ済みファイルは既に除去済み）
+        # 上書きできない衝突がある場合はNoneを返す
+        renames = []
+        for item in self._list_dir(src_dir):
+            if item.name == ".gitignore":
+                continue  # 既にマージ済み
+
+            dst_item = dst_dir / item.name
+            if item.name == ".vscode" and self._is_dir(item) and self._is_dir(dst_item):
+                # 既存の.vscodeには中身だけを移す（従来どおり同名ファイルは上書き）
+                for vscode_item in self._list_dir(item):
+                    if vscode_item.name == "extensions.json":
+                        continue  # extensions.jsonは既にマージ済み
+                    dst_vscode_item = dst_item / vscode_item.name
+                    if self._is_dir(dst_vscode_item):
+                        return None
+                    renames.append((vscode_item, dst_vscode_item, True))
+                continue
+
+            if self._exists(dst_item):
+                return None
+            renames.append((item, dst_item, False))
+        return renames
+
+    def _publish_by_rename(self, src_dir: Path, dst_dir: Path) -> Optional[int]:
+        # 最上位の要素ごとに1回のrenameで展開先へ公開する
+        # 途中で失敗した場合は公開済みの要素を元に戻し、Noneを返して従来の移動にフォールバック
+        renames = self._plan_renames(src_dir, dst_dir)
+        if renames is None:
+            self._print("展開先に同名の要素があるため、要素ごとの移動に切り替えます")
+            return None
+
+        published: List[tuple[Path, Path]] = []
+        moved_before = len(self.moved_items)
+        try:
+            for src_item, dst_item, replace in renames:
+                files, size = self._tree_stats(src_item)
+                # rename直後に中断されても再開・ロールバックで移動先を見つけられるよう、先に記録する
+                self._journal_move_begin(src_item, dst_item)
+                with self.tracer.span("publish", src=str(src_item)):
+                    if replace:
+                        os.replace(src_item, dst_item)
+                    else:
+                        _rename_noreplace(src_item, dst_item)
+                self.tracer.count("files_moved", files)
+                self.tracer.count("bytes_moved", size)
+                published.append((src_item, dst_item))
+                self.moved_items.append(dst_item)
+                self._index_move(src_item, dst_item)
+                self._journal({"op": "move", "src": str(src_item), "dst": str(dst_item)})
+        except OSError as e:
+            self._warn(f"renameによる移動に失敗したため元に戻します: {e}")
+            del self.moved_items[moved_before:]
+            for src_item, dst_item in reversed(published):
+                try:
+                    os.rename(dst_item, src_item)
+                    self._index_move(dst_item, src_item)
+                    self._journal({"op": "move", "src": str(dst_item), "dst": str(src_item)})
+                except OSError as rollback_error:
+                    self._warn(f"{dst_item} を元に戻せませんでした: {rollback_error}")
+            return None
+
+        # 中身だけを移した.vscodeディレクトリを削除
+        src_vscode_dir = src_dir / ".vscode"
+        try:
+            if self._is_dir(src_vscode_dir) and not self._list_dir(src_vscode_dir):
+                src_vscode_dir.rmdir()
+                self._index_remove(src_vscode_dir)
+        except OSError as e:
+            self._warn(f"移動元.vscodeディレクトリの削除に失敗: {e}")
+
+        return len(published)
+
+    def _backup_overwritten(self, dst: Path) -> None:
+        # 移動で上書きされる既存のファイルの元の内容をジャーナルに保存（--rollbackで復元する）
+        if self._exists(dst) and not self._is_dir(dst):
+            self._backup_before_write(dst)
+
+    def _journal_move_begin(self, src: Path, dst: Path) -> None:
+        # 移動の開始を記録（再開時に移動先を捨ててよいか判断できるよう、移動先が既にあったかも記録）
+        self._backup_overwritten(dst)
+        self._journal({"op": "move_begin", "src": str(src), "dst": str(dst),
+                       "existed": self._exists(dst) or dst.is_symlink()})
+
+    def _journaled_move(self, src: Path, dst: Path) -> None:
+        # 開始と完了をジャーナルに記録してshutil.moveする
+        # 開始だけが記録されている移動は、再開時に途中までのコピーを捨ててやり直す
+        self._journal_move_begin(src, dst)
+        files, size = self._tree_stats(src)
+        with self.tracer.span("move", src=str(src)):
+            shutil.move(str(src), str(dst))
+        self.tracer.count("files_moved", files)
+        self.tracer.count("bytes_moved", size)
+        if not self._same_device(src.parent, dst.parent):
+            self.tracer.count("bytes_copied", size)
+        self._index_move(src, dst)
+        self._journal({"op": "move", "src": str(src), "dst": str(dst)})
+
+    def _move_items_individually(self, src_dir: Path, dst_dir: Path) -> int:
+        # 要素ごとに移動（同一デバイスならshutil.move、デバイスをまたぐ場合は並列コピー）
+        pairs: List[tuple[Path, Path, str]] = []  # (移動元, 移動先, 表示名)
+        vscode_dirs = []
+        for item in self._list_dir(src_dir):
+            if item.name == ".gitignore":
+                continue  # 既にマージ済み
+
+            # .vscodeディレクトリの特別処理
+            if item.name == ".vscode" and self._is_dir(item):
+                dst_vscode_dir = dst_dir / ".vscode"
+                dst_vscode_dir.mkdir(parents=True, exist_ok=True)
+                self._index_add(dst_vscode_dir, "dir")
+
+                # .vscode内のファイルを個別に移動
+                for vscode_item in self._list_dir(item):
+                    if vscode_item.name == "extensions.json":
+                        continue  # extensions.jsonは既にマージ済み
+                    pairs.append((vscode_item, dst_vscode_dir / vscode_item.name, f".vscode/{vscode_item.name}"))
+                vscode_dirs.append(item)
+                continue
+
+            # その他のファイル/ディレクトリの移動
+            pairs.append((item, dst_dir / item.name, item.name))
+
+        if self._same_device(src_dir, dst_dir):
+            moved_count = self._move_pairs(pairs)
+        else:
+            moved_count = self._copy_pairs(pairs)
+
+        # 移動元の.vscodeディレクトリを削除
+        for item in vscode_dirs:
+            try:
+                if self._exists(item) and not self._list_dir(item):
+                    item.rmdir()
+                    self._index_remove(item)
+            except OSError as e:
+                self._warn(f"移動元.vscodeディレクトリの削除に失敗: {e}")
+
+        return moved_count
+
+    def _move_pairs(self, pairs: List[tuple[Path, Path, str]]) -> int:
+        # 1要素ずつshutil.moveで移動
+        moved_count = 0
+        for src, dst, label in pairs:
+            try:
+                self._journaled_move(src, dst)
+                self.moved_items.append(dst)
+                moved_count += 1
+            except OSError as e:
+                self._warn(f"{label} の移動に失敗: {e}")
+        return moved_count
+
+    def _copy_pairs(self, pairs: List[tuple[Path, Path, str]]) -> int:
+        # デバイスをまたぐ移動: ParallelCopierでまとめて並列コピーし、検証できた要素の移動元を削除
+        for src, dst, _ in pairs:
+            self._journal_move_begin(src, dst)
+        copier = ParallelCopier(self.copy_workers, self._store_for(self.root_dir),
+                                before_write=self._backup_before_write)
+        with self.tracer.span("parallel_copy", items=len(pairs)):
+            results = copier.copy([(src, dst) for src, dst, _ in pairs])
+
+        moved_count = 0
+        failed = []
+        for src, dst, label in pairs:
+            error = results.get(src)
+            if error is not None:
+                self._warn(f"{label} の移動に失敗: {error}")
+                failed.append(label)
+                continue
+            self._index_move(src, dst)
+            self._journal({"op": "move", "src": str(src), "dst": str(dst)})
+            self.moved_items.append(dst)
+            moved_count += 1
+        for error in copier.cleanup_errors:
+            self._warn(error)
+
+        self.tracer.count("files_moved", copier.files)
+        self.tracer.count("bytes_moved", copier.bytes)
+        self.tracer.count("bytes_copied", copier.bytes)
+        self.tracer.count("copy_max_concurrency", copier.max_concurrency)
+        self._print(copier.summary())
+        if failed:
+            # 一部だけ展開した状態で完了にしない（移動元は残っているため、原因を取り除いて再実行できる）
+            raise PicoProjectError(
+                f"{len(failed)} 個の要素を移動できませんでした: {', '.join(failed)}"
+                "（原因を取り除いて再実行すると続きから再開します。--rollback で元に戻せます）", failed=failed)
+        return moved_count
+
+    def _rename_map(self, init_dir: str) -> Dict[str, str]:
+        # 置換する名前の対応表（旧プロジェクト名 -> 新プロジェクト名 と追加指定分）
+        renames = {Path(init_dir).name: self.project_name}
+        renames.update(self.extra_renames)
+        return {old: new for old, new in renames.items() if old and old != new}
+
+    def rename_project_references(self, init_dir: str) -> None:
+        # 移動したファイルの内容とファイル/ディレクトリ名に残る旧名を一括で変更
+        renames = self._rename_map(init_dir)
+        if not self.rename_files or not renames or not self.moved_items:
+            return
+
+        self._print("ファイル内容とファイル名の旧プロジェクト名を変更中...")
+        renamer = ProjectRenamer(
+            renames, before_write=self._backup_before_write,
+            on_rename=self._on_rename, on_warning=self._warn)
+        with self.tracer.span("rename_scan"):
+            if self.index is not None:
+                renamer.scan_entries(self._indexed_project_entries())
+            else:
+                renamer.scan([item for item in self.moved_items if item.exists()])
+        with self.tracer.span("rename_apply"):
+            replaced, renamed = renamer.apply()
+        self.tracer.count("files_scanned", renamer.files_scanned)
+        self.tracer.count("bytes_scanned", renamer.bytes_scanned)
+        self.tracer.count("references_replaced", replaced)
+        self.tracer.count("paths_renamed", renamed)
+        self._print(f"{renamer.files_scanned} ファイル ({_format_bytes(renamer.bytes_scanned)}) を走査し、"
+                    f"{len(renamer.content_hits)} ファイルの {replaced} 箇所を置換しました"
+                    f"（バイナリ {renamer.binary_skipped} 件は対象外）")
+        if renamed:
+            self._print(f"{renamed} 個のファイル/ディレクトリ名を変更しました")
+
+    def _on_rename(self, src: Path, dst: Path) -> None:
+        # 名前を変更したパスを記録（移動したパスそのものの場合は一覧も更新）
+        self._journal({"op": "rename", "src": str(src), "dst": str(dst)})
+        self.moved_items = [dst if item == src else item for item in self.moved_items]
+
+    def _indexed_project_entries(self) -> List[tuple[Path, str]]:
+        # インデックスから、移動したパス以下の(パス, 種類)を列挙（ビルドツリーとVCS管理領域は除外）
+        def prune(path: Path, entry: IndexEntry) -> bool:
+            return entry.kind == "dir" and (path.name in ProjectRenamer.SKIP_DIRS
+                                            or self.index.exists(path / "CMakeCache.txt"))
+
+        entries = []
+        for item in self.moved_items:
+            if self.index.is_dir(item) and item not in self.index.children:
+                self.index.scan(item)  # 再開時など、まだ走査していない移動済みディレクトリ
+            entries.extend((path, entry.kind) for path, entry in self.index.walk(item, prune))
+        return entries
+
+    def _find_cmake_files(self) -> List[Path]:
+        # 展開先にあるCMakeLists.txtと*.cmakeを列挙（ビルドツリーやゴミ箱は除外）
+        if self.index is not None and self.moved_items:
+            return [path for path, kind in self._indexed_project_entries()
+                    if kind == "file" and (path.name == "CMakeLists.txt" or path.suffix == ".cmake")]
+        cmake_files = []
+        for dirpath, dirnames, filenames in os.walk(self.root_dir):
+            dirnames[:] = [d for d in dirnames
+                           if d not in (".git", TRASH_DIR_NAME)
+                           and not os.path.exists(os.path.join(dirpath, d, "CMakeCache.txt"))]
+            for filename in filenames:
+                if filename == "CMakeLists.txt" or filename.endswith(".cmake"):
+                    cmake_files.append(Path(dirpath) / filename)
+        return cmake_files
+
+    def _rename_in_cmake_file(self, renamer: CMakeRenamer, cmake_file: Path) -> Dict[str, int]:
+        # 1ファイルを書き換える（変更がなければ書き込まず、更新日時を保つ）
+        with self.tracer.span("cmake_rewrite", path=str(cmake_file)):
+            return self._rewrite_cmake_file(renamer, cmake_file)
+
+    def _rewrite_cmake_file(self, renamer: CMakeRenamer, cmake_file: Path) -> Dict[str, int]:
+        with open(cmake_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        if not renamer.may_match(content):
+            return {}
+        updated_content, counts = renamer.rewrite(content)
+        if counts:
+            self._backup_before_write(cmake_file)
+            with open(cmake_file, 'w', encoding='utf-8') as f:
+                f.write(updated_content)
+            self.tracer.count("cmake_files_rewritten")
+        return counts
+
+    def update_cmake_project_name(self, init_dir: str) -> None:
+        # CMakeファイル中のプロジェクト名と実行可能ファイル名（ターゲット参照）を更新
+        # init_dirはパスで渡される場合もあるので、旧プロジェクト名はディレクトリ名部分を使う
+        init_dir = Path(init_dir).name
+        cmake_file = self.root_dir / "CMakeLists.txt"
+
+        if not self._exists(cmake_file):
+            self._warn("CMakeLists.txt が見つかりません。プロジェクト名の書き換えをスキップします。")
+            return
+        renames = self._rename_map(init_dir)
+        if not renames:
+            return  # 旧名と新しい名前が同じ（createで書き出し時に置換済みの場合など）
+
+        self._print(f"CMakeファイルのプロジェクト名を {self.project_name} に変更中...")
+
+        renamer = CMakeRenamer(renames, rename_files=self.rename_files)
+        cmake_files = self._find_cmake_files()
+        total_changes = 0
+        with ThreadPoolExecutor(max_workers=min(8, len(cmake_files) or 1)) as executor:
+            futures = {executor.submit(self._rename_in_cmake_file, renamer, path): path
+                       for path in cmake_files}
+            results = []
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    results.append((path, future.result()))
+                except (IOError, UnicodeDecodeError) as e:
+                    self._warn(f"{path.relative_to(self.root_dir)} の更新に失敗: {e}", "エラー")
+
+        for path, counts in sorted(results):
+            if not counts:
+                continue
+            total_changes += sum(counts.values())
+            summary = " ".join(f"{command}({count})" for command, count in sorted(counts.items()))
+            self._print(f"{path.relative_to(self.root_dir)} を更新しました: {summary}")
+
+        if total_changes == 0:
+            self._warn("置換対象が見つかりませんでした")
+            self._print(f"検索対象: '{init_dir}' → '{self.project_name}'")
+
+    @property
+    def content_store(self) -> ContentStore:
+        if self._store is None:
+            self._store = ContentStore(self.store_dir)
+        return self._store
+
+    def _store_for(self, path: Path) -> Optional[ContentStore]:
+        # 重複排除が有効で、ストアがpathと同じファイルシステムにあればストアを返す
+        if not self.dedupe:
+            return None
+        try:
+            if self.content_store.usable_for(path):
+                return self.content_store
+        except OSError as e:
+            self._warn(f"コンテンツストア {self.content_store.root} を使用できません: {e}")
+            return None
+        self._warn(f"コンテンツストア {self.content_store.root} は {path} と別のファイルシステムにあるため、重複排除を行いません")
+        return None
+
+    def _dedupe_file(self, store: ContentStore, path: Path) -> Optional[tuple[str, int, int]]:
+        # 1ファイルをストアに登録して共有し、(ハッシュ, サイズ, 更新日時)を返す
+        st = os.lstat(path)
+        if not os.path.isfile(path) or os.path.islink(path) or st.st_size == 0:
+            return None
+        digest = store.hash_file(path)
+        if store.has(digest):
+            if store.materialize(path, digest, st) is None:
+                return None
+        elif not store.ingest(path, digest, st):
+            return None
+        st = os.stat(path)
+        return digest, st.st_size, st.st_mtime_ns
+
+    def dedupe_project_files(self) -> None:
+        # 移動したファイルをコンテンツストアに登録し、同じ内容のファイルはreflink/ハードリンクで共有する
+        store = self._store_for(self.root_dir)
+        if store is None:
+            return
+        files = _walk_project_files(self.moved_items)
+        self._print(f"コンテンツストアで重複排除中... ({len(files)} ファイル)")
+        recorded: Dict[str, tuple[str, int, int]] = {}
+        with ThreadPoolExecutor(max_workers=self.copy_workers or 16) as pool:
+            futures = {pool.submit(self._dedupe_file, store, path): path for path in files}
+            for future in as_completed(futures):
+                path = futures[future]
+                try:
+                    result = future.result()
+                except OSError as e:
+                    self._warn(f"{path} の重複排除に失敗: {e}")
+                    continue
+                if result is not None:
+                    recorded[path.relative_to(self.root_dir).as_posix()] = result
+        try:
+            store.register(self.root_dir, recorded)
+        except OSError as e:
+            self._warn(f"コンテンツストアへの参照の記録に失敗: {e}")
+
+        counts = store.counts
+        for method, count in counts.items():
+            self.tracer.count(f"dedupe_{method}", count)
+        self.tracer.count("dedupe_bytes_shared", store.bytes_shared)
+        if counts.get("unshared") and not counts.get("reflink"):
+            self._warn("このファイルシステムは reflink に対応していないため、読み取り専用のファイルだけを"
+                       "ハードリンクで共有しました（書き込み可能なファイルは共有できません）")
+        self._print(f"重複排除: reflink {counts.get('reflink', 0)} / ハードリンク {counts.get('hardlink', 0)} / "
+                    f"新規登録 {counts.get('stored', 0)} / 共有不可 {counts.get('unshared', 0)} ファイル"
+                    f"（共有 {_format_bytes(store.bytes_shared)}）")
+
+    def configure_compiler_cache(self) -> None:
+        # CMakeLists.txtにccacheを組み込み、移動後のビルドのヒット率を出すための基準を記録
+        cmake_file = self.root_dir / "CMakeLists.txt"
+        if not self._exists(cmake_file):
+            return
+        cache = CompilerCache(self.ccache_dir)
+        with open(cmake_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        updated = cache.inject(content)
+        if updated is None:
+            self._warn("CMakeLists.txt に project() が見つからないため、コンパイラキャッシュを組み込みません")
+            return
+        if updated != content:
+            self._backup_before_write(cmake_file)
+            with open(cmake_file, 'w', encoding='utf-8') as f:
+                f.write(updated)
+        cache.write_local(self.root_dir)
+        self._print(f"コンパイラキャッシュ {cache.cache_dir} を CMakeLists.txt に組み込みました")
+        if not cache.record_baseline(self.root_dir):
+            self._warn("ccache が見つかりません。インストールするとビルド時にキャッシュが使われます")
+
+    def cleanup_build_artifacts(self) -> None:
+        # 最終的なビルド成果物のクリーンアップ
+        if self._build_preserved:
+            return  # 移動してきたビルドツリーを保持する
+        build_dir = self.root_dir / "build"
+        if self._exists(build_dir):
+            self._print("既存のbuildディレクトリを削除...")
+            self._journal({"op": "delete", "path": str(build_dir)})
+            if self._trash_directory(build_dir):
+                return
+            try:
+                self._remove_tree(build_dir)
+                self._print("buildディレクトリを削除しました")
+            except OSError as e:
+                self._warn(f"buildディレクトリの削除に失敗: {e}")
+
+    def print_completion_message(self) -> None:
+        # 完了メッセージを表示
+        self._print()
+        self._print("=" * 50)
+        self._print("スクリプト完了")
+        self._print("=" * 50)
+        self._print()
+        self._print("次の手順:")
+        self._print("1. [Ctrl+Shift+P] でコマンドパレットを開く")
+        self._print("2. 'Developer: Reload Window' を選択してVSCodeを再読み込み")
+        self._print("3. CMakeが自動的に再構成されることを確認")
+        self._print()
+        self._print(f"プロジェクト名: {self.project_name}")
+        self._print("環境変数 PROJECT_NAME が設定されています")
+        if self.ccache:
+            self._print("ビルド後に './move_pico_project.py ccache-stats' でキャッシュのヒット率を確認できます")
+        self._print("=" * 50)
+
+    def _journal(self, record: Dict[str, Any]) -> None:
+        # ジャーナルにファイル操作を記録
+        if self.journal is not None:
+            self.journal.append(record)
+
+    def _backup_before_write(self, path: Path) -> None:
+        # ファイルを書き換え・削除する前に元の内容をジャーナルに保存
+        if self.journal is not None:
+            self.journal.backup(path)
+
+    def _restore_journal_state(self, journal: MoveJournal) -> None:
+        # 中断された処理の記録から、移動済みのパスとフラグを復元
+        finished_moves = {r["src"] for r in journal.records if r.get("op") == "move"}
+        # renameでの公開に失敗して要素ごとの移動をやり直した場合などは、最後の開始記録だけを見る
+        latest_begins = {r["src"]: i for i, r in enumerate(journal.records) if r.get("op") == "move_begin"}
+        for position, record in enumerate(journal.records):
+            op = record.get("op")
+            if op == "move":
+                self.moved_items.append(Path(record["dst"]))
+            elif op == "rename":
+                src, dst = Path(record["src"]), Path(record["dst"])
+                self.moved_items = [dst if item == src else item for item in self.moved_items]
+            elif op == "sync_base":
+                self._sync_bases[Path(record["path"])] = record["base"]
+            elif (op == "move_begin" and record["src"] not in finished_moves
+                  and latest_begins[record["src"]] == position):
+                src, dst = Path(record["src"]), Path(record["dst"])
+                if src.exists() and record.get("existed", True):
+                    # 移動前からあった移動先は削除せず、そのまま移動をやり直す
+                    # （上書きされたファイルは移動前にバックアップ済み）
+                    self._print(f"途中で中断された {dst.name} の移動をやり直します")
+                elif src.exists() and (dst.exists() or dst.is_symlink()):
+                    # この移動で作られた途中までのコピーを捨てて、移動をやり直す
+                    self._print(f"途中で中断された {dst.name} の移動をやり直します")
+                    if dst.is_dir() and not dst.is_symlink():
+                        shutil.rmtree(dst)
+                    else:
+                        dst.unlink()
+                elif not src.exists() and dst.exists():
+                    self.moved_items.append(dst)
+
+        steps = journal.completed_steps()
+        if steps:
+            state = list(steps.values())[-1].get("state", {})
+            self._build_preserved = state.get("build_preserved", False)
+            self._trash_pending = state.get("trash_pending", False)
+
+    def _open_journal(self, init_dir: str) -> Dict[str, Dict[str, Any]]:
+        # ジャーナルを開き、完了済みのステップを返す（新規実行時はディレクトリを検証）
+        journal = MoveJournal(self.root_dir)
+        if journal.exists():
+            journal.load()
+            header = journal.header
+            if header.get("init_dir") != init_dir:
+                raise JournalConflictError(
+                    f"別の移動処理({header.get('init_dir')})の記録が残っています。"
+                    "その処理を再開するか --rollback で元に戻してください", init_dir=header.get("init_dir"))
+            self.project_name = header.get("project_name", self.project_name)
+            self._print("中断された移動処理を再開します")
+            self._restore_journal_state(journal)
+            self.journal = journal
+            journal.open()
+            return journal.completed_steps()
+
+        # ディレクトリ検証
+        self.validate_directories(init_dir)
+        self.journal = journal
+        journal.open()
+        journal.append({"op": "begin", "init_dir": init_dir,
+                        "project_name": self.project_name,
+                        "time": datetime.now().isoformat()}, sync=True)
+        return {}
+
+    def execute(self, init_dir: str) -> None:
+        # 移動処理の各ステップを実行（失敗時は例外を送出し、プロセスは終了しない）
+        # 各ステップの完了はジャーナルに記録し、中断後の再実行では続きから再開する
+        src_dir = self.root_dir / init_dir
+        dst_dir = self.root_dir
+        # 移動元と展開先を1回だけ走査し、以降の各ステップはこのインデックスと計画を参照する
+        self.build_index(init_dir)
+        done = self._open_journal(init_dir)
+        with self.tracer.span("plan", "phase"):
+            plan = self.compile_plan(init_dir)
+        if not plan["enough_space"]:
+            # まだ何も記録していなければ、次回の実行が再開扱いにならないようジャーナルを消す
+            if len(self.journal.records) <= 1:
+                self.journal.remove()
+            else:
+                self.journal.close()
+            self.journal = None
+            raise InsufficientSpaceError(plan["errors"][-1], required_bytes=plan["required_bytes"],
+                                         free_bytes=plan["free_bytes"])
+        planned = {operation["step"] for operation in plan["operations"]}
+
+        steps = [
+            # テンプレートキャッシュへの取り込み（移動元を変更する前に実行）
+            ("harvest", self.harvest_template, (src_dir,)),
+            # .envファイル作成
+            ("env", self.create_env_file, ()),
+            # .gitignoreマージ
+            ("gitignore", self.merge_gitignore, (src_dir,)),
+            # extensions.jsonマージ（ファイル移動の前に実行）
+            ("extensions", self.merge_extensions_json, (src_dir,)),
+            # その他の.vscode設定ファイルのマージ（上書きされないようにファイル移動の前に実行）
+            ("vscode", self.merge_vscode_configs, (src_dir,)),
+            # ビルドディレクトリクリーンアップ
+            ("build", self.cleanup_build_directory, (src_dir,)),
+            # プロジェクトファイル移動
+            ("move", self.move_project_files, (src_dir, dst_dir, init_dir)),
+            # CMakeLists.txtのプロジェクト名更新
+            ("cmake", self.update_cmake_project_name, (init_dir,)),
+            # コンパイラキャッシュの組み込み
+            ("ccache", self.configure_compiler_cache, ()),
+            # その他のファイル内容とファイル名の旧プロジェクト名を変更
+            ("rename", self.rename_project_references, (init_dir,)),
+            # コンテンツストアとの重複排除（内容を書き換えるステップがすべて終わってから実行）
+            ("dedupe", self.dedupe_project_files, ()),
+            # 最終クリーンアップ
+            ("artifacts", self.cleanup_build_artifacts, ()),
+        ]
+        try:
+            for name, step, args in steps:
+                if name in done or name not in planned:
+                    continue
+                with self.tracer.span(name, "phase"):
+                    step(*args)
+                self.journal.append({"op": "step", "name": name, "state": {
+                    "build_preserved": self._build_preserved,
+                    "trash_pending": self._trash_pending,
+                }}, sync=True)
+            # 次回の--syncで比較する基準を記録
+            if self.record_manifest:
+                with self.tracer.span("manifest", "phase"):
+                    try:
+                        self.record_sync_manifest()
+                    except OSError as e:
+                        self._warn(f"同期用マニフェストの記録に失敗: {e}")
+        finally:
+            self.journal.close()
+
+        # すべてのステップが完了したらジャーナルは不要
+        self.journal.remove()
+        self.journal = None
+
+        # ゴミ箱へ移したbuildディレクトリの削除
+        with self.tracer.span("reclaim_trash", "phase"):
+            self.reclaim_trash()
+
+    def rollback(self) -> bool:
+        # 中断された移動処理で完了済みの操作を、記録と逆の順に取り消す
+        journal = MoveJournal(self.root_dir)
+        if not journal.exists():
+            self._print("元に戻す移動処理の記録がありません")
+            return False
+        records = journal.load()
+        self._print(f"移動処理({journal.header.get('init_dir')})を元に戻しています...")
+
+        failures = 0
+        finished_moves = {r["src"] for r in records if r.get("op") == "move"}
+        for record in reversed(records):
+            op = record.get("op")
+            try:
+                if op in ("move", "rename") or (op == "move_begin" and record["src"] not in finished_moves):
+                    # 完了を記録する前に中断された移動も、移動先にだけあれば元に戻す
+                    src, dst = Path(record["src"]), Path(record["dst"])
+                    if (dst.exists() or dst.is_symlink()) and not src.exists():
+                        src.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.move(str(dst), str(src))
+                elif op == "backup":
+                    path = Path(record["path"])
+                    # 今ある内容がシンボリックリンクなら、リンク先に書き込まないよう先に削除する
+                    if path.is_symlink() or (path.is_file() and record.get("link") is not None):
+                        path.unlink()
+                    if record.get("link") is not None:
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        os.symlink(record["link"], path)
+                    elif record.get("backup") is None:
+                        if path.is_file():
+                            path.unlink()
+                    else:
+                        path.parent.mkdir(parents=True, exist_ok=True)
+                        shutil.copy2(journal.backup_dir / record["backup"], path)
+                elif op == "relocate_build":
+                    # 書き換え済みのビルドツリーは元のパスでは使えないため削除する
+                    path = Path(record["path"])
+                    if path.is_dir():
+                        shutil.rmtree(path)
+                        self._print(f"書き換え済みの {path} を削除しました（CMakeの再構成で再生成されます）")
+                elif op == "delete":
+                    self._print(f"注意: 削除済みの {record['path']} は復元できません（CMakeの再構成で再生成されます）")
+            except OSError as e:
+                failures += 1
+                self._warn(f"{record} を元に戻せませんでした: {e}")
 
-    def _get_project_name(self) -> str:
-        # 環境変数またはディレクトリ名からプロジェクト名を取得
-        project_name = os.environ.get('PROJECT_NAME')
-        if not project_name:
-            print("警告: PROJECT_NAME環境変数が設定されていません")
-            print("フォルダ名から自動取得します...")
-            project_name = self.root_dir.name
-        return project_name
+        if failures:
+            self._print(f"{failures} 件の操作を元に戻せませんでした。記録は {journal.dir} に残しています")
+            return False
+        journal.remove()
+        self._print("移動処理を元に戻しました")
+        return True
 
-    def _print_header(self):
-        # ヘッダー情報を表示
-        print("=" * 50)
-        print("プロジェクト移動用スクリプト")
-        print("=" * 50)
-        print(f"プロジェクト名: {self.project_name}")
-        print(f"ルートディレクトリ: {self.root_dir}")
-        print()
+    def record_sync_manifest(self) -> None:
+        # 展開したファイルを--syncの基準としてマニフェストに記録
+        manifest = SyncManifest(self.root_dir)
+        for path in _walk_project_files([item for item in self.moved_items if item.exists()]):
+            relative = path.relative_to(self.root_dir).as_posix()
+            digest = self._sync_bases.get(path) or manifest.store_object(path.read_bytes())
+            manifest.files[relative] = manifest.entry(relative, digest)
+        manifest.save()
 
-    def validate_arguments(self, args: List[str]) -> str:
-        # コマンドライン引数を検証
-        if len(args) < 2:
-            print("エラー: 初期化されたプロジェクトディレクトリ名を指定してください")
-            print("使用例: ./move_pico_project.py temp_project")
-            sys.exit(1)
-        return args[1]
+    def rename_workspace(self, old_name: str) -> None:
+        # 展開済みのワークスペースのプロジェクト名をold_nameからproject_nameへ変更
+        # 対象は.envと、--syncのマニフェストに記録した展開済みのファイルがあるパス（テンプレート側のファイルには触れない）
+        manifest = SyncManifest(self.root_dir)
+        if not manifest.exists():
+            raise SyncBaseMissingError(
+                f"展開したファイルの記録 {manifest.path.relative_to(self.root_dir)} がありません"
+                "（--record-sync を指定して移動したワークスペースでのみ使用できます）", path=manifest.path)
+        manifest.load()
+        renames = self._rename_map(old_name)
+        if not renames:
+            raise InvalidOptionError(f"新しいプロジェクト名が旧名 {old_name} と同じです", old_name=old_name)
 
-    def validate_directories(self, init_dir: str) -> tuple[Path, Path]:
-        # ディレクトリの存在と状態を検証
+        # 利用者が編集したファイルは、次回の--syncで3方向マージできるよう基準の記録を引き継ぐ
+        edited = {relative for relative, entry in manifest.files.items()
+                  if entry.get("deleted") or manifest.current_digest(relative) != entry.get("hash")}
+        tops = sorted({relative.split("/")[0] for relative in manifest.files})
+        self.moved_items = [self.root_dir / top for top in tops if (self.root_dir / top).exists()]
+        self.create_env_file()
+        self.update_cmake_project_name(old_name)
+        self.rename_project_references(old_name)
+
+        path_renamer = ProjectRenamer(renames)
+        files: Dict[str, Dict[str, Any]] = {}
+        for relative, entry in manifest.files.items():
+            new_relative = path_renamer.rename_path(relative) if self.rename_files else relative
+            if relative in edited:
+                files[new_relative] = entry
+            elif entry.get("base") != entry.get("hash"):
+                # ワークスペースの設定とマージしたファイルは、基準（プロジェクト側の内容）も名前を変更して引き継ぐ
+                base = manifest.read_object(entry.get("base"))
+                if base is not None and (self.root_dir / new_relative).is_file():
+                    digest = manifest.store_object(path_renamer.rename_content(base) if self.rename_files else base)
+                    files[new_relative] = manifest.entry(new_relative, digest)
+            elif (self.root_dir / new_relative).is_file():
+                digest = manifest.store_object((self.root_dir / new_relative).read_bytes())
+                files[new_relative] = manifest.entry(new_relative, digest)
+        manifest.files = files
+        manifest.save()
+
+    def sync_project(self, init_dir: str) -> Dict[str, List[str]]:
+        # 再生成したプロジェクトと既存のワークスペースの差分だけを反映する
+        # 再生成したプロジェクトは作業用ディレクトリで通常どおり展開（名前の変更など）してから比較し、
+        # 前回の展開内容（マニフェストの基準）と比べて追加・変更・削除されたファイルだけを書き換える
+        # ビルドツリーには触れない
         src_dir = self.root_dir / init_dir
-        dst_dir = self.root_dir
+        if not (src_dir / "CMakeLists.txt").exists():
+            raise ProjectNotFoundError(
+                f"{src_dir} に有効なPicoプロジェクトが見つかりません（CMakeLists.txt が存在しません）", path=src_dir)
+        manifest = SyncManifest(self.root_dir)
+        if not manifest.exists():
+            raise SyncBaseMissingError(
+                f"同期の基準となる {manifest.path.relative_to(self.root_dir)} がありません。"
+                "--sync は --record-sync を指定して移動した後に使用してください", path=manifest.path)
+        manifest.load()
 
-        print(f"移動元: {src_dir}")
-        print(f"展開先: {dst_dir}")
-        print()
+        # 作業用ディレクトリに再生成したプロジェクトを展開
+        stage_root = manifest.dir / "stage"
+        if stage_root.exists():
+            shutil.rmtree(stage_root)
+        stage_root.mkdir(parents=True)
+        self._print("再生成されたプロジェクトを作業用ディレクトリに展開中...")
+        staged_src = stage_root / src_dir.name
+        shutil.move(str(src_dir), str(staged_src))
+        stager = PicoProjectMover(root_dir=stage_root, project_name=self.project_name)
+        stager.rename_files = self.rename_files
+        stager.extra_renames = dict(self.extra_renames)
+        stager.record_manifest = False
+        # ワークスペースにccacheを組み込んでいれば、比較で消えないよう展開側にも同じ設定を入れる
+        cache = CompilerCache.configured(self.root_dir)
+        if cache is not None:
+            stager.ccache = True
+            stager.ccache_dir = cache.override_dir
+        stager.tracer = self.tracer
+        log = io.StringIO()
+        try:
+            with self.tracer.span("stage", "phase"), contextlib.redirect_stdout(log):
+                stager.execute(src_dir.name)
+        except BaseException:
+            self._print(log.getvalue().rstrip("\n"))
+            if staged_src.exists() and not src_dir.exists():
+                shutil.move(str(staged_src), str(src_dir))
+            raise
 
-        # CMakeLists.txtの存在確認
-        cmake_file = src_dir / "CMakeLists.txt"
-        if not cmake_file.exists():
-            print(f"エラー: {src_dir} に有効なPicoプロジェクトが見つかりません")
-            print("CMakeLists.txt が存在しません")
-            sys.exit(1)
+        # 比較対象（.envとマージで扱う設定ファイル、スクリプトの管理ファイルを除く）
+        merged_files = (".gitignore", ".vscode/extensions.json")
+        new_files: Dict[str, Path] = {}
+        for path in _walk_project_files([p for p in stage_root.iterdir() if not p.name.startswith(".pico_")]):
+            relative = path.relative_to(stage_root).as_posix()
+            if relative != ".env" and relative not in merged_files:
+                new_files[relative] = path
 
-        # 既存プロジェクトの確認
-        existing_cmake = dst_dir / "CMakeLists.txt"
-        if existing_cmake.exists():
-            print(f"エラー: {dst_dir} には既にプロジェクトが存在します")
-            print("既存のプロジェクトを削除してから実行してください")
-            sys.exit(1)
+        self._print("ワークスペースとの差分を反映中...")
+        report: Dict[str, List[str]] = {key: [] for key in
+                                        ("added", "updated", "merged", "conflicts", "removed", "kept", "unchanged")}
+        entries: Dict[str, Dict[str, Any]] = {}
+        with self.tracer.span("sync", "phase"):
+            for relative in sorted(set(new_files) | set(manifest.files)):
+                self._sync_file(manifest, relative, new_files.get(relative), entries, report)
 
-        return src_dir, dst_dir
+            # .gitignoreとextensions.jsonはワークスペース側の内容とのマージで反映
+            for relative in merged_files:
+                staged = stage_root / relative
+                if staged.exists():
+                    target = self.root_dir / relative
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    if self._merge_config_file(staged, target) == "written":
+                        report["merged"].append(relative)
 
-    def create_env_file(self) -> None:
-        # 環境変数ファイルを作成
-        env_file = self.root_dir / ".env"
-        try:
-            with open(env_file, 'w', encoding='utf-8') as f:
-                f.write(f"PROJECT_NAME={self.project_name}\n")
-            print(f".env ファイルを作成しました")
-        except IOError as e:
-            print(f"警告: .envファイルの作成に失敗しました: {e}")
+        manifest.files = entries
+        manifest.save()
+        shutil.rmtree(stage_root, ignore_errors=True)
+        for key, paths in report.items():
+            self.tracer.count(f"sync_{key}", len(paths))
+        return report
 
-    def merge_gitignore(self, src_dir: Path) -> None:
-        # gitignoreファイルをマージ（重複削除）
-        src_gitignore = src_dir / ".gitignore"
-        dst_gitignore = self.root_dir / ".gitignore"
+    def _sync_file(self, manifest: SyncManifest, relative: str, staged: Optional[Path],
+                   entries: Dict[str, Dict[str, Any]], report: Dict[str, List[str]]) -> None:
+        # 1ファイル分の差分を反映（基準 = 前回の展開内容, ours = ワークスペース, theirs = 今回の展開内容）
+        target = self.root_dir / relative
+        entry = manifest.files.get(relative)
+        base_digest = entry["base"] if entry else None
+        ours_digest = manifest.current_digest(relative)
+        theirs = staged.read_bytes() if staged is not None else None
 
-        if not src_gitignore.exists():
+        if theirs is None:
+            # プロジェクトから削除されたファイル（利用者が編集していれば残す）
+            if ours_digest is None:
+                return
+            if ours_digest == base_digest:
+                target.unlink()
+                report["removed"].append(relative)
+            else:
+                report["kept"].append(relative)
             return
 
-        print(".gitignore をマージ中...")
+        theirs_digest = manifest.store_object(theirs)
+        if ours_digest is None and entry is not None:
+            # 利用者が削除したファイルは再作成しない
+            entries[relative] = {"base": theirs_digest, "deleted": True}
+            return
 
-        # 既存の.gitignoreの内容を読み込み
-        existing_lines = set()
-        if dst_gitignore.exists():
-            try:
-                with open(dst_gitignore, 'r', encoding='utf-8') as f:
-                    existing_lines = {line.strip()
-                                      for line in f if line.strip()}
-            except IOError as e:
-                print(f"警告: 既存の.gitignoreの読み込みに失敗: {e}")
+        if ours_digest == theirs_digest:
+            report["unchanged"].append(relative)
+        elif ours_digest is None:
+            _write_file_atomic(target, theirs, staged)
+            report["added"].append(relative)
+        elif ours_digest == base_digest:
+            _write_file_atomic(target, theirs, staged)
+            report["updated"].append(relative)
+        elif theirs_digest == base_digest:
+            report["unchanged"].append(relative)  # 利用者の編集だけがあるファイル
+        else:
+            self._sync_merge(manifest, relative, base_digest, theirs, staged, report)
+        entries[relative] = manifest.entry(relative, theirs_digest)
 
-        # 新しい.gitignoreの内容を読み込み
+    def _sync_merge(self, manifest: SyncManifest, relative: str, base_digest: Optional[str],
+                    theirs: bytes, staged: Path, report: Dict[str, List[str]]) -> None:
+        # 利用者とプロジェクトの両方が変更したファイルを3方向マージ
+        target = self.root_dir / relative
+        ours = target.read_bytes()
+        base = manifest.read_object(base_digest) or b""
         try:
-            with open(src_gitignore, 'r', encoding='utf-8') as f:
-                new_lines = {line.strip() for line in f if line.strip()}
-        except IOError as e:
-            print(f"警告: 移動元の.gitignoreの読み込みに失敗: {e}")
+            if b"\0" in ours or b"\0" in theirs:
+                raise UnicodeDecodeError("utf-8", b"", 0, 1, "binary")
+            merged, conflicts = merge3(base.decode('utf-8').splitlines(keepends=True),
+                                       ours.decode('utf-8').splitlines(keepends=True),
+                                       theirs.decode('utf-8').splitlines(keepends=True),
+                                       labels=("workspace", "project"))
+        except UnicodeDecodeError:
+            # バイナリはマージできないため、ワークスペース側を残して新しい内容を別名で保存
+            _write_file_atomic(target.with_name(target.name + ".pico-new"), theirs, staged)
+            report["conflicts"].append(relative)
             return
 
-        # マージして重複削除
-        merged_lines = sorted(existing_lines | new_lines)
+        text = "".join(merged)
+        if conflicts and target.name in MERGE_STRATEGIES:
+            # 競合マーカーを入れられない設定ファイルは、構造を保ったマージにする
+            try:
+                text = MERGE_STRATEGIES[target.name].merge(ours.decode('utf-8'), theirs.decode('utf-8'))
+                conflicts = 0
+            except JsoncError:
+                pass
+        _write_file_atomic(target, text.encode('utf-8'), target)
+        report["conflicts" if conflicts else "merged"].append(relative)
+
+    def print_sync_report(self, report: Dict[str, List[str]]) -> None:
+        # --syncの結果を表示
+        labels = [("added", "追加"), ("updated", "更新"), ("merged", "マージ"), ("removed", "削除")]
+        for key, label in labels:
+            for relative in report[key]:
+                self._print(f"  {label}: {relative}")
+        for relative in report["kept"]:
+            self._print(f"  残す: {relative}（プロジェクトからは削除されましたが、編集されているため残します）")
+        summary = " / ".join(f"{label} {len(report[key])}" for key, label in labels)
+        self._print(f"同期結果: {summary} / 変更なし {len(report['unchanged'])}")
+        if report["conflicts"]:
+            self._print(f"警告: {len(report['conflicts'])} 件のファイルで競合が発生しました。"
+                        "<<<<<<< の箇所（バイナリは .pico-new）を確認してください", logging.WARNING)
+            for relative in report["conflicts"]:
+                self._print(f"  競合: {relative}")
 
-        # 書き込み
+    def sync(self, init_dir: str) -> None:
+        # --syncのメイン処理
         try:
-            with open(dst_gitignore, 'w', encoding='utf-8') as f:
-                for line in merged_lines:
-                    f.write(f"{line}\n")
-            print(".gitignore のマージが完了しました")
-        except IOError as e:
-            print(f"警告: .gitignoreのマージに失敗: {e}")
+            report = self.sync_project(init_dir)
+            self.print_sync_report(report)
+        except PicoProjectError as e:
+            self._print(f"エラー: {e}", logging.ERROR)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            self._print("\n処理が中断されました")
+            sys.exit(1)
+        finally:
+            self.write_trace()
+
+    def move_project(self, init_dir: str) -> None:
+        # プロジェクト移動のメイン処理
+        self._run_cli(lambda: self.execute(init_dir))
+
+    def import_project(self, archive: Path, original_name: Optional[str] = None,
+                       strip_components: Optional[int] = None) -> None:
+        # アーカイブからの取り込みのメイン処理
+        self._run_cli(lambda: self.import_archive(archive, original_name, strip_components))
 
-        # 移動元のgitignoreを削除
+    def _run_cli(self, action) -> None:
+        # コマンドラインからの移動処理を実行し、エラー時はメッセージを表示して終了
         try:
-            src_gitignore.unlink()
-        except OSError as e:
-            print(f"警告: 移動元.gitignoreの削除に失敗: {e}")
+            action()
 
-    def merge_extensions_json(self, src_dir: Path) -> None:
-        # extensions.jsonファイルをマージ（重複削除）
-        src_vscode_dir = src_dir / ".vscode"
-        dst_vscode_dir = self.root_dir / ".vscode"
-        src_extensions = src_vscode_dir / "extensions.json"
-        dst_extensions = dst_vscode_dir / "extensions.json"
+            # 完了メッセージ
+            self.print_completion_message()
+
+        except PicoProjectError as e:
+            self._print(f"エラー: {e}", logging.ERROR)
+            sys.exit(1)
+        except KeyboardInterrupt:
+            self._print("\n処理が中断されました")
+            self._print("再実行すると続きから再開します（--rollback で元に戻せます）")
+            sys.exit(1)
+        except Exception as e:
+            self._print(f"\n予期しないエラーが発生しました: {e}")
+            self._print("詳細なエラー情報:")
+            import traceback
+            traceback.print_exc()
+            sys.exit(1)
+        finally:
+            # 失敗・中断した場合も、そこまでの計測結果を書き出す
+            self.write_trace()
 
-        if not src_extensions.exists():
+    def write_trace(self) -> None:
+        # trace_pathが指定されていれば計測結果を書き出す
+        if self.trace_path is None:
             return
+        try:
+            self.tracer.write(self.trace_path, self.trace_format)
+            self._print(f"計測結果を書き出しました: {self.trace_path}")
+        except OSError as e:
+            self._warn(f"計測結果の書き出しに失敗: {e}")
 
-        print("extensions.json をマージ中...")
 
-        # .vscodeディレクトリが存在しない場合は作成
-        if not dst_vscode_dir.exists():
-            try:
-                dst_vscode_dir.mkdir(parents=True, exist_ok=True)
-            except OSError as e:
-                print(f"警告: .vscodeディレクトリの作成に失敗: {e}")
-                return
+@dataclass
+class BatchJob:
+    # バッチ移動の1ジョブ（移動元ディレクトリ, 展開先ルート, プロジェクト名）
+    source: Path
+    dest_root: Path
+    project_name: str
 
-        def clean_json_content(content: str) -> str:
-            """JSONコンテンツから末尾のカンマを除去する"""
-            # 配列やオブジェクトの末尾のカンマを除去する正規表現
-            # ],や},の前のカンマとスペースを除去
-            cleaned = re.sub(r',(\s*[}\]])', r'\1', content)
-            return cleaned
 
-        # 既存のextensions.jsonを読み込み
-        existing_data = {"recommendations": [], "unwantedRecommendations": []}
-        if dst_extensions.exists():
-            try:
-                with open(dst_extensions, 'r', encoding='utf-8') as f:
-                    content = f.read()
-                    if content.strip():  # 空ファイルでないことを確認
-                        # 末尾のカンマを除去してからパース
-                        cleaned_content = clean_json_content(content)
-                        try:
-                            existing_data = json.loads(cleaned_content)
-                            if not isinstance(existing_data, dict):
-                                existing_data = {
-                                    "recommendations": [], "unwantedRecommendations": []}
-                        except json.JSONDecodeError as e:
-                            print(f"警告: 既存のextensions.jsonのパースに失敗: {e}")
-            except IOError as e:
-                print(f"警告: 既存のextensions.jsonの読み込みに失敗: {e}")
-
-        # 新しいextensions.jsonを読み込み
-        try:
-            with open(src_extensions, 'r', encoding='utf-8') as f:
-                content = f.read()
-                if content.strip():  # 空ファイルでないことを確認
-                    # 末尾のカンマを除去してからパース
-                    cleaned_content = clean_json_content(content)
-                    new_data = json.loads(cleaned_content)
-                    if not isinstance(new_data, dict):
-                        new_data = {"recommendations": [],
-                                    "unwantedRecommendations": []}
-                else:
-                    new_data = {"recommendations": [],
-                                "unwantedRecommendations": []}
-        except (IOError, json.JSONDecodeError) as e:
-            print(f"警告: 移動元のextensions.jsonの読み込みに失敗: {e}")
-            return
+@dataclass
+class BatchResult:
+    # バッチ移動の1ジョブの結果
+    job: BatchJob
+    ok: bool
+    elapsed: float
+    error: Optional[str] = None
+    log: str = ""
 
-        # recommendations と unwantedRecommendations をマージ（重複削除）
-        merged_data = {
-            "recommendations": [],
-            "unwantedRecommendations": []
-        }
 
-        # recommendationsのマージ
-        recommendations_set = set()
+def _run_batch_job(job: BatchJob) -> BatchResult:
+    # ワーカープロセス内で1ジョブを実行（出力はジョブごとに捕捉して返す）
+    buffer = io.StringIO()
+    start = time.perf_counter()
+    error = None
+    try:
+        with contextlib.redirect_stdout(buffer):
+            mover = PicoProjectMover(job.dest_root, project_name=job.project_name)
+            mover.execute(str(job.source))
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+    return BatchResult(job=job, ok=error is None,
+                       elapsed=time.perf_counter() - start,
+                       error=error, log=buffer.getvalue())
 
-        # 既存のrecommendationsを追加
-        if "recommendations" in existing_data and isinstance(existing_data["recommendations"], list):
-            for rec in existing_data["recommendations"]:
-                if isinstance(rec, str) and rec.strip():  # 文字列であることと空でないことを確認
-                    recommendations_set.add(rec.strip())
 
-        # 新しいrecommendationsを追加
-        if "recommendations" in new_data and isinstance(new_data["recommendations"], list):
-            for rec in new_data["recommendations"]:
-                if isinstance(rec, str) and rec.strip():  # 文字列であることと空でないことを確認
-                    recommendations_set.add(rec.strip())
+def load_batch_manifest(manifest: Path) -> List[BatchJob]:
+    # マニフェスト(JSON)からジョブ一覧を読み込む
+    # 形式: [{"source": "...", "dest": "...", "name": "..."}, ...]
+    # 相対パスはマニフェストファイルの場所を基準に解決する
+    base_dir = manifest.parent.absolute()
+    with open(manifest, 'r', encoding='utf-8') as f:
+        entries = json.load(f)
+    if isinstance(entries, dict):
+        entries = entries.get("jobs", [])
+    if not isinstance(entries, list):
+        raise PicoProjectError(f"{manifest} の形式が不正です（ジョブの配列が必要です）")
 
-        merged_data["recommendations"] = sorted(list(recommendations_set))
+    jobs = []
+    for index, entry in enumerate(entries):
+        try:
+            source = base_dir / entry["source"]
+            dest_root = base_dir / entry.get("dest", source.parent)
+            name = entry.get("name") or dest_root.name
+        except (KeyError, TypeError, AttributeError):
+            raise PicoProjectError(f"{manifest} の{index}番目のジョブが不正です")
+        jobs.append(BatchJob(source, dest_root, name))
+    return jobs
 
-        # unwantedRecommendationsのマージ
-        unwanted_set = set()
 
-        # 既存のunwantedRecommendationsを追加
-        if "unwantedRecommendations" in existing_data and isinstance(existing_data["unwantedRecommendations"], list):
-            for rec in existing_data["unwantedRecommendations"]:
-                if isinstance(rec, str) and rec.strip():
-                    unwanted_set.add(rec.strip())
+def run_batch(jobs: List[BatchJob], workers: Optional[int] = None) -> List[BatchResult]:
+    # 複数のプロジェクト移動をプロセスプールで並列実行
+    results: List[BatchResult] = []
 
-        # 新しいunwantedRecommendationsを追加
-        if "unwantedRecommendations" in new_data and isinstance(new_data["unwantedRecommendations"], list):
-            for rec in new_data["unwantedRecommendations"]:
-                if isinstance(rec, str) and rec.strip():
-                    unwanted_set.add(rec.strip())
+    # 同じ展開先を複数のジョブが使うと競合するため、2つ目以降は実行しない
+    runnable = []
+    seen_dest = set()
+    for job in jobs:
+        dest_key = job.dest_root.resolve()
+        if dest_key in seen_dest:
+            results.append(BatchResult(job=job, ok=False, elapsed=0.0,
+                                       error=f"展開先 {job.dest_root} が他のジョブと重複しています"))
+            continue
+        seen_dest.add(dest_key)
+        runnable.append(job)
 
-        merged_data["unwantedRecommendations"] = sorted(list(unwanted_set))
+    if not runnable:
+        return results
 
-        # マージしたデータを書き込み
-        try:
-            with open(dst_extensions, 'w', encoding='utf-8') as f:
-                json.dump(merged_data, f, indent='\t', ensure_ascii=False)
-                f.write('\n')  # 最後に改行を追加
-            print("extensions.json のマージが完了しました")
-            print(f"推奨拡張機能数: {len(merged_data['recommendations'])}")
-        except IOError as e:
-            print(f"警告: extensions.jsonのマージに失敗: {e}")
+    workers = max(1, min(workers or os.cpu_count() or 1, len(runnable)))
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(_run_batch_job, job) for job in runnable]
+        for future in as_completed(futures):
+            results.append(future.result())
+    return results
 
-        # 移動元のextensions.jsonを削除
-        try:
-            src_extensions.unlink()
-            # .vscodeディレクトリが空の場合は削除
-            if src_vscode_dir.exists() and not any(src_vscode_dir.iterdir()):
-                src_vscode_dir.rmdir()
-        except OSError as e:
-            print(f"警告: 移動元extensions.jsonの削除に失敗: {e}")
 
-    def cleanup_build_directory(self, src_dir: Path) -> None:
-        # ビルドディレクトリを削除
-        build_dir = src_dir / "build"
-        if build_dir.exists():
-            print(f"{build_dir} ディレクトリを削除中...")
-            try:
-                shutil.rmtree(build_dir)
-                print("ビルドディレクトリを削除しました")
-            except OSError as e:
-                print(f"警告: ビルドディレクトリの削除に失敗: {e}")
+def print_batch_summary(results: List[BatchResult], elapsed: float, show_logs: bool = False) -> None:
+    # バッチ実行結果の集計を表示
+    print("=" * 50)
+    print("バッチ移動結果")
+    print("=" * 50)
+    for result in sorted(results, key=lambda r: str(r.job.dest_root)):
+        status = "OK" if result.ok else "NG"
+        print(f"[{status}] {result.job.project_name} ({result.elapsed:.2f}s) "
+              f"{result.job.source} → {result.job.dest_root}")
+        if result.error:
+            print(f"      {result.error}")
+        if result.log and (show_logs or not result.ok):
+            for line in result.log.rstrip().splitlines():
+                print(f"      | {line}")
 
-    def move_project_files(self, src_dir: Path, dst_dir: Path, init_dir: str) -> None:
-        # プロジェクトファイルを移動
-        print("プロジェクトファイルを移動中...")
+    succeeded = sum(1 for r in results if r.ok)
+    slowest = max((r.elapsed for r in results), default=0.0)
+    print("-" * 50)
+    print(f"成功: {succeeded} / 失敗: {len(results) - succeeded} / 合計: {len(results)}")
+    print(f"総経過時間: {elapsed:.2f}s (最長ジョブ: {slowest:.2f}s, "
+          f"逐次実行時の合計: {sum(r.elapsed for r in results):.2f}s)")
 
-        moved_count = 0
-        for item in src_dir.iterdir():
-            if item.name == ".gitignore":
-                continue  # 既にマージ済み
 
-            # .vscodeディレクトリの特別処理
-            if item.name == ".vscode" and item.is_dir():
-                dst_vscode_dir = dst_dir / ".vscode"
-                dst_vscode_dir.mkdir(parents=True, exist_ok=True)
+def _jsonable(value: Any) -> Any:
+    # Pathを文字列に変換し、JSONに書き出せる値にする
+    if isinstance(value, Path):
+        return str(value)
+    if isinstance(value, dict):
+        return {key: _jsonable(item) for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_jsonable(item) for item in value]
+    return value
 
-                # .vscode内のファイルを個別に移動
-                for vscode_item in item.iterdir():
-                    if vscode_item.name == "extensions.json":
-                        continue  # extensions.jsonは既にマージ済み
 
-                    dst_item = dst_vscode_dir / vscode_item.name
-                    try:
-                        if vscode_item.is_dir():
-                            shutil.move(str(vscode_item), str(dst_item))
-                        else:
-                            shutil.move(str(vscode_item), str(dst_item))
-                        moved_count += 1
-                    except OSError as e:
-                        print(f"警告: .vscode/{vscode_item.name} の移動に失敗: {e}")
+@dataclass
+class OperationResult:
+    # ライブラリAPIの各操作の結果（warningsは処理を続けた警告、traceは計測結果のサマリー）
+    operation: str
+    root_dir: Path
+    project_name: str
+    elapsed: float
+    warnings: List[str]
+    trace: Dict[str, Any]
+
+    def to_dict(self) -> Dict[str, Any]:
+        return _jsonable(asdict(self))
+
+
+@dataclass
+class MoveResult(OperationResult):
+    # run_moveの結果（展開先に移動したパス）
+    moved: List[Path] = field(default_factory=list)
+
+
+@dataclass
+class SyncResult(OperationResult):
+    # run_syncの結果（added/updated/merged/removed/kept/conflicts/unchanged -> 相対パスの一覧）
+    changes: Dict[str, List[str]] = field(default_factory=dict)
+
+
+@dataclass
+class RenameResult(OperationResult):
+    # run_renameの結果
+    old_name: str = ""
+    references_replaced: int = 0
+    paths_renamed: int = 0
+    cmake_files_rewritten: int = 0
+
+
+@dataclass
+class RollbackResult(OperationResult):
+    # run_rollbackの結果（restoredは記録した操作をすべて元に戻せたかどうか）
+    restored: bool = False
+
+
+# APIで指定できるPicoProjectMoverの設定と型
+MOVER_OPTIONS: Dict[str, type] = {
+    "keep_build": bool,
+    "rename_files": bool,
+    "extra_renames": dict,
+    "background_cleanup": bool,
+    "wait_cleanup": bool,
+    "copy_workers": int,
+    "dedupe": bool,
+    "store_dir": Path,
+    "ccache": bool,
+    "ccache_dir": Path,
+    "record_manifest": bool,
+    "harvest": bool,
+    "template_dir": Path,
+}
+
+
+def _api_mover(root_dir, project_name: str, logger: Optional[logging.Logger],
+               options: Dict[str, Any]) -> PicoProjectMover:
+    # 環境変数を読まず、標準出力にも書かないPicoProjectMoverを作る
+    if not project_name:
+        raise InvalidOptionError("project_name を指定してください")
+    mover = PicoProjectMover(Path(root_dir).absolute(), project_name=project_name, logger=logger or LOGGER)
+    for key, value in options.items():
+        kind = MOVER_OPTIONS.get(key)
+        if kind is None:
+            raise InvalidOptionError(f"不明なオプションです: {key}", option=key)
+        if kind is Path and isinstance(value, (str, Path)):
+            value = Path(value)
+        elif value is not None and (not isinstance(value, kind) or (kind is int and isinstance(value, bool))):
+            raise InvalidOptionError(f"オプション {key} の値が不正です: {value!r}", option=key)
+        setattr(mover, key, value)
+    return mover
+
+
+def _result_fields(operation: str, mover: PicoProjectMover, start: float) -> Dict[str, Any]:
+    return {"operation": operation, "root_dir": mover.root_dir, "project_name": mover.project_name,
+            "elapsed": time.perf_counter() - start,
+            "warnings": [error["message"] for error in mover.tracer.errors],
+            "trace": mover.tracer.summary()}
+
+
+def run_move(root_dir, init_dir: str, project_name: str,
+             logger: Optional[logging.Logger] = None, **options: Any) -> MoveResult:
+    # root_dir/init_dirのプロジェクトをroot_dirに展開する（失敗時はPicoProjectErrorのサブクラスを送出）
+    # optionsはMOVER_OPTIONSの設定（例: keep_build=True）
+    start = time.perf_counter()
+    mover = _api_mover(root_dir, project_name, logger, options)
+    mover.execute(init_dir)
+    return MoveResult(moved=list(mover.moved_items), **_result_fields("move", mover, start))
+
+
+def run_sync(root_dir, init_dir: str, project_name: str,
+             logger: Optional[logging.Logger] = None, **options: Any) -> SyncResult:
+    # 再生成したroot_dir/init_dirと展開済みのワークスペースの差分だけを反映する
+    start = time.perf_counter()
+    mover = _api_mover(root_dir, project_name, logger, options)
+    changes = mover.sync_project(init_dir)
+    return SyncResult(changes=changes, **_result_fields("sync", mover, start))
+
+
+def run_plan(root_dir, init_dir: str, project_name: str,
+             logger: Optional[logging.Logger] = None, **options: Any) -> Dict[str, Any]:
+    # 何も変更せず、移動計画（--planと同じ内容）を返す
+    mover = _api_mover(root_dir, project_name, logger, options)
+    mover.build_index(init_dir)
+    return mover.compile_plan(init_dir)
 
-                # 移動元の.vscodeディレクトリを削除
+
+def run_rename(root_dir, old_name: str, project_name: str,
+               logger: Optional[logging.Logger] = None, **options: Any) -> RenameResult:
+    # 展開済みのワークスペースのプロジェクト名をold_nameからproject_nameへ変更する
+    start = time.perf_counter()
+    mover = _api_mover(root_dir, project_name, logger, options)
+    mover.rename_workspace(old_name)
+    counters = mover.tracer.counters
+    return RenameResult(old_name=old_name,
+                        references_replaced=counters.get("references_replaced", 0),
+                        paths_renamed=counters.get("paths_renamed", 0),
+                        cmake_files_rewritten=counters.get("cmake_files_rewritten", 0),
+                        **_result_fields("rename", mover, start))
+
+
+def run_create(root_dir, project_name: str, template: Optional[str] = None,
+               sdk_version: Optional[str] = None, board: Optional[str] = None,
+               template_options: Optional[Dict[str, str]] = None,
+               logger: Optional[logging.Logger] = None, **options: Any) -> MoveResult:
+    # テンプレートキャッシュからroot_dirに直接プロジェクトを作成する（templateはキーの先頭部分）
+    start = time.perf_counter()
+    mover = _api_mover(root_dir, project_name, logger, options)
+    metadata = TemplateCache(mover.template_dir).select(template, sdk_version, board, template_options)
+    mover.create_from_template(metadata)
+    return MoveResult(moved=list(mover.moved_items), **_result_fields("create", mover, start))
+
+
+def run_import(root_dir, archive, project_name: str, archive_name: Optional[str] = None,
+               strip_components: Optional[int] = None,
+               logger: Optional[logging.Logger] = None, **options: Any) -> MoveResult:
+    # tar/zipのアーカイブからroot_dirに直接プロジェクトを取り込む（相対パスはroot_dirからの位置）
+    start = time.perf_counter()
+    mover = _api_mover(root_dir, project_name, logger, options)
+    path = mover.root_dir / archive
+    if not is_archive(path):
+        raise ProjectNotFoundError(f"アーカイブが見つかりません: {path}（対応形式: {', '.join(ARCHIVE_SUFFIXES)}）",
+                                   path=path)
+    mover.import_archive(path, archive_name, strip_components)
+    return MoveResult(moved=list(mover.moved_items), **_result_fields("import", mover, start))
+
+
+def run_rollback(root_dir, logger: Optional[logging.Logger] = None) -> RollbackResult:
+    # 中断された移動処理で完了済みの操作を元に戻す
+    start = time.perf_counter()
+    mover = PicoProjectMover(Path(root_dir).absolute(), project_name=Path(root_dir).name, logger=logger or LOGGER)
+    restored = mover.rollback()
+    return RollbackResult(restored=restored, **_result_fields("rollback", mover, start))
+
+
+class _RpcLogHandler(logging.Handler):
+    # ログを要求IDつきのJSON-RPC通知（method: "log"）として送る
+    def __init__(self, server: "JsonRpcServer", request_id: Any):
+        super().__init__(logging.INFO)
+        self.server = server
+        self.request_id = request_id
+
+    def emit(self, record: logging.LogRecord) -> None:
+        self.server.send({"jsonrpc": "2.0", "method": "log",
+                          "params": {"id": self.request_id, "level": record.levelname.lower(),
+                                     "message": record.getMessage()}})
+
+
+class JsonRpcServer:
+    # 標準入出力で1行1メッセージのJSON-RPC 2.0を処理するサーバー
+    # 1つのプロセスで要求を順に処理し、起動とimportのコストを要求ごとに払わずに済むようにする
+    # 処理中のログは "log" 通知として送り、標準出力にはJSON-RPCのメッセージ以外を書かない
+
+    PARSE_ERROR = -32700
+    INVALID_REQUEST = -32600
+    METHOD_NOT_FOUND = -32601
+    INVALID_PARAMS = -32602
+    INTERNAL_ERROR = -32603
+    OPERATION_ERROR = -32000  # PicoProjectError（dataに code/message/details）
+
+    METHODS = {
+        "move": run_move,
+        "sync": run_sync,
+        "plan": run_plan,
+        "rename": run_rename,
+        "rollback": run_rollback,
+        "create": run_create,
+        "import": run_import,
+    }
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.running = True
+        # 要求ごとのロガーを作るとloggingのマネージャーに残り続けるため、サーバーごとに1つを使い回す
+        # （logging.getLoggerを通さずに作り、サーバーと一緒に解放されるようにする）
+        self._log_handler = _RpcLogHandler(self, None)
+        self.logger = logging.Logger(f"{LOGGER.name}.rpc", logging.INFO)
+        self.logger.addHandler(self._log_handler)
+
+    def send(self, message: Dict[str, Any]) -> None:
+        self.writer.write(json.dumps(message, ensure_ascii=False) + "\n")
+        self.writer.flush()
+
+    @staticmethod
+    def _error(request_id: Any, code: int, message: str, data: Any = None) -> Dict[str, Any]:
+        error = {"code": code, "message": message}
+        if data is not None:
+            error["data"] = data
+        return {"jsonrpc": "2.0", "id": request_id, "error": error}
+
+    def _check_params(self, method: str, params: Any) -> None:
+        # 名前付き引数として渡せるか確認（合わなければTypeError）
+        if method == "shutdown":
+            return
+        if not isinstance(params, dict) or "logger" in params:
+            raise TypeError("params は名前付き引数のオブジェクトで指定してください")
+        inspect.signature(self.METHODS[method]).bind(**params)
+
+    def _call(self, method: str, params: Dict[str, Any], request_id: Any) -> Any:
+        # メソッドを実行（ログはこの要求の通知として送る）
+        if method == "shutdown":
+            self.running = False
+            return None
+        self._log_handler.request_id = request_id
+        try:
+            result = self.METHODS[method](logger=self.logger, **params)
+        finally:
+            self._log_handler.request_id = None
+        return _jsonable(result.to_dict() if isinstance(result, OperationResult) else result)
+
+    def handle(self, request: Any) -> Optional[Dict[str, Any]]:
+        # 1つの要求を処理して応答を返す（通知の場合はNone）
+        if not isinstance(request, dict) or request.get("jsonrpc") != "2.0" \
+                or not isinstance(request.get("method"), str):
+            return self._error(None, self.INVALID_REQUEST, "Invalid Request")
+        request_id = request.get("id")
+        is_notification = "id" not in request
+        method = request["method"]
+        if method != "shutdown" and method not in self.METHODS:
+            response = self._error(request_id, self.METHOD_NOT_FOUND, f"Method not found: {method}")
+        else:
+            params = request.get("params", {})
+            try:
+                self._check_params(method, params)
+            except TypeError as e:
+                response = self._error(request_id, self.INVALID_PARAMS, f"Invalid params: {e}")
+            else:
+                # 実行中に起きたTypeErrorは引数の誤りではないため、内部エラーとして返す
                 try:
-                    if item.exists() and not any(item.iterdir()):
-                        item.rmdir()
-                except OSError as e:
-                    print(f"警告: 移動元.vscodeディレクトリの削除に失敗: {e}")
+                    result = self._call(method, params, request_id)
+                    response = {"jsonrpc": "2.0", "id": request_id, "result": result}
+                except PicoProjectError as e:
+                    response = self._error(request_id, self.OPERATION_ERROR, str(e), e.to_dict())
+                except Exception as e:
+                    response = self._error(request_id, self.INTERNAL_ERROR, f"{type(e).__name__}: {e}")
+        return None if is_notification else response
+
+    def serve(self) -> int:
+        # EOFまたはshutdownまで要求を処理
+        for line in self.reader:
+            if not line.strip():
+                continue
+            try:
+                message = json.loads(line)
+            except ValueError as e:
+                self.send(self._error(None, self.PARSE_ERROR, f"Parse error: {e}"))
                 continue
+            if isinstance(message, list):
+                responses = [r for r in (self.handle(m) for m in message) if r is not None]
+                if responses or not message:
+                    self.send(responses or self._error(None, self.INVALID_REQUEST, "Invalid Request"))
+            else:
+                response = self.handle(message)
+                if response is not None:
+                    self.send(response)
+            if not self.running:
+                break
+        return 0
 
-            # その他のファイル/ディレクトリの移動
-            dst_item = dst_dir / item.name
+
+# inotify(7) のイベントとフラグ
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+
+class Inotify:
+    # Linuxのinotifyをctypesで使う最小限のラッパー
+
+    _EVENT = struct.Struct("iIII")
+
+    def __init__(self):
+        if not sys.platform.startswith("linux"):
+            raise OSError(errno.ENOSYS, "inotify はLinuxでのみ使用できます")
+        import ctypes
+        self._ctypes = ctypes
+        self._libc = ctypes.CDLL(None, use_errno=True)
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self.fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._poll = select.poll()
+        self._poll.register(self.fd, select.POLLIN)
+
+    def add_watch(self, path: Path, mask: int) -> int:
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(path), mask)
+        if wd < 0:
+            err = self._ctypes.get_errno()
+            raise OSError(err, os.strerror(err), str(path))
+        return wd
+
+    def rm_watch(self, wd: int) -> None:
+        self._libc.inotify_rm_watch(self.fd, wd)
+
+    def read(self, timeout: Optional[float]) -> List[tuple[int, int, str]]:
+        # イベントが届くまで最大timeout秒待ち、届いたイベントをまとめて(wd, mask, 名前)で返す
+        if not self._poll.poll(None if timeout is None else max(timeout, 0) * 1000):
+            return []
+        events = []
+        while True:
             try:
-                if item.is_dir():
-                    shutil.move(str(item), str(dst_item))
-                else:
-                    shutil.move(str(item), str(dst_item))
-                moved_count += 1
-            except OSError as e:
-                print(f"警告: {item.name} の移動に失敗: {e}")
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self._EVENT.unpack_from(data, offset)
+                offset += self._EVENT.size
+                name = data[offset:offset + length].rstrip(b"\0")
+                offset += length
+                events.append((wd, mask, os.fsdecode(name)))
+        return events
 
-        print(f"{moved_count} 個のファイル/ディレクトリを移動しました")
+    def close(self) -> None:
+        os.close(self.fd)
 
-        # 移動元ディレクトリを削除
-        try:
-            src_dir.rmdir()
-            print(f"移動元ディレクトリ {init_dir} を削除しました")
-        except OSError as e:
-            print(f"警告: 移動元ディレクトリの削除に失敗: {e}")
 
-    def update_cmake_project_name(self, init_dir: str) -> None:
-        # CMakeLists.txtのプロジェクト名と実行可能ファイル名を更新
-        cmake_file = self.root_dir / "CMakeLists.txt"
+class ProjectWatcher:
+    # ワークスペース直下に作成されたPicoプロジェクトを検出し、生成が終わったらその場で展開する常駐処理
+    # 新しいディレクトリ以下をinotifyで監視し、CMakeLists.txtがあり一定時間（quiet秒）変更がなければ完成とみなす
+    # 利用者が作成中のライブラリなどを展開しないよう、Pico拡張機能が生成するファイル（pico_sdk_import.cmakeと
+    # CMakeLists.txtのpico_sdk_init()）があるものか、namesで指定した名前のディレクトリだけを対象にする
+    ROOT_MASK = IN_CREATE | IN_MOVED_TO | IN_ONLYDIR
+    TREE_MASK = (IN_CREATE | IN_MODIFY | IN_CLOSE_WRITE | IN_ATTRIB | IN_MOVED_FROM | IN_MOVED_TO
+                 | IN_DELETE | IN_DELETE_SELF | IN_ONLYDIR)
+    IGNORED_NAMES = {"build"}
+    SDK_INIT_RE = re.compile(r'^\s*pico_sdk_init\s*\(', re.MULTILINE)
 
-        if not cmake_file.exists():
-            print("警告: CMakeLists.txt が見つかりません。プロジェクト名の書き換えをスキップします。")
-            return
-
-        print(f"CMakeLists.txt のプロジェクト名を {self.project_name} に変更中...")
-
-        try:
-            # ファイルを読み込み
-            with open(cmake_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-
-            # 1. project()行のプロジェクト名を置換
-            project_pattern = rf'^(\s*project\s*\(\s*){re.escape(init_dir)}(\s+.*?)$'
-            project_replacement = rf'\1{self.project_name}\2'
-
-            updated_content, project_count = re.subn(
-                project_pattern,
-                project_replacement,
-                content,
-                flags=re.MULTILINE
-            )
-
-            # 2. add_executable()行の実行可能ファイル名を置換
-            # 一般的なパターン: add_executable(old_name ...)
-            executable_pattern = rf'^(\s*add_executable\s*\(\s*){re.escape(init_dir)}(\s+.*?)$'
-            executable_replacement = rf'\1{self.project_name}\2'
-
-            updated_content, executable_count = re.subn(
-                executable_pattern,
-                executable_replacement,
-                updated_content,
-                flags=re.MULTILINE
-            )
-
-            # 3. pico_set_program_name()行を置換
-            program_name_pattern = rf'^(\s*pico_set_program_name\s*\(\s*){re.escape(init_dir)}(\s+.*?)$'
-            program_name_replacement = rf'\1{self.project_name}\2'
-
-            updated_content, program_name_count = re.subn(
-                program_name_pattern,
-                program_name_replacement,
-                updated_content,
-                flags=re.MULTILINE
-            )
-
-            # 4. その他のターゲット参照も置換（target_link_libraries等）
-            other_target_pattern = rf'\b{re.escape(init_dir)}\b'
-            updated_content, other_count = re.subn(
-                other_target_pattern,
-                self.project_name,
-                updated_content
-            )
-
-            total_changes = project_count + executable_count + program_name_count + other_count
-
-            if total_changes > 0:
-                # ファイルに書き戻し
-                with open(cmake_file, 'w', encoding='utf-8') as f:
-                    f.write(updated_content)
-
-                print(f"CMakeLists.txt を更新しました")
-                print(
-                    f"更新箇所: project({project_count}) executable({executable_count}) program_name({program_name_count}) other({other_count})")
-
-                # 更新された重要な行を表示
-                for line in updated_content.split('\n'):
-                    line_stripped = line.strip()
-                    if (line_stripped.startswith('project(') or
-                        line_stripped.startswith('add_executable(') or
-                            line_stripped.startswith('pico_set_program_name(')):
-                        print(f"更新行: {line_stripped}")
-            else:
-                print("警告: 置換対象が見つかりませんでした")
-                print(f"検索対象: '{init_dir}' → '{self.project_name}'")
+    def __init__(self, root_dir: Path, run_project, quiet: float = 0.5, names: Optional[List[str]] = None):
+        # run_project(ディレクトリ名): 展開処理（成功したらTrue）
+        # names: 展開するディレクトリ名（指定した場合は、生成されたプロジェクトかどうかを判定せずこの名前だけを対象にする）
+        self.root_dir = root_dir
+        self.run_project = run_project
+        self.quiet = quiet
+        self.names = set(names) if names else None
+        # 生成されたプロジェクトではないと表示済みの候補（変更のたびに同じ表示をしない）
+        self._reported: set = set()
+        self.inotify = Inotify()
+        # wd -> (監視しているプロジェクト候補名, パス)（ワークスペース直下はNone）
+        self.watches: Dict[int, tuple[Optional[str], Path]] = {}
+        # 最後に変更があった時刻（完成待ちのプロジェクト候補のみ）
+        self.pending: Dict[str, float] = {}
+        self.inotify_root = self.inotify.add_watch(root_dir, self.ROOT_MASK)
+        self.watches[self.inotify_root] = (None, root_dir)
 
-        except IOError as e:
-            print(f"エラー: CMakeLists.txt の更新に失敗: {e}")
-        except re.error as e:
-            print(f"エラー: 正規表現エラー: {e}")
+    def _is_candidate(self, name: str) -> bool:
+        if self.names is not None:
+            return name in self.names
+        return not name.startswith(".") and name not in self.IGNORED_NAMES
 
-    def cleanup_build_artifacts(self) -> None:
-        # 最終的なビルド成果物のクリーンアップ
-        build_dir = self.root_dir / "build"
-        if build_dir.exists():
-            print("既存のbuildディレクトリを削除...")
+    @classmethod
+    def is_generated_project(cls, path: Path) -> bool:
+        # Pico拡張機能が生成したプロジェクトかどうか
+        if not (path / "pico_sdk_import.cmake").is_file():
+            return False
+        try:
+            return cls.SDK_INIT_RE.search((path / "CMakeLists.txt").read_text(encoding='utf-8')) is not None
+        except (OSError, UnicodeDecodeError):
+            return False
+
+    def _is_ready(self, name: str) -> bool:
+        # 展開してよいプロジェクトかどうか（CMakeLists.txtがなければまだ生成途中）
+        path = self.root_dir / name
+        if not (path / "CMakeLists.txt").is_file():
+            return False
+        if self.names is not None or self.is_generated_project(path):
+            return True
+        if name not in self._reported:
+            self._reported.add(name)
+            print(f"{name} はPicoプロジェクトとして生成されたものではないため展開しません"
+                  "（pico_sdk_import.cmake と pico_sdk_init() がありません。展開する場合は --name で指定してください）")
+        return False
+
+    def _watch_tree(self, name: str, path: Path, pending: bool = True) -> None:
+        # path以下のディレクトリをすべて監視（監視開始前に作成されていたサブディレクトリも含める）
+        # pendingがFalseの場合は、次に変更があるまで完成待ちにしない
+        for dirpath, dirnames, _ in os.walk(path):
             try:
-                shutil.rmtree(build_dir)
-                print("buildディレクトリを削除しました")
-            except OSError as e:
-                print(f"警告: buildディレクトリの削除に失敗: {e}")
+                wd = self.inotify.add_watch(Path(dirpath), self.TREE_MASK)
+            except OSError:
+                dirnames[:] = []  # 監視する前に削除された
+                continue
+            self.watches[wd] = (name, Path(dirpath))
+        if pending:
+            self.pending[name] = time.monotonic()
 
-    def print_completion_message(self) -> None:
-        # 完了メッセージを表示
-        print()
-        print("=" * 50)
-        print("スクリプト完了")
-        print("=" * 50)
-        print()
-        print("次の手順:")
-        print("1. [Ctrl+Shift+P] でコマンドパレットを開く")
-        print("2. 'Developer: Reload Window' を選択してVSCodeを再読み込み")
-        print("3. CMakeが自動的に再構成されることを確認")
-        print()
-        print(f"プロジェクト名: {self.project_name}")
-        print("環境変数 PROJECT_NAME が設定されています")
-        print("=" * 50)
+    def _unwatch(self, name: str) -> None:
+        for wd, (candidate, _) in list(self.watches.items()):
+            if candidate == name:
+                self.inotify.rm_watch(wd)
+                del self.watches[wd]
+        self.pending.pop(name, None)
 
-    def move_project(self, init_dir: str) -> None:
-        # プロジェクト移動のメイン処理
+    def _handle(self, events: List[tuple[int, int, str]]) -> None:
+        # イベントをプロジェクト候補ごとの最終変更時刻にまとめる
+        now = time.monotonic()
+        for wd, mask, name in events:
+            if mask & IN_Q_OVERFLOW:
+                # イベントが溢れた場合は、監視中の候補すべてに変更があったとみなす
+                for candidate in {c for c, _ in self.watches.values() if c is not None}:
+                    self.pending[candidate] = now
+                continue
+            if wd not in self.watches:
+                continue
+            candidate, path = self.watches[wd]
+            if mask & IN_IGNORED:
+                del self.watches[wd]
+                continue
+            if candidate is None:
+                if mask & IN_ISDIR and self._is_candidate(name):
+                    self._watch_tree(name, path / name)
+                continue
+            if mask & IN_DELETE_SELF and path == self.root_dir / candidate:
+                self._unwatch(candidate)
+                continue
+            if mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                self._watch_tree(candidate, path / name)
+            self.pending[candidate] = now
+
+    def _handle_after_run(self, touched: set) -> None:
+        # 展開中に溜まったイベントを処理する（展開処理がワークスペース直下に作ったtouchedの要素のイベントだけを除く）
+        # 展開中に別のプロジェクトが生成された場合も、そのイベントを捨てずに検出する
+        while events := self.inotify.read(0):
+            self._handle([(wd, mask, name) for wd, mask, name in events
+                          if not (wd == self.inotify_root and name in touched)])
+
+    def run(self, once: bool = False, existing: bool = False) -> int:
+        # 監視を開始（onceの場合は1つ展開したら終了）
+        if existing:
+            for entry in os.scandir(self.root_dir):
+                if entry.is_dir(follow_symlinks=False) and self._is_candidate(entry.name):
+                    self._watch_tree(entry.name, Path(entry.path))
+        print(f"{self.root_dir} を監視しています（Ctrl+C で終了）")
         try:
-            # ディレクトリ検証
-            src_dir, dst_dir = self.validate_directories(init_dir)
+            while True:
+                now = time.monotonic()
+                deadlines = [last + self.quiet for last in self.pending.values()]
+                timeout = max(min(deadlines) - now, 0) if deadlines else None
+                self._handle(self.inotify.read(timeout))
 
-            # .envファイル作成
-            self.create_env_file()
+                now = time.monotonic()
+                for name, last in list(self.pending.items()):
+                    if now - last < self.quiet:
+                        continue
+                    del self.pending[name]
+                    if not self._is_ready(name):
+                        continue  # まだプロジェクトではない（変更があれば再度判定する）
+                    print(f"\n新しいプロジェクト {name} を検出しました"
+                          f"（最後の変更から {(now - last) * 1000:.0f} ms）")
+                    self._unwatch(name)
+                    path = self.root_dir / name
+                    try:
+                        touched = set(os.listdir(path))
+                    except OSError:
+                        touched = set()
+                    start = time.perf_counter()
+                    ok = self.run_project(name)
+                    self._handle_after_run(touched)
+                    if not ok and path.is_dir():
+                        # 失敗したプロジェクトは監視を続け、修正されたら展開をやり直す
+                        self._watch_tree(name, path, pending=False)
+                    self.pending = {n: t for n, t in self.pending.items() if (self.root_dir / n).exists()}
+                    print(f"{name} の展開に{'成功' if ok else '失敗'}しました"
+                          f"（{(time.perf_counter() - start) * 1000:.0f} ms）")
+                    if once:
+                        return 0 if ok else 1
+        except KeyboardInterrupt:
+            print("\n監視を終了しました")
+            return 0
+        finally:
+            self.inotify.close()
 
-            # .gitignoreマージ
-            self.merge_gitignore(src_dir)
 
-            # extensions.jsonマージ（ファイル移動の前に実行）
-            self.merge_extensions_json(src_dir)
+def _cmd_batch(argv: List[str]) -> int:
+    # batchサブコマンド: 複数プロジェクトを並列に移動
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py batch",
+        description="複数のPicoプロジェクトを並列に移動します")
+    parser.add_argument("--job", nargs=3, action="append", default=[],
+                        metavar=("SOURCE", "DEST_ROOT", "NAME"),
+                        help="移動元ディレクトリ, 展開先ルート, プロジェクト名 (複数指定可)")
+    parser.add_argument("--manifest", type=Path,
+                        help="ジョブ一覧を記述したJSONファイル")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="並列ワーカー数 (既定: CPU数)")
+    parser.add_argument("--report", type=Path,
+                        help="ジョブごとの結果をJSONで書き出すファイル")
+    parser.add_argument("--show-logs", action="store_true",
+                        help="成功したジョブの出力も表示する")
+    args = parser.parse_args(argv)
 
-            # ビルドディレクトリクリーンアップ
-            self.cleanup_build_directory(src_dir)
+    jobs = [BatchJob(Path(src).absolute(), Path(dst).absolute(), name)
+            for src, dst, name in args.job]
+    if args.manifest:
+        try:
+            jobs.extend(load_batch_manifest(args.manifest))
+        except (IOError, json.JSONDecodeError, PicoProjectError) as e:
+            print(f"エラー: マニフェストの読み込みに失敗: {e}")
+            return 1
+    if not jobs:
+        parser.error("--job または --manifest でジョブを指定してください")
 
-            # プロジェクトファイル移動
-            self.move_project_files(src_dir, dst_dir, init_dir)
+    start = time.perf_counter()
+    try:
+        results = run_batch(jobs, args.workers)
+    except KeyboardInterrupt:
+        print("\n処理が中断されました")
+        return 1
+    elapsed = time.perf_counter() - start
 
-            # CMakeLists.txtのプロジェクト名更新
-            self.update_cmake_project_name(init_dir)
+    print_batch_summary(results, elapsed, args.show_logs)
 
-            # 最終クリーンアップ
-            self.cleanup_build_artifacts()
+    if args.report:
+        report = {
+            "elapsed": elapsed,
+            "jobs": [{
+                "source": str(r.job.source),
+                "dest": str(r.job.dest_root),
+                "name": r.job.project_name,
+                "ok": r.ok,
+                "elapsed": r.elapsed,
+                "error": r.error,
+                "log": r.log,
+            } for r in results],
+        }
+        try:
+            with open(args.report, 'w', encoding='utf-8') as f:
+                json.dump(report, f, indent='\t', ensure_ascii=False)
+                f.write('\n')
+        except IOError as e:
+            print(f"警告: 結果ファイルの書き込みに失敗: {e}")
 
-            # 完了メッセージ
-            self.print_completion_message()
+    return 0 if all(r.ok for r in results) else 1
 
-        except KeyboardInterrupt:
-            print("\n処理が中断されました")
-            sys.exit(1)
-        except Exception as e:
-            print(f"\n予期しないエラーが発生しました: {e}")
-            print("詳細なエラー情報:")
-            import traceback
-            traceback.print_exc()
-            sys.exit(1)
 
+def _cmd_move(argv: List[str]) -> int:
+    # 従来の単一プロジェクト移動
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py",
+        description="初期化されたPicoプロジェクトをワークスペースに展開します",
+        epilog="使用例: ./move_pico_project.py temp_project")
+    parser.add_argument("init_dir", nargs="?",
+                        help="初期化されたプロジェクトディレクトリ名")
+    parser.add_argument("--rollback", action="store_true",
+                        help="中断された移動処理で完了済みの操作を元に戻す")
+    parser.add_argument("--sync", action="store_true",
+                        help="既存のワークスペースに、再生成したプロジェクトとの差分だけを反映する")
+    parser.add_argument("--record-sync", action="store_true",
+                        help="後で --sync と rename を使えるよう、展開した内容を .pico_sync/ に記録する")
+    parser.add_argument("--plan", action="store_true",
+                        help="何も変更せず、移動計画（操作一覧と必要な空き容量）をJSONで出力する")
+    parser.add_argument("--trace", type=Path, metavar="PATH",
+                        help="各フェーズとファイル操作の所要時間・カウンタ・エラーをJSONで書き出す")
+    parser.add_argument("--trace-format", choices=["summary", "chrome"], default="summary",
+                        help="--traceの形式 (summary: サマリー, chrome: chrome://tracing 用のtrace event)")
+    parser.add_argument("--profile", type=Path, metavar="PATH",
+                        help="移動処理全体をcProfileで計測し、.pstats形式で書き出す")
+    parser.add_argument("--keep-build", action="store_true",
+                        help="buildディレクトリを削除せず、パスを書き換えて移動する（再ビルドを最小化）")
+    parser.add_argument("--no-rename-files", action="store_true",
+                        help="CMakeファイル以外の内容とファイル名に残る旧プロジェクト名を変更しない")
+    parser.add_argument("--rename", action="append", default=[], metavar="OLD=NEW",
+                        help="旧プロジェクト名以外に置換する名前 (複数指定可)")
+    parser.add_argument("--background-cleanup", action="store_true",
+                        help="buildディレクトリをゴミ箱へ移し、削除はバックグラウンドで行う")
+    parser.add_argument("--copy-workers", type=int, default=None, metavar="N",
+                        help="別のファイルシステムへ移動する場合の並列コピー数 (既定: 16)")
+    parser.add_argument("--wait-cleanup", action="store_true",
+                        help="--background-cleanup時も削除完了まで待つ")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="移動したファイルをコンテンツストアと共有し、プロジェクト間の重複を排除する")
+    parser.add_argument("--store", type=Path, metavar="DIR",
+                        help="--dedupeで使うコンテンツストア (既定: $PICO_STORE_DIR または ~/.cache/pico_project_store)")
+    parser.add_argument("--ccache", action="store_true",
+                        help="CMakeLists.txtにccacheを組み込み、移動後の再ビルドでSDKなどのコンパイル結果を再利用する")
+    parser.add_argument("--ccache-dir", type=Path, metavar="DIR",
+                        help="--ccacheのキャッシュディレクトリ (既定: $CCACHE_DIR または ~/.cache/ccache)")
+    parser.add_argument("--harvest", action="store_true",
+                        help="移動前のプロジェクトを create 用のテンプレートとして保存する")
+    parser.add_argument("--template-dir", type=Path, metavar="DIR",
+                        help="テンプレートキャッシュ (既定: $PICO_TEMPLATE_DIR または ~/.cache/pico_project_templates)")
+    parser.add_argument("--strip-components", type=int, default=None, metavar="N",
+                        help="アーカイブ取り込み時にメンバーの先頭から取り除くディレクトリ数 (既定: 自動判定)")
+    parser.add_argument("--archive-name", metavar="OLD",
+                        help="アーカイブ内のプロジェクト名 (既定: CMakeLists.txtのproject()の名前)")
+    args = parser.parse_args(argv)
+
+    if args.rollback:
+        return 0 if PicoProjectMover().rollback() else 1
 
-def main():
-    # メイン関数
     # 実行時引数チェック
-    if len(sys.argv) < 2:
+    if not args.init_dir:
         print("エラー: 初期化されたプロジェクトディレクトリ名を指定してください")
         print("使用例: ./move_pico_project.py temp_project")
-        sys.exit(1)
+        return 1
+
+    # PicoProjectMoverのインスタンス作成（--plan時はJSON以外の出力を標準エラーへ）
+    with contextlib.redirect_stdout(sys.stderr if args.plan else sys.stdout):
+        mover = PicoProjectMover()
+
+    # tar/zipが指定された場合はアーカイブから直接取り込む
+    archive = Path(args.init_dir)
+    if not archive.is_file():
+        archive = mover.root_dir / args.init_dir
+    archive = archive if is_archive(archive) else None
+    if archive is not None and (args.plan or args.sync):
+        parser.error("アーカイブからの取り込みでは --plan と --sync は使用できません")
+    if archive is None and (args.strip_components is not None or args.archive_name):
+        parser.error("--strip-components と --archive-name はアーカイブを指定した場合だけ使用できます")
+    if args.strip_components is not None and args.strip_components < 0:
+        parser.error("--strip-components には0以上の値を指定してください")
+
+    mover.background_cleanup = args.background_cleanup or args.wait_cleanup
+    mover.wait_cleanup = args.wait_cleanup
+    mover.keep_build = args.keep_build
+    mover.copy_workers = args.copy_workers
+    mover.dedupe = args.dedupe
+    mover.ccache = args.ccache or args.ccache_dir is not None
+    mover.ccache_dir = args.ccache_dir
+    mover.harvest = args.harvest
+    mover.template_dir = args.template_dir
+    mover.store_dir = args.store
+    mover.record_manifest = args.record_sync
+    mover.rename_files = not args.no_rename_files
+    for pair in args.rename:
+        old, sep, new = pair.partition("=")
+        if not sep or not old or not new:
+            parser.error(f"--rename は OLD=NEW の形式で指定してください: {pair}")
+        mover.extra_renames[old] = new
+
+    if args.plan:
+        # 何も変更せず、移動計画だけを出力
+        mover.build_index(args.init_dir)
+        plan = mover.compile_plan(args.init_dir)
+        print(json.dumps(plan, ensure_ascii=False, indent=2))
+        return 1 if plan["errors"] else 0
 
-    # PicoProjectMoverのインスタンス作成
-    mover = PicoProjectMover()
+    mover.trace_path = args.trace
+    mover.trace_format = args.trace_format
 
     # ヘッダー表示
     mover._print_header()
 
-    # 引数検証
-    init_dir = mover.validate_arguments(sys.argv)
+    # プロジェクト移動実行（--syncの場合は差分の反映）
+    run = mover.sync if args.sync else mover.move_project
+    if archive is not None:
+        run = lambda _: mover.import_project(archive, args.archive_name, args.strip_components)
+    if not args.profile:
+        run(args.init_dir)
+        return 0
 
-    # プロジェクト移動実行
-    mover.move_project(init_dir)
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        run(args.init_dir)
+    finally:
+        profiler.disable()
+        profiler.dump_stats(args.profile)
+        print(f"プロファイルを書き出しました: {args.profile}（python -m pstats {args.profile} で確認できます）")
+    return 0
+
+
+def _cmd_reclaim_trash(argv: List[str]) -> int:
+    # reclaim-trashサブコマンド: ゴミ箱に残ったbuildディレクトリを削除
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py reclaim-trash",
+        description=f"{TRASH_DIR_NAME} に移されたディレクトリを並列に削除します")
+    parser.add_argument("root_dir", nargs="?", type=Path,
+                        default=Path(__file__).parent.absolute(),
+                        help="ワークスペースのルートディレクトリ")
+    parser.add_argument("-j", "--workers", type=int, default=None,
+                        help="削除スレッド数")
+    args = parser.parse_args(argv)
+
+    reclaimer = TrashReclaimer(args.root_dir / TRASH_DIR_NAME, args.workers)
+    return 0 if reclaimer.reclaim() else 1
+
+
+def _cmd_gc(argv: List[str]) -> int:
+    # gcサブコマンド: コンテンツストアから参照されなくなった内容を削除
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py gc",
+        description="--dedupeで使うコンテンツストアから、どのワークスペースからも参照されていない内容を削除します")
+    parser.add_argument("--store", type=Path, metavar="DIR",
+                        help="コンテンツストア (既定: $PICO_STORE_DIR または ~/.cache/pico_project_store)")
+    parser.add_argument("--dry-run", action="store_true",
+                        help="削除せず、削除対象の数とサイズだけを表示する")
+    args = parser.parse_args(argv)
+
+    store = ContentStore(args.store)
+    try:
+        removed, freed = store.gc(dry_run=args.dry_run)
+    except OSError as e:
+        print(f"エラー: コンテンツストアの整理に失敗: {e}")
+        return 1
+    action = "削除対象" if args.dry_run else "削除しました"
+    print(f"{store.root}: {action} {removed} 個（{_format_bytes(freed)}）")
+    if store.stale_records:
+        print(f"ワークスペースがなくなった参照の記録: {len(store.stale_records)} 件"
+              f"{'（--dry-run のため残しています）' if args.dry_run else 'を削除しました'}")
+    return 0
+
+
+def _cmd_ccache_stats(argv: List[str]) -> int:
+    # ccache-statsサブコマンド: 移動後のビルドでのコンパイラキャッシュのヒット率を表示
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py ccache-stats",
+        description="--ccacheで組み込んだコンパイラキャッシュの、移動後のビルドでのヒット率を表示します")
+    parser.add_argument("root_dir", nargs="?", type=Path,
+                        default=Path(__file__).parent.absolute(),
+                        help="ワークスペースのルートディレクトリ")
+    args = parser.parse_args(argv)
+
+    try:
+        with open(args.root_dir / CompilerCache.BASELINE_FILE, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    except (OSError, ValueError):
+        print(f"エラー: {CompilerCache.BASELINE_FILE} がありません。--ccache を指定して移動してください")
+        return 1
+    cache = CompilerCache(Path(baseline["cache_dir"]))
+    counters = cache.stats()
+    if counters is None:
+        print("エラー: ccache の統計を取得できません（ccache 4.0 以降が必要です）")
+        return 1
+    hits, misses = CompilerCache.hit_rate(baseline.get("stats", {}), counters)
+    if hits + misses == 0:
+        print("移動後のコンパイルはまだありません")
+        return 0
+    print(f"コンパイラキャッシュ ({cache.cache_dir}): 移動後のコンパイル {hits + misses} 件, "
+          f"ヒット {hits} / ミス {misses}（ヒット率 {hits * 100 / (hits + misses):.1f}%）")
+    return 0
+
+
+def _cmd_serve(argv: List[str]) -> int:
+    # serveサブコマンド: 標準入出力でJSON-RPCの要求を処理し続ける
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py serve",
+        description="標準入出力で1行1メッセージのJSON-RPC 2.0を受け付け、"
+                    "move / sync / plan / rename / rollback を1つのプロセスで処理します")
+    parser.parse_args(argv)
+
+    # JSON-RPCのメッセージ以外（子プロセスの出力など）は標準エラーへ
+    writer = sys.stdout
+    with contextlib.redirect_stdout(sys.stderr):
+        try:
+            return JsonRpcServer(sys.stdin, writer).serve()
+        except KeyboardInterrupt:
+            return 0
+
+
+def _cmd_create(argv: List[str]) -> int:
+    # createサブコマンド: テンプレートキャッシュからワークスペースに直接プロジェクトを作成
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py create",
+        description="--harvestで保存したテンプレートから、生成と移動を経ずにワークスペースへ直接プロジェクトを作成します",
+        epilog="使用例: ./move_pico_project.py create --sdk 2.1.1 --board pico_w")
+    parser.add_argument("project_name", nargs="?",
+                        help="プロジェクト名 (既定: 環境変数PROJECT_NAME またはワークスペースのディレクトリ名)")
+    parser.add_argument("--root", type=Path, default=Path(__file__).parent.absolute(),
+                        help="ワークスペースのルートディレクトリ")
+    parser.add_argument("--list", action="store_true",
+                        help="保存済みのテンプレートを一覧表示する")
+    parser.add_argument("--template", metavar="KEY",
+                        help="使用するテンプレートのキー（先頭部分でも可）")
+    parser.add_argument("--sdk", metavar="VERSION",
+                        help="SDKバージョンで絞り込む")
+    parser.add_argument("--board", metavar="NAME",
+                        help="ボードで絞り込む")
+    parser.add_argument("--option", action="append", default=[], metavar="KEY=VALUE",
+                        help="オプション（libraries, stdio_usb など）で絞り込む (複数指定可)")
+    parser.add_argument("--template-dir", type=Path, metavar="DIR",
+                        help="テンプレートキャッシュ (既定: $PICO_TEMPLATE_DIR または ~/.cache/pico_project_templates)")
+    parser.add_argument("--no-rename-files", action="store_true",
+                        help="CMakeファイル以外の内容とファイル名のプロジェクト名を置き換えない")
+    parser.add_argument("--ccache", action="store_true",
+                        help="CMakeLists.txtにccacheを組み込む")
+    parser.add_argument("--dedupe", action="store_true",
+                        help="作成したファイルをコンテンツストアと共有する")
+    parser.add_argument("--record-sync", action="store_true",
+                        help="後で --sync を使えるよう、展開した内容を .pico_sync/ に記録する")
+    parser.add_argument("--trace", type=Path, metavar="PATH",
+                        help="各フェーズとファイル操作の計測結果をJSONで書き出す")
+    args = parser.parse_args(argv)
+
+    cache = TemplateCache(args.template_dir)
+    if args.list:
+        templates = cache.templates()
+        if not templates:
+            print(f"{cache.root} に保存済みのテンプレートはありません")
+        for metadata in templates:
+            print(f"{TemplateCache.summary(metadata)} {len(metadata['files'])} ファイル, "
+                  f"保存: {metadata.get('harvested_at', '')[:19]}")
+        return 0
+
+    options = {}
+    for pair in args.option:
+        key, sep, value = pair.partition("=")
+        if not sep or not key:
+            parser.error(f"--option は KEY=VALUE の形式で指定してください: {pair}")
+        options[key] = value
+    try:
+        metadata = cache.select(args.template, args.sdk, args.board, options)
+    except PicoProjectError as e:
+        print(f"エラー: {e}")
+        return 1
+
+    mover = PicoProjectMover(args.root.absolute(), project_name=args.project_name)
+    mover.template_dir = args.template_dir
+    mover.rename_files = not args.no_rename_files
+    mover.ccache = args.ccache
+    mover.dedupe = args.dedupe
+    mover.record_manifest = args.record_sync
+    mover.trace_path = args.trace
+    mover._print_header()
+    try:
+        mover.create_from_template(metadata)
+        mover.print_completion_message()
+    except PicoProjectError as e:
+        print(f"エラー: {e}")
+        return 1
+    finally:
+        mover.write_trace()
+    return 0
+
+
+def _cmd_watch(argv: List[str]) -> int:
+    # watchサブコマンド: ワークスペースを監視し、作成されたプロジェクトをその場で展開
+    parser = argparse.ArgumentParser(
+        prog="move_pico_project.py watch",
+        description="ワークスペース直下に作成されたPicoプロジェクトを検出し、生成が終わったらすぐに展開します")
+    parser.add_argument("root_dir", nargs="?", type=Path,
+                        default=Path(__file__).parent.absolute(),
+                        help="ワークスペースのルートディレクトリ")
+    parser.add_argument("--quiet-ms", type=int, default=500,
+                        help="この時間（ミリ秒）変更がなければ生成完了とみなす (既定: 500)")
+    parser.add_argument("--once", action="store_true",
+                        help="1つのプロジェクトを展開したら終了する")
+    parser.add_argument("--existing", action="store_true",
+                        help="監視開始時に既にあるディレクトリも対象にする")
+    parser.add_argument("--keep-build", action="store_true",
+                        help="buildディレクトリを削除せず、パスを書き換えて移動する")
+    parser.add_argument("--background-cleanup", action="store_true",
+                        help="buildディレクトリをゴミ箱へ移し、削除はバックグラウンドで行う")
+    parser.add_argument("--harvest", action="store_true",
+                        help="展開前のプロジェクトを create 用のテンプレートとして保存する")
+    parser.add_argument("--record-sync", action="store_true",
+                        help="再生成時に差分を同期できるよう、展開した内容を .pico_sync/ に記録する")
+    parser.add_argument("--name", action="append", default=[], metavar="DIR",
+                        help="展開するディレクトリ名（複数指定可。指定した場合は生成されたプロジェクトかどうかを判定しない）")
+    args = parser.parse_args(argv)
+    root_dir = args.root_dir.absolute()
+
+    def run_project(name: str) -> bool:
+        # 検出したプロジェクトを展開（既に展開済みのワークスペースなら差分を同期）
+        mover = PicoProjectMover(root_dir=root_dir)
+        mover.keep_build = args.keep_build
+        mover.background_cleanup = args.background_cleanup
+        mover.harvest = args.harvest
+        mover.record_manifest = args.record_sync
+        try:
+            if (root_dir / "CMakeLists.txt").exists() and SyncManifest(root_dir).exists():
+                mover.print_sync_report(mover.sync_project(name))
+            else:
+                mover.execute(name)
+                mover.print_completion_message()
+            return True
+        except PicoProjectError as e:
+            print(f"エラー: {e}")
+        except Exception as e:
+            print(f"予期しないエラーが発生しました: {e}")
+        return False
+
+    try:
+        watcher = ProjectWatcher(root_dir, run_project, args.quiet_ms / 1000, args.name)
+    except OSError as e:
+        print(f"エラー: 監視を開始できません: {e}")
+        return 1
+    return watcher.run(once=args.once, existing=args.existing)
+
+
+# サブコマンド名と処理関数の対応（該当しない場合は従来の移動処理）
+COMMANDS = {
+    "batch": _cmd_batch,
+    "ccache-stats": _cmd_ccache_stats,
+    "create": _cmd_create,
+    "gc": _cmd_gc,
+    "reclaim-trash": _cmd_reclaim_trash,
+    "serve": _cmd_serve,
+    "watch": _cmd_watch,
+}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    # メイン関数
+    argv = sys.argv[1:] if argv is None else argv
+    if argv and argv[0] in COMMANDS:
+        return COMMANDS[argv[0]](argv[1:])
+    return _cmd_move(argv)
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
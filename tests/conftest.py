@@ -0,0 +1,68 @@
+import logging
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+import move_pico_project as mpp  # noqa: E402
+
+
+def make_project(parent: Path, name: str = "temp_project") -> Path:
+    # 拡張機能が生成するものに近いPicoプロジェクトを作る
+    project = parent / name
+    (project / ".vscode").mkdir(parents=True)
+    (project / "lib" / "sub").mkdir(parents=True)
+    (project / "build" / "CMakeFiles" / f"{name}.dir").mkdir(parents=True)
+    (project / "CMakeLists.txt").write_text(
+        "cmake_minimum_required(VERSION 3.13)\n"
+        f"# {name} comment should stay\n"
+        "include(pico_sdk_import.cmake)\n"
+        f"project({name} C CXX ASM)\n"
+        "pico_sdk_init()\n"
+        f"add_executable({name} {name}.c )\n"
+        f"pico_set_program_name({name} \"{name}\")\n"
+        f"target_link_libraries({name} pico_stdlib)\n"
+        f"pico_add_extra_outputs({name})\n")
+    (project / "pico_sdk_import.cmake").write_text("set(PICO_SDK_PATH $ENV{PICO_SDK_PATH})\n")
+    (project / f"{name}.c").write_text(f'#include "{name}.h"\nint main() {{ return 0; }}\n')
+    (project / f"{name}.h").write_text("#pragma once\n")
+    (project / "lib" / "sub" / "x.c").write_text("int x;\n")
+    (project / ".gitignore").write_text("build\n*.o\n")
+    (project / ".vscode" / "extensions.json").write_text(
+        '{"recommendations": ["raspberry-pi.raspberry-pi-pico", "ms-vscode.cpptools",],}')
+    (project / ".vscode" / "settings.json").write_text(
+        '{\n  // comment\n  "cmake.generator": "Ninja",\n}\n')
+    (project / "build" / "CMakeCache.txt").write_text(f"CMAKE_HOME_DIRECTORY:INTERNAL={project}\n")
+    (project / "build" / "CMakeFiles" / f"{name}.dir" / "main.obj").write_bytes(b"\0obj")
+    return project
+
+
+def make_workspace(root: Path) -> Path:
+    # テンプレートリポジトリ相当のワークスペースと、その中に生成されたtemp_project
+    (root / ".vscode").mkdir(parents=True)
+    (root / ".gitignore").write_text("# workspace\n.env\n")
+    (root / ".vscode" / "extensions.json").write_text('{"recommendations": ["ms-vscode.cmake-tools"]}\n')
+    make_project(root)
+    return root
+
+
+@pytest.fixture
+def workspace(tmp_path: Path) -> Path:
+    return make_workspace(tmp_path / "ws")
+
+
+@pytest.fixture
+def logger() -> logging.Logger:
+    log = logging.getLogger("move_pico_project.tests")
+    log.propagate = False
+    return log
+
+
+@pytest.fixture
+def move(workspace, logger):
+    # ライブラリAPIでworkspaceのtemp_projectを展開する
+    def run(init_dir: str = "temp_project", project_name: str = "beta", **options):
+        return mpp.run_move(workspace, init_dir, project_name, logger=logger, **options)
+    return run
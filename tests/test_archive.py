@@ -0,0 +1,137 @@
+import io
+import os
+import shutil
+import tarfile
+import zipfile
+from pathlib import Path
+
+import pytest
+
+import move_pico_project as mpp
+from conftest import make_workspace
+
+
+def tree(root: Path) -> dict:
+    # 比較用のファイル一覧と内容（スクリプトの管理ファイルを除く）
+    return {p.relative_to(root).as_posix(): p.read_bytes() for p in sorted(root.rglob("*"))
+            if p.is_file() and not p.relative_to(root).parts[0].startswith(".pico_")}
+
+
+def moved(root: Path, logger, data: bytes = b"") -> dict:
+    # 同じプロジェクトをディレクトリから移動した結果
+    make_workspace(root)
+    if data:
+        (root / "temp_project" / "data.txt").write_bytes(data)
+    mpp.run_move(root, "temp_project", "beta", logger=logger)
+    return tree(root)
+
+
+@pytest.fixture
+def expected(tmp_path, logger):
+    return moved(tmp_path / "expected", logger)
+
+
+def pack(workspace: Path, archive: Path, layout: str) -> Path:
+    # workspaceのtemp_projectをアーカイブにして削除する
+    project = workspace / "temp_project"
+    if archive.name.endswith(".zip"):
+        with zipfile.ZipFile(archive, "w") as z:
+            for path in sorted(project.rglob("*")):
+                z.write(path, path.relative_to(workspace).as_posix())
+    else:
+        mode = "w:gz" if archive.name.endswith(".gz") else "w"
+        with tarfile.open(archive, mode) as t:
+            if layout == "dir":
+                t.add(project, "temp_project")
+            elif layout == "dot":
+                t.add(project, ".")
+            else:
+                # tar -cf x.tar .vscode CMakeLists.txt ... と同じく、ディレクトリから順に並べる
+                for child in sorted(project.iterdir(), key=lambda p: (not p.is_dir(), p.name)):
+                    t.add(child, child.name)
+    shutil.rmtree(project)
+    return archive
+
+
+@pytest.mark.parametrize("name, layout", [
+    ("p.tar.gz", "dir"), ("p.zip", "dir"), ("p.tar", "flat"), ("p.tar", "dot")])
+def test_import_matches_directory_move(workspace, logger, tmp_path, expected, name, layout):
+    archive = pack(workspace, tmp_path / name, layout)
+    result = mpp.run_import(workspace, archive, "beta", logger=logger)
+    assert tree(workspace) == expected
+    assert result.warnings == []
+
+
+def test_flat_tar_with_archive_name(workspace, logger, tmp_path, expected):
+    archive = pack(workspace, tmp_path / "download-1.tar", "flat")
+    mpp.run_import(workspace, archive, "beta", archive_name="temp_project", logger=logger)
+    assert tree(workspace) == expected
+
+
+def test_old_name_comes_from_cmake_project(workspace, logger, tmp_path, expected):
+    # 先頭のディレクトリ名ではなく project() の名前を旧名にする
+    (workspace / "temp_project").rename(workspace / "download-1")
+    archive = tmp_path / "download-1.tar"
+    with tarfile.open(archive, "w") as t:
+        t.add(workspace / "download-1", "download-1")
+    shutil.rmtree(workspace / "download-1")
+    result = mpp.run_import(workspace, archive, "beta", logger=logger)
+    assert tree(workspace) == expected
+    assert result.warnings == []
+
+
+def test_warns_when_nothing_renamed(workspace, logger, tmp_path):
+    archive = pack(workspace, tmp_path / "p.tar", "dir")
+    result = mpp.run_import(workspace, archive, "beta", archive_name="other", logger=logger)
+    assert any("置換対象が見つかりませんでした" in w for w in result.warnings)
+
+
+def test_large_member_is_streamed(workspace, logger, tmp_path, monkeypatch):
+    # STREAM_LIMITを超えるメンバーも、チャンクの境界をまたぐ名前を含めて置換する
+    data = b"#include \"temp_project.h\" // temp_project\n" * 40
+    expected = moved(tmp_path / "expected", logger, data)
+    (workspace / "temp_project" / "data.txt").write_bytes(data)
+    archive = pack(workspace, tmp_path / "p.tar", "dir")
+    monkeypatch.setattr(mpp.ArchiveImporter, "STREAM_LIMIT", 64)
+    monkeypatch.setattr(mpp.ArchiveImporter, "CHUNK_SIZE", 16)
+    mpp.run_import(workspace, archive, "beta", logger=logger)
+    assert tree(workspace) == expected
+    assert b"temp_project" not in expected["data.txt"]
+
+
+def add_link(t: tarfile.TarFile, name: str, target: str) -> None:
+    info = tarfile.TarInfo(name)
+    info.type = tarfile.SYMTYPE
+    info.linkname = target
+    t.addfile(info)
+
+
+def test_chained_symlinks_cannot_escape(workspace, logger, tmp_path):
+    # 作成済みのリンクをたどると外を指すリンクや、その下のファイルを取り込まない
+    archive = pack(workspace, tmp_path / "p.tar", "dir")
+    with tarfile.open(archive, "a") as t:
+        for name in ("temp_project/x", "temp_project/x/y", "temp_project/x/y/z"):
+            info = tarfile.TarInfo(name)
+            info.type = tarfile.DIRTYPE
+            t.addfile(info)
+        add_link(t, "temp_project/x/y/z/up", "../../..")
+        add_link(t, "temp_project/esc", "x/y/z/up/../../../..")
+        data = b"outside\n"
+        info = tarfile.TarInfo("temp_project/esc/OUTSIDE.txt")
+        info.size = len(data)
+        t.addfile(info, io.BytesIO(data))
+        # 後から作るリンク（dot -> .）で外を指すようになるリンク
+        add_link(t, "temp_project/late", "dot/../..")
+        add_link(t, "temp_project/dot", ".")
+    result = mpp.run_import(workspace, archive, "beta", logger=logger)
+
+    for parent in list(workspace.parents)[:4]:
+        assert not (parent / "OUTSIDE.txt").exists()
+    assert (workspace / "esc" / "OUTSIDE.txt").read_bytes() == b"outside\n"
+    root = os.path.realpath(workspace)
+    for path in workspace.rglob("*"):
+        if path.is_symlink():
+            assert os.path.commonpath([root, os.path.realpath(path)]) == root
+    assert not (workspace / "late").is_symlink()
+    assert (workspace / "x" / "y" / "z" / "up").is_symlink()
+    assert any("シンボリックリンク" in w for w in result.warnings)
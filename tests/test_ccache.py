@@ -0,0 +1,33 @@
+from pathlib import Path
+
+import move_pico_project as mpp
+
+
+def test_committed_block_has_no_user_path(workspace, move, monkeypatch):
+    # CMakeLists.txtには実行した利用者のキャッシュのパスを書き込まない
+    monkeypatch.setenv("CCACHE_DIR", "/home/someone/.cache/ccache")
+    move(ccache=True)
+    content = (workspace / "CMakeLists.txt").read_text(encoding='utf-8')
+    assert "/home/someone" not in content
+    assert 'set(PICO_CCACHE_DIR "$ENV{CCACHE_DIR}")' in content
+    assert not (workspace / mpp.CompilerCache.LOCAL_FILE).exists()
+    cache = mpp.CompilerCache.configured(workspace)
+    assert cache is not None and cache.override_dir is None
+    assert cache.cache_dir == Path("/home/someone/.cache/ccache")
+
+
+def test_explicit_dir_goes_to_local_file(workspace, move, tmp_path):
+    # --ccache-dirの指定はコミットしない .pico_ccache.cmake にだけ記録する
+    cache_dir = tmp_path / 'my "cache'
+    move(ccache=True, ccache_dir=cache_dir)
+    assert str(cache_dir) not in (workspace / "CMakeLists.txt").read_text(encoding='utf-8')
+    local = (workspace / mpp.CompilerCache.LOCAL_FILE).read_text(encoding='utf-8')
+    assert 'my \\"cache' in local
+    assert mpp.CompilerCache.configured(workspace).override_dir == cache_dir
+    gitignore = (Path(mpp.__file__).parent / ".gitignore").read_text(encoding='utf-8')
+    assert mpp.CompilerCache.LOCAL_FILE in gitignore.splitlines()
+
+
+def test_configured_without_block(workspace, move):
+    move()
+    assert mpp.CompilerCache.configured(workspace) is None
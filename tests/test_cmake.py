@@ -0,0 +1,76 @@
+import pytest
+
+import move_pico_project as mpp
+
+
+def rewrite(text: str, rename_files: bool = False) -> tuple[str, dict]:
+    return mpp.CMakeRenamer({"temp_project": "beta"}, rename_files=rename_files).rewrite(text)
+
+
+@pytest.mark.parametrize("before, after", [
+    # 引用符つき引数（エスケープした引用符を含む）
+    ('pico_set_program_name(temp_project "temp_project")\n',
+     'pico_set_program_name(beta "beta")\n'),
+    ('message("say \\"temp_project\\" (temp_project)")\n',
+     'message("say \\"beta\\" (beta)")\n'),
+    # ブラケット引数
+    ('message([[temp_project]] [==[a ]] temp_project]==])\n',
+     'message([[beta]] [==[a ]] beta]==])\n'),
+    # project()が定義する変数
+    ('target_include_directories(temp_project PRIVATE ${temp_project_SOURCE_DIR}/inc)\n',
+     'target_include_directories(beta PRIVATE ${beta_SOURCE_DIR}/inc)\n'),
+    ('if(temp_project_IS_TOP_LEVEL)\nendif()\n', 'if(beta_IS_TOP_LEVEL)\nendif()\n'),
+    # ジェネレータ式
+    ('add_custom_command(TARGET x COMMAND cp $<TARGET_FILE:temp_project> out)\n',
+     'add_custom_command(TARGET x COMMAND cp $<TARGET_FILE:beta> out)\n'),
+])
+def test_references_are_renamed(before, after):
+    updated, counts = rewrite(before)
+    assert updated == after
+    assert sum(counts.values()) == after.count("beta")
+
+
+@pytest.mark.parametrize("text", [
+    # コメントとブラケットコメント
+    "# temp_project (temp_project)\n",
+    "#[[ temp_project\nadd_executable(temp_project) ]]\n",
+    "add_executable(x #[=[ temp_project ]=] x.c) # temp_project\n",
+    # 名前を部分として含む識別子
+    "add_library(temp_project_lib my_temp_project temp-project_x temp_project-x)\n",
+    "set(X ${temp_project_FOO} ${temp_project_SOURCE_DIRS})\n",
+    # ファイル名を変えない場合のファイル参照
+    "add_executable(x temp_project.c src/temp_project)\n",
+    # コマンド引数ではない位置
+    "temp_project\n",
+])
+def test_unrelated_text_is_kept(text):
+    assert rewrite(text) == (text, {})
+
+
+def test_file_references_follow_rename_files():
+    text = "add_executable(temp_project temp_project.c src/temp_project.h)\n"
+    assert rewrite(text, rename_files=True)[0] == "add_executable(beta beta.c src/beta.h)\n"
+    assert rewrite(text)[0] == "add_executable(beta temp_project.c src/temp_project.h)\n"
+
+
+def test_counts_per_command():
+    _, counts = rewrite("project(temp_project)\nADD_EXECUTABLE(temp_project a.c)\n"
+                        "target_link_libraries(temp_project temp_project_lib)\n"
+                        "set_target_properties(temp_project PROPERTIES OUTPUT_NAME temp_project)\n")
+    assert counts == {"project": 1, "add_executable": 1, "target_link_libraries": 1,
+                      "set_target_properties": 2}
+
+
+def test_other_cmake_files_are_rewritten(workspace, move):
+    # CMakeLists.txt 以外の *.cmake とサブディレクトリのCMakeLists.txtも構文を見て書き換える
+    project = workspace / "temp_project"
+    (project / "cmake").mkdir()
+    (project / "cmake" / "flags.cmake").write_text(
+        "# temp_project flags\ntarget_compile_definitions(temp_project PRIVATE NAME=temp_project)\n")
+    (project / "lib" / "CMakeLists.txt").write_text(
+        "target_sources(temp_project PRIVATE ${temp_project_SOURCE_DIR}/lib/sub/x.c)\n")
+    move()
+    assert (workspace / "cmake" / "flags.cmake").read_text() == (
+        "# temp_project flags\ntarget_compile_definitions(beta PRIVATE NAME=beta)\n")
+    assert (workspace / "lib" / "CMakeLists.txt").read_text() == (
+        "target_sources(beta PRIVATE ${beta_SOURCE_DIR}/lib/sub/x.c)\n")
@@ -0,0 +1,166 @@
+import os
+
+import pytest
+
+import move_pico_project as mpp
+
+
+@pytest.fixture
+def cross_device(monkeypatch):
+    # 移動元と展開先が別のファイルシステムにある場合の経路（並列コピー）を使わせる
+    monkeypatch.setattr(mpp.PicoProjectMover, "_same_device", lambda self, a, b: False)
+
+
+def _tree(root):
+    (root / "sub").mkdir(parents=True)
+    (root / "a.c").write_text("int a;\n")
+    (root / "sub" / "b.c").write_text("int b;\n")
+    os.symlink("a.c", root / "link.c")
+    return root
+
+
+def test_copy_moves_tree_and_removes_source(tmp_path):
+    src = _tree(tmp_path / "src" / "lib")
+    dst = tmp_path / "dst" / "lib"
+    dst.parent.mkdir()
+
+    copier = mpp.ParallelCopier(workers=4)
+    results = copier.copy([(src, dst)])
+
+    assert results == {src: None}
+    assert not src.exists()
+    assert (dst / "sub" / "b.c").read_text() == "int b;\n"
+    assert os.readlink(dst / "link.c") == "a.c"
+    assert copier.files == 2
+
+
+def test_failed_copy_removes_only_what_it_created(tmp_path):
+    src = _tree(tmp_path / "src" / "lib")
+    os.mkfifo(src / "sub" / "pipe")
+    dst = tmp_path / "dst" / "lib"
+    dst.mkdir(parents=True)
+    (dst / "user_file.c").write_text("int user;\n")
+    (dst / "a.c").write_text("old a\n")
+    backed_up = []
+
+    results = mpp.ParallelCopier(before_write=backed_up.append).copy([(src, dst)])
+
+    assert results[src] is not None
+    assert sorted(p.name for p in dst.iterdir()) == ["a.c", "user_file.c"]
+    assert (dst / "user_file.c").read_text() == "int user;\n"
+    assert (dst / "a.c").read_text() == "old a\n" and backed_up == []
+    assert (src / "sub" / "b.c").exists()
+
+
+def test_failed_file_copy_keeps_existing_directory(tmp_path, monkeypatch):
+    src = _tree(tmp_path / "src" / "lib")
+    dst = tmp_path / "dst" / "lib"
+    dst.mkdir(parents=True)
+    (dst / "user_file.c").write_text("int user;\n")
+    copy_file = mpp.ParallelCopier._copy_file
+
+    def fail_on_b(self, src_file, dst_file, st):
+        if src_file.name == "b.c":
+            raise OSError("disk full")
+        return copy_file(self, src_file, dst_file, st)
+    monkeypatch.setattr(mpp.ParallelCopier, "_copy_file", fail_on_b)
+
+    results = mpp.ParallelCopier().copy([(src, dst)])
+
+    assert "disk full" in results[src]
+    assert sorted(p.name for p in dst.iterdir()) == ["user_file.c"]
+    assert (src / "a.c").exists()
+
+
+def test_move_fails_when_an_item_cannot_be_copied(workspace, move, cross_device):
+    (workspace / "lib").mkdir()
+    (workspace / "lib" / "user_file.c").write_text("int user;\n")
+    fifo = workspace / "temp_project" / "lib" / "pipe"
+    os.mkfifo(fifo)
+
+    with pytest.raises(mpp.PicoProjectError, match="lib"):
+        move()
+
+    assert (workspace / "lib" / "user_file.c").read_text() == "int user;\n"
+    assert not (workspace / "lib" / "sub").exists()
+    assert (workspace / "temp_project" / "lib" / "sub" / "x.c").exists()
+
+    fifo.unlink()
+    move()
+
+    assert (workspace / "lib" / "user_file.c").exists()
+    assert (workspace / "lib" / "sub" / "x.c").exists()
+    assert not (workspace / "temp_project").exists()
+
+
+def test_cross_device_move_matches_rename(workspace, move, cross_device):
+    result = move()
+
+    assert "project(beta C CXX ASM)" in (workspace / "CMakeLists.txt").read_text()
+    assert (workspace / "beta.c").exists()
+    assert not (workspace / "temp_project").exists()
+    assert result.trace["counters"]["bytes_copied"] > 0
+
+
+def test_symlink_does_not_replace_user_file(workspace, move, cross_device):
+    # 生成されたプロジェクトのリンクで利用者のファイルを黙って消さない
+    (workspace / "lib").mkdir()
+    (workspace / "lib" / "notes.c").write_text("user work\n")
+    os.symlink("sub/x.c", workspace / "temp_project" / "lib" / "notes.c")
+
+    with pytest.raises(mpp.PicoProjectError, match="lib"):
+        move()
+
+    notes = workspace / "lib" / "notes.c"
+    assert not notes.is_symlink() and notes.read_text() == "user work\n"
+    assert (workspace / "temp_project" / "lib" / "notes.c").is_symlink()
+    mpp.run_rollback(workspace)
+    assert notes.read_text() == "user work\n"
+    assert (workspace / "temp_project" / "lib" / "sub" / "x.c").exists()
+
+
+def test_existing_symlink_is_backed_up_before_replace(tmp_path):
+    src = _tree(tmp_path / "src" / "lib")
+    dst = tmp_path / "dst" / "lib"
+    dst.mkdir(parents=True)
+    os.symlink("elsewhere.c", dst / "link.c")
+    backed_up = []
+
+    results = mpp.ParallelCopier(before_write=backed_up.append).copy([(src, dst)])
+
+    assert results == {src: None}
+    assert backed_up == [dst / "link.c"]
+    assert os.readlink(dst / "link.c") == "a.c"
+
+
+def test_failed_copy_leaves_existing_file_intact(tmp_path, monkeypatch):
+    # 途中で失敗したコピーで既存のファイルを切り詰めない
+    src = _tree(tmp_path / "src" / "lib")
+    dst = tmp_path / "dst" / "lib"
+    dst.mkdir(parents=True)
+    (dst / "a.c").write_text("old a\n")
+
+    def short_copy(self, src_fd, dst_fd, size):
+        os.write(dst_fd, b"x")
+        return 1, "read/write"
+    monkeypatch.setattr(mpp.ParallelCopier, "_copy_data", short_copy)
+
+    results = mpp.ParallelCopier(before_write=lambda path: None).copy([(src, dst)])
+
+    assert results[src] is not None
+    assert (dst / "a.c").read_text() == "old a\n"
+    assert sorted(p.name for p in dst.iterdir()) == ["a.c"]
+
+
+def test_rollback_restores_replaced_symlink(workspace, move, cross_device):
+    (workspace / "lib").mkdir()
+    os.symlink("user.c", workspace / "lib" / "link.c")
+    os.symlink("sub/x.c", workspace / "temp_project" / "lib" / "link.c")
+    os.mkfifo(workspace / "temp_project" / "pipe")
+
+    with pytest.raises(mpp.PicoProjectError):
+        move()
+    assert os.readlink(workspace / "lib" / "link.c") == "sub/x.c"
+
+    mpp.run_rollback(workspace)
+    assert os.readlink(workspace / "lib" / "link.c") == "user.c"
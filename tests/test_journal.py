@@ -0,0 +1,130 @@
+import shutil
+
+import pytest
+
+import move_pico_project as mpp
+
+
+def _interrupt(monkeypatch, target, name):
+    # targetのnameを呼ぶと中断（Ctrl+C）されるようにする
+    def interrupted(*args, **kwargs):
+        raise KeyboardInterrupt
+    monkeypatch.setattr(target, name, interrupted)
+
+
+def test_resume_keeps_directory_that_existed_before_move(workspace, move, monkeypatch):
+    (workspace / "lib").mkdir()
+    (workspace / "lib" / "user_file.c").write_text("int user;\n")
+    real_move = shutil.move
+
+    def interrupted_on_lib(src, dst):
+        if src.endswith("lib"):
+            raise KeyboardInterrupt
+        return real_move(src, dst)
+    monkeypatch.setattr(mpp.shutil, "move", interrupted_on_lib)
+
+    with pytest.raises(KeyboardInterrupt):
+        move()
+    monkeypatch.undo()
+    assert (workspace / mpp.MoveJournal.DIR_NAME).exists()
+
+    move()
+
+    assert (workspace / "lib" / "user_file.c").read_text() == "int user;\n"
+    assert not (workspace / "temp_project").exists()
+
+
+def test_resume_discards_partial_copy_created_by_the_move(workspace, move, monkeypatch):
+    real_move = shutil.move
+
+    def partial_move(src, dst):
+        # コピーの途中で中断された状態を再現
+        if src.endswith("lib"):
+            shutil.copytree(src, dst)
+            (mpp.Path(dst) / "sub" / "x.c").write_text("trunc")
+            raise KeyboardInterrupt
+        return real_move(src, dst)
+    monkeypatch.setattr(mpp.PicoProjectMover, "_publish_by_rename", lambda self, src, dst: None)
+    monkeypatch.setattr(mpp.shutil, "move", partial_move)
+
+    with pytest.raises(KeyboardInterrupt):
+        move()
+    monkeypatch.setattr(mpp.shutil, "move", real_move)
+
+    move()
+
+    assert (workspace / "lib" / "sub" / "x.c").read_text() == "int x;\n"
+    assert not (workspace / "lib" / "lib").exists()
+
+
+def test_rollback_restores_overwritten_vscode_file(workspace, move, logger, monkeypatch):
+    (workspace / ".vscode" / "notes.txt").write_text("user notes\n")
+    (workspace / "temp_project" / ".vscode" / "notes.txt").write_text("generated notes\n")
+    _interrupt(monkeypatch, mpp.PicoProjectMover, "update_cmake_project_name")
+
+    with pytest.raises(KeyboardInterrupt):
+        move()
+    assert (workspace / ".vscode" / "notes.txt").read_text() == "generated notes\n"
+
+    result = mpp.run_rollback(workspace, logger=logger)
+
+    assert result.restored
+    assert (workspace / ".vscode" / "notes.txt").read_text() == "user notes\n"
+    assert (workspace / "temp_project" / ".vscode" / "notes.txt").read_text() == "generated notes\n"
+    assert (workspace / "temp_project" / "CMakeLists.txt").exists()
+    assert not (workspace / "CMakeLists.txt").exists()
+
+
+def _snapshot(root):
+    # 比較用のファイル一覧と内容（ジャーナルと、移動で削除されるbuildを除く）
+    return {p.relative_to(root).as_posix(): p.read_bytes() for p in sorted(root.rglob("*"))
+            if p.is_file() and not p.relative_to(root).parts[0].startswith(".pico_")
+            and "build" not in p.relative_to(root).parts}
+
+
+@pytest.fixture
+def interrupted_publish(workspace, move, monkeypatch):
+    # 最上位の要素を1つrenameで公開した後、2つ目のrenameの前（after=Falseなら）
+    # または直後の記録前（after=Trueなら）で中断する
+    def run(after):
+        real_rename = mpp._rename_noreplace
+        calls = []
+
+        def rename(src, dst):
+            calls.append(src)
+            if len(calls) == 2:
+                if after:
+                    real_rename(src, dst)
+                raise KeyboardInterrupt
+            real_rename(src, dst)
+        monkeypatch.setattr(mpp, "_rename_noreplace", rename)
+        with pytest.raises(KeyboardInterrupt):
+            move()
+        monkeypatch.setattr(mpp, "_rename_noreplace", real_rename)
+        assert (workspace / calls[0].name).exists()
+        assert (workspace / calls[1].name).exists() == after
+    return run
+
+
+@pytest.mark.parametrize("after", [False, True])
+def test_publish_interrupted_then_resumed(workspace, move, tmp_path, logger, interrupted_publish, after):
+    expected = tmp_path / "expected"
+    shutil.copytree(workspace, expected)
+    mpp.run_move(expected, "temp_project", "beta", logger=logger)
+    interrupted_publish(after)
+
+    move()
+
+    assert _snapshot(workspace) == _snapshot(expected)
+    assert not (workspace / mpp.MoveJournal.DIR_NAME).exists()
+
+
+@pytest.mark.parametrize("after", [False, True])
+def test_publish_interrupted_then_rolled_back(workspace, logger, interrupted_publish, after):
+    before = _snapshot(workspace)
+    interrupted_publish(after)
+
+    assert mpp.run_rollback(workspace, logger=logger).restored
+
+    assert _snapshot(workspace) == before
+    assert not (workspace / "CMakeLists.txt").exists()
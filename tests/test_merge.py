@@ -0,0 +1,49 @@
+import pytest
+
+import move_pico_project as mpp
+
+
+def test_merge_strategy_is_abstract():
+    class Incomplete(mpp.ConfigMergeStrategy):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+
+def test_jsonc_merge_keeps_comments_and_workspace_keys():
+    merged = mpp.JsoncMerge().merge('{\n  // user\n  "a": 1,\n}\n', '{"b": 2}')
+
+    assert "// user" in merged
+    assert mpp.parse_jsonc(merged).value.to_python() == {"a": 1, "b": 2}
+
+
+def test_launch_configurations_merge_by_name():
+    strategy = mpp.MERGE_STRATEGIES["launch.json"]
+    merged = strategy.merge('{"configurations": [{"name": "A", "x": 1}, {"name": "B"}]}',
+                            '{"configurations": [{"name": "A", "x": 2}, {"name": "C"}]}')
+
+    configurations = mpp.parse_jsonc(merged).value.to_python()["configurations"]
+    assert configurations == [{"name": "A", "x": 2}, {"name": "B"}, {"name": "C"}]
+
+
+def test_gitignore_merge_appends_only_new_lines():
+    merged = mpp.GitignoreMerge().merge("build\n.env\n", "build\n*.o\n")
+
+    assert merged.splitlines()[:2] == ["build", ".env"]
+    assert merged.count("build") == 1 and "*.o" in merged
+
+
+def test_registered_strategy_is_used(workspace, move):
+    class Replace(mpp.ConfigMergeStrategy):
+        def merge(self, dst_text, src_text):
+            return "merged\n"
+    (workspace / ".vscode" / "notes.txt").write_text("user\n")
+    (workspace / "temp_project" / ".vscode" / "notes.txt").write_text("generated\n")
+    mpp.register_merge_strategy("notes.txt", Replace())
+    try:
+        move()
+    finally:
+        del mpp.MERGE_STRATEGIES["notes.txt"]
+
+    assert (workspace / ".vscode" / "notes.txt").read_text() == "merged\n"
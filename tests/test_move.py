@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import move_pico_project as mpp
+from conftest import make_project
+
+
+def test_move_expands_and_renames(workspace, move):
+    result = move()
+
+    assert not (workspace / "temp_project").exists()
+    assert (workspace / "beta.c").read_text().startswith('#include "beta.h"')
+    cmake = (workspace / "CMakeLists.txt").read_text()
+    assert "project(beta C CXX ASM)" in cmake
+    assert "add_executable(beta beta.c )" in cmake
+    assert "# temp_project comment should stay" in cmake
+    assert (workspace / ".env").read_text() == "PROJECT_NAME=beta\n"
+    assert not (workspace / "build").exists()
+    assert not (workspace / mpp.MoveJournal.DIR_NAME).exists()
+    assert result.warnings == []
+
+
+def test_move_merges_gitignore_and_extensions(workspace, move):
+    move()
+
+    gitignore = (workspace / ".gitignore").read_text()
+    assert gitignore.startswith("# workspace\n.env\n")
+    assert "build" in gitignore and "*.o" in gitignore
+    extensions = json.loads((workspace / ".vscode" / "extensions.json").read_text())
+    assert extensions["recommendations"] == [
+        "ms-vscode.cmake-tools", "raspberry-pi.raspberry-pi-pico", "ms-vscode.cpptools"]
+
+
+def test_move_refuses_existing_project(workspace, move):
+    (workspace / "CMakeLists.txt").write_text("project(other)\n")
+
+    with pytest.raises(mpp.ProjectExistsError):
+        move()
+    assert (workspace / "temp_project" / "CMakeLists.txt").exists()
+
+
+def test_batch_moves_each_job(tmp_path):
+    jobs = []
+    for name in ("one", "two"):
+        dest = tmp_path / name
+        dest.mkdir()
+        make_project(dest)
+        jobs.append(mpp.BatchJob(dest / "temp_project", dest, name))
+
+    results = mpp.run_batch(jobs, workers=2)
+
+    assert all(result.ok for result in results), [result.error for result in results]
+    for name in ("one", "two"):
+        assert f"project({name} C CXX ASM)" in (tmp_path / name / "CMakeLists.txt").read_text()
+
+
+def test_batch_rejects_duplicate_destination(tmp_path):
+    make_project(tmp_path)
+    job = mpp.BatchJob(tmp_path / "temp_project", tmp_path, "x")
+
+    results = mpp.run_batch([job, job], workers=1)
+
+    assert sorted(result.ok for result in results) == [False, True]
+
+
+def test_failed_publish_keeps_merged_vscode_files_for_rename(workspace, move, monkeypatch):
+    (workspace / ".vscode" / "settings.json").write_text('{"user.custom": true}\n')
+    (workspace / "temp_project" / ".vscode" / "settings.json").write_text(
+        '{"cmake.buildDirectory": "${workspaceFolder}/build/temp_project"}\n')
+
+    rename_noreplace = mpp._rename_noreplace
+    calls = []
+
+    def fail_first(src, dst):
+        calls.append(src)
+        if len(calls) == 1:
+            raise OSError("rename refused")
+        rename_noreplace(src, dst)
+    monkeypatch.setattr(mpp, "_rename_noreplace", fail_first)
+
+    move()
+
+    settings = (workspace / ".vscode" / "settings.json").read_text()
+    assert '"user.custom": true' in settings
+    assert "build/beta" in settings and "temp_project" not in settings
+    assert (workspace / "beta.c").exists()
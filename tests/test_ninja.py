@@ -0,0 +1,86 @@
+import shutil
+import subprocess
+
+import pytest
+
+import move_pico_project as mpp
+
+# 実際のninjaで生成した .ninja_log のハッシュ（v5: ninja 1.11.1, v7: ninja 1.13.0）
+# 出力 o{n} のコマンドは n バイトで、MurmurHash64A と rapidhash のブロック境界の前後を通る
+REAL_LOG_HASHES = {
+    5: {0: "87c2bc0beaf1d91d", 1: "2e49d2477c6737f0", 3: "1ab5660abb4432c4", 4: "b9a48e6f8e220225",
+        7: "d8dc0c21fd8fc732", 8: "be92e53c86dafbcc", 15: "3146c68631d41ae", 16: "73a12edf9dc906bd",
+        17: "81b94b0f875fc26", 31: "764001003b1c3d21", 33: "6804617164132547", 47: "18117c47c1ac3618",
+        48: "16956cfe607ee836", 49: "e23ee56b240e5f19", 95: "f3ee64d425b1bd54", 96: "61171db3b84d57e0",
+        97: "81b3bb2d54e8b3bd", 150: "c214704e469748fe", 300: "f27dd6f0be2dcc6e"},
+    7: {0: "5a6ef77074ebc84b", 1: "a2da22321247804b", 3: "23eb4255a7ee54c2", 4: "d7a98807998bc28a",
+        7: "ad9ad1ccb64dfe36", 8: "9c6709a91dedec8d", 15: "74e006d5ef4dffd7", 16: "5db23f238b7de50f",
+        17: "81d26b0eddcec0f0", 31: "84ef44f404bf949b", 33: "e61e7309a73a4fb0", 47: "7f0a432d368c93a4",
+        48: "a70cf9def2370e1f", 49: "a61f0160ef2440a7", 95: "58248fe31251aaa2", 96: "69a198b27c1e253c",
+        97: "dca6d2b801229f26", 150: "7d0a31b700fe774e", 300: "a6d85d91d941fbb"},
+}
+
+
+def command(n: int) -> str:
+    # 末尾の空白もコマンドの一部になるように作る
+    if n == 0:
+        return ""
+    if n < 5:
+        return ":" + " " * (n - 1)
+    return "true " + "#" * (n - 5)
+
+
+def write_manifest(build_dir) -> None:
+    lines = ["rule r", "  command = $cmd"]
+    for n in REAL_LOG_HASHES[5]:
+        lines += [f"build o{n}: r", f"  cmd = {command(n)}"]
+    (build_dir / "build.ninja").write_text("\n".join(lines) + "\n")
+
+
+@pytest.mark.parametrize("version", sorted(REAL_LOG_HASHES))
+def test_hashes_match_real_ninja_log(tmp_path, version):
+    write_manifest(tmp_path)
+    manifest = mpp.NinjaManifest(tmp_path)
+    manifest.load(tmp_path / "build.ninja")
+    hash_func = mpp.NINJA_LOG_HASHES[version]
+    for n, expected in REAL_LOG_HASHES[version].items():
+        assert manifest.commands[f"o{n}"] == command(n)
+        assert format(hash_func(command(n).encode()), "x") == expected, n
+
+
+def test_v6_uses_murmur():
+    # v6 (ninja 1.12) はログの形式だけが変わり、ハッシュはv5と同じ
+    assert mpp.NINJA_LOG_HASHES[6] is mpp.NINJA_LOG_HASHES[5] is mpp._murmur_hash64a
+
+
+@pytest.mark.skipif(not (shutil.which("cmake") and shutil.which("ninja") and shutil.which("cc")),
+                    reason="cmake, ninja and a C compiler are required")
+def test_keep_build_round_trip(workspace, move):
+    # 実際のビルドツリーを引き継ぎ、名前に関係しないオブジェクトを再ビルドしない
+    project = workspace / "temp_project"
+    shutil.rmtree(project / "build")
+    (project / "CMakeLists.txt").write_text(
+        "cmake_minimum_required(VERSION 3.13)\n"
+        "project(temp_project C)\n"
+        "add_library(helper lib/sub/x.c)\n"
+        "add_executable(temp_project temp_project.c)\n"
+        "target_link_libraries(temp_project helper)\n")
+
+    def run(*args):
+        return subprocess.run(args, check=True, capture_output=True, text=True)
+    run("cmake", "-G", "Ninja", "-S", str(project), "-B", str(project / "build"))
+    run("ninja", "-C", str(project / "build"))
+
+    move(keep_build=True)
+    build = workspace / "build"
+    assert "temp_project" not in (build / ".ninja_log").read_text()
+    deps = run("ninja", "-C", str(build), "-t", "deps").stdout
+    assert "CMakeFiles/helper.dir/lib/sub/x.c.o" in deps and "(VALID)" in deps
+    assert "temp_project" not in deps
+
+    # CMakeLists.txtとbeta.cは書き換わっているので、再設定とbeta.cのコンパイルだけが残る
+    run("cmake", "-S", str(workspace), "-B", str(build))
+    plan = run("ninja", "-n", "-d", "explain", "-C", str(build))
+    assert "helper.dir" not in plan.stdout + plan.stderr
+    assert "Building C object CMakeFiles/beta.dir/beta.c.o" in plan.stdout
+    assert "Re-running CMake" not in plan.stdout
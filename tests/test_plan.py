@@ -0,0 +1,104 @@
+import collections
+import dataclasses
+import os
+import shutil
+
+import pytest
+
+import move_pico_project as mpp
+
+
+def test_index_tracks_scans_and_updates(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    (tmp_path / "a" / "b" / "f.txt").write_bytes(b"12345")
+    (tmp_path / "a" / "g.txt").write_bytes(b"12")
+    os.symlink("g.txt", tmp_path / "a" / "link")
+    index = mpp.FileIndex()
+    index.scan(tmp_path / "a", recursive=False)
+    assert index.covers(tmp_path / "a" / "missing") and not index.exists(tmp_path / "a" / "missing")
+    assert not index.covers(tmp_path / "a" / "b" / "f.txt")
+    assert index.get(tmp_path / "a" / "link").kind == "symlink"
+
+    index.scan(tmp_path / "a")
+    a = tmp_path / "a"
+    assert index.is_dir(a / "b") and index.exists(a / "b" / "f.txt")
+    assert index.tree_stats(a) == (3, 7 + index.get(a / "link").size)
+    pruned = [path for path, _ in index.walk(a, prune=lambda path, entry: path.name == "b")]
+    assert a / "b" not in pruned and a / "b" / "f.txt" not in pruned and a / "g.txt" in pruned
+
+    index.move(a / "b", a / "c")
+    assert not index.exists(a / "b" / "f.txt") and index.get(a / "c" / "f.txt").size == 5
+    assert sorted(p.name for p in index.list_dir(a)) == ["c", "g.txt", "link"]
+    index.add(a / "c" / "new", "dir")
+    assert index.is_dir(a / "c" / "new") and index.list_dir(a / "c" / "new") == []
+    index.remove(a / "c")
+    assert not index.exists(a / "c" / "f.txt") and a / "c" not in index.list_dir(a)
+
+
+def steps(plan) -> list:
+    return [operation["step"] for operation in plan["operations"]]
+
+
+def test_plan_lists_only_enabled_steps(workspace):
+    plan = mpp.run_plan(workspace, "temp_project", "beta")
+    assert plan["errors"] == [] and plan["enough_space"] and plan["same_device"]
+    assert plan["required_bytes"] == 0
+    assert steps(plan) == ["env", "gitignore", "extensions", "build"] + ["move"] * 6 + ["cmake", "rename"]
+    assert plan["operations"][3]["op"] == "delete"
+    assert plan["files"] == 6
+
+    plan = mpp.run_plan(workspace, "temp_project", "beta", keep_build=True, rename_files=False,
+                        ccache=True, dedupe=True, store_dir=workspace.parent / "store")
+    assert "rename" not in steps(plan)
+    assert steps(plan)[-2:] == ["ccache", "dedupe"]
+    assert plan["operations"][3]["op"] == "relocate"
+    assert "build" in [os.path.basename(o["src"]) for o in plan["operations"] if o["op"] == "move"]
+    assert plan["operations"][steps(plan).index("cmake")]["files"] == [
+        str(workspace / "CMakeLists.txt"), str(workspace / "pico_sdk_import.cmake")]
+
+
+def test_plan_reports_errors(workspace):
+    (workspace / "CMakeLists.txt").write_text("project(other)\n")
+    (workspace / "temp_project" / "CMakeLists.txt").unlink()
+    errors = mpp.run_plan(workspace, "temp_project", "beta")["errors"]
+    assert len(errors) == 2
+
+
+@pytest.fixture
+def other_device(monkeypatch):
+    # 移動元を別デバイスに見せかけ、空き容量を0にする
+    build_index = mpp.PicoProjectMover.build_index
+
+    def fake(self, init_dir):
+        index = build_index(self, init_dir)
+        src = self.root_dir / init_dir
+        index.entries[src] = dataclasses.replace(index.get(src), device=-1)
+        return index
+    monkeypatch.setattr(mpp.PicoProjectMover, "build_index", fake)
+    usage = collections.namedtuple("usage", "total used free")
+    monkeypatch.setattr(mpp.shutil, "disk_usage", lambda path: usage(100, 100, 0))
+
+
+def test_insufficient_space_stops_before_changes(workspace, move, other_device):
+    plan = mpp.run_plan(workspace, "temp_project", "beta")
+    assert not plan["same_device"] and not plan["enough_space"]
+    assert plan["required_bytes"] == plan["bytes"] > 0
+    before = sorted(p.name for p in workspace.iterdir())
+    with pytest.raises(mpp.InsufficientSpaceError) as info:
+        move()
+    assert info.value.details == {"required_bytes": plan["bytes"], "free_bytes": 0}
+    # 何も変更せず、次の実行が再開扱いになるジャーナルも残さない
+    assert sorted(p.name for p in workspace.iterdir()) == before
+    assert not (workspace / mpp.MoveJournal.DIR_NAME).exists()
+
+
+def test_unplanned_steps_are_skipped(workspace, move, monkeypatch):
+    # 計画にないステップ（buildディレクトリが無い場合のbuildなど）は呼び出さない
+    for name in ("cleanup_build_directory", "harvest_template", "configure_compiler_cache",
+                 "rename_project_references", "dedupe_project_files", "cleanup_build_artifacts"):
+        monkeypatch.setattr(mpp.PicoProjectMover, name, lambda self, *args, step=name: pytest.fail(step))
+    shutil.rmtree(workspace / "temp_project" / "build")
+    result = move(rename_files=False)
+    assert (workspace / "CMakeLists.txt").exists()
+    assert not (workspace / "build").exists()
+    assert result.warnings == []
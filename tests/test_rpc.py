@@ -0,0 +1,49 @@
+import io
+import json
+import logging
+
+import move_pico_project as mpp
+
+
+def serve(*requests):
+    # 要求を1行ずつ流し、送られたメッセージを返す
+    reader = io.StringIO("".join(json.dumps(r) + "\n" for r in requests))
+    writer = io.StringIO()
+    server = mpp.JsonRpcServer(reader, writer)
+    server.serve()
+    return server, [json.loads(line) for line in writer.getvalue().splitlines()]
+
+
+def request(request_id, method, **params):
+    return {"jsonrpc": "2.0", "id": request_id, "method": method, "params": params}
+
+
+def test_bad_params_are_invalid_params(workspace):
+    _, messages = serve(request(1, "plan", root_dir=str(workspace), no_such=1),
+                        {"jsonrpc": "2.0", "id": 2, "method": "plan", "params": [1]})
+    assert [m["error"]["code"] for m in messages] == [mpp.JsonRpcServer.INVALID_PARAMS] * 2
+
+
+def test_type_error_inside_operation_is_internal(workspace, monkeypatch):
+    # 処理中のTypeErrorを引数の誤りとして報告しない
+    def broken(root_dir, logger=None):
+        raise TypeError("bug")
+    monkeypatch.setitem(mpp.JsonRpcServer.METHODS, "rollback", broken)
+    _, messages = serve(request(1, "rollback", root_dir=str(workspace)))
+    assert messages[0]["error"]["code"] == mpp.JsonRpcServer.INTERNAL_ERROR
+    assert "bug" in messages[0]["error"]["message"]
+
+
+def test_logs_are_tagged_and_loggers_reused(workspace, monkeypatch):
+    # ログ通知には要求IDがつき、要求ごとにロガーを登録しない
+    def noisy(root_dir, logger=None):
+        logger.info("working")
+        return {"ok": True}
+    monkeypatch.setitem(mpp.JsonRpcServer.METHODS, "rollback", noisy)
+    before = set(logging.Logger.manager.loggerDict)
+    server, messages = serve(*(request(i, "rollback", root_dir=str(workspace)) for i in (1, 2, 3)))
+    assert set(logging.Logger.manager.loggerDict) == before
+    logs = [m["params"]["id"] for m in messages if m.get("method") == "log"]
+    assert logs == [1, 2, 3]
+    assert [m["result"] for m in messages if "result" in m] == [{"ok": True}] * 3
+    assert server.logger.handlers == [server._log_handler]
@@ -0,0 +1,73 @@
+import os
+
+import pytest
+
+import move_pico_project as mpp
+from conftest import make_workspace
+
+
+def _register(store, workspace, name="a.c", data=b"shared\n"):
+    path = workspace / name
+    path.write_bytes(data)
+    st = os.stat(path)
+    digest = store.hash_file(path)
+    store.register(workspace, {name: (digest, st.st_size, st.st_mtime_ns)})
+    return path, digest
+
+
+def test_gc_dry_run_keeps_root_records(tmp_path):
+    store = mpp.ContentStore(tmp_path / "store")
+    workspace = tmp_path / "ws"
+    workspace.mkdir()
+    _register(store, workspace)
+    record = store._root_record(workspace)
+    (workspace / "a.c").unlink()
+    workspace.rmdir()
+
+    store.gc(dry_run=True)
+
+    assert record.exists()
+    assert store.stale_records == [record]
+
+    store.gc()
+
+    assert not record.exists()
+
+
+@pytest.fixture
+def no_reflink(monkeypatch):
+    # ext4やoverlayfsのようにreflinkできないファイルシステム
+    monkeypatch.setattr(mpp.ContentStore, "_reflink", lambda self, src, dst: False)
+
+
+def _move_with_ro(root, logger, store_dir):
+    make_workspace(root)
+    (root / "temp_project" / "ro.h").write_text("#define RO 1\n")
+    os.chmod(root / "temp_project" / "ro.h", 0o444)
+    return mpp.run_move(root, "temp_project", "beta", logger=logger, dedupe=True, store_dir=store_dir)
+
+
+def test_dedupe_hardlinks_only_read_only_files(tmp_path, logger, no_reflink):
+    store_dir = tmp_path / "store"
+    _move_with_ro(tmp_path / "ws1", logger, store_dir)
+    result = _move_with_ro(tmp_path / "ws2", logger, store_dir)
+
+    assert os.path.samefile(tmp_path / "ws1" / "ro.h", tmp_path / "ws2" / "ro.h")
+    assert os.stat(tmp_path / "ws2" / "beta.c").st_nlink == 1
+    assert any("reflink" in w for w in result.warnings)
+
+
+def test_edited_hardlinked_file_is_not_shared_further(tmp_path, logger, no_reflink):
+    # 権限を変えて書き換えたファイルの内容を、次のワークスペースに広げない
+    store_dir = tmp_path / "store"
+    _move_with_ro(tmp_path / "ws1", logger, store_dir)
+    edited = tmp_path / "ws1" / "ro.h"
+    os.chmod(edited, 0o644)
+    edited.write_text("edited in place\n")
+    os.chmod(edited, 0o444)
+
+    _move_with_ro(tmp_path / "ws2", logger, store_dir)
+
+    assert (tmp_path / "ws2" / "ro.h").read_text() == "#define RO 1\n"
+    assert not os.path.samefile(edited, tmp_path / "ws2" / "ro.h")
+    assert edited.read_text() == "edited in place\n"
@@ -0,0 +1,82 @@
+import json
+
+import pytest
+
+import move_pico_project as mpp
+from conftest import make_project
+
+
+def _settings(path):
+    return mpp.parse_jsonc(path.read_text()).value.to_python()
+
+
+def test_plain_move_does_not_record_manifest(workspace, move):
+    move()
+
+    assert not (workspace / mpp.SyncManifest.DIR_NAME).exists()
+
+
+def test_sync_requires_recorded_manifest(workspace, move, logger):
+    move()
+    make_project(workspace)
+
+    with pytest.raises(mpp.SyncBaseMissingError):
+        mpp.run_sync(workspace, "temp_project", "beta", logger=logger)
+
+
+def test_sync_applies_project_changes_and_keeps_user_edits(workspace, move, logger):
+    move(record_manifest=True)
+    (workspace / "beta.h").write_text("#pragma once\n// user edit\n")
+    project = make_project(workspace)
+    (project / "lib" / "sub" / "x.c").write_text("int x = 1;\n")
+    (project / "new.c").write_text("int n;\n")
+
+    result = mpp.run_sync(workspace, "temp_project", "beta", logger=logger)
+
+    assert "lib/sub/x.c" in result.changes["updated"]
+    assert "new.c" in result.changes["added"]
+    assert (workspace / "beta.h").read_text() == "#pragma once\n// user edit\n"
+    assert (workspace / "lib" / "sub" / "x.c").read_text() == "int x = 1;\n"
+    assert not (workspace / "temp_project").exists()
+
+
+def test_sync_keeps_user_keys_in_merged_vscode_settings(workspace, move, logger):
+    (workspace / ".vscode" / "settings.json").write_text('{"editor.tabSize": 2, "user.custom": true}\n')
+    move(record_manifest=True)
+    assert _settings(workspace / ".vscode" / "settings.json")["user.custom"] is True
+
+    project = make_project(workspace)
+    (project / ".vscode" / "settings.json").write_text(
+        json.dumps({"cmake.generator": "Ninja", "new.key": 1}))
+    mpp.run_sync(workspace, "temp_project", "beta", logger=logger)
+
+    settings = _settings(workspace / ".vscode" / "settings.json")
+    assert settings["editor.tabSize"] == 2
+    assert settings["user.custom"] is True
+    assert settings["new.key"] == 1
+    assert settings["cmake.generator"] == "Ninja"
+
+
+def test_unchanged_regeneration_leaves_merged_settings_alone(workspace, move, logger):
+    (workspace / ".vscode" / "settings.json").write_text('{"user.custom": true}\n')
+    move(record_manifest=True)
+    before = (workspace / ".vscode" / "settings.json").read_text()
+
+    make_project(workspace)
+    mpp.run_sync(workspace, "temp_project", "beta", logger=logger)
+
+    assert (workspace / ".vscode" / "settings.json").read_text() == before
+
+
+def test_rename_keeps_project_side_base_of_merged_settings(workspace, move, logger):
+    (workspace / ".vscode" / "settings.json").write_text('{"user.custom": true}\n')
+    move(record_manifest=True)
+
+    mpp.run_rename(workspace, "beta", "gamma", logger=logger)
+    project = make_project(workspace)
+    (project / ".vscode" / "settings.json").write_text('{"cmake.generator": "Ninja", "new.key": 1}')
+    mpp.run_sync(workspace, "temp_project", "gamma", logger=logger)
+
+    settings = _settings(workspace / ".vscode" / "settings.json")
+    assert settings["user.custom"] is True and settings["new.key"] == 1
+    assert (workspace / "gamma.c").exists()
@@ -0,0 +1,78 @@
+import json
+import os
+import pstats
+import shutil
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import pytest
+
+import move_pico_project as mpp
+
+PHASES = ["index", "plan", "env", "gitignore", "extensions", "build", "move", "cmake", "rename",
+          "reclaim_trash"]
+
+
+def test_spans_and_errors():
+    tracer = mpp.Tracer()
+    with tracer.span("outer", "phase"):
+        with tracer.span("inner", path="x"):
+            time.sleep(0.01)
+        tracer.count("files", 2)
+        tracer.error("warned")
+    with pytest.raises(ValueError):
+        with tracer.span("failing", "phase"):
+            raise ValueError("boom")
+
+    summary = tracer.summary()
+    assert [p["name"] for p in summary["phases"]] == ["outer", "failing"]
+    assert summary["phases"][0]["seconds"] >= summary["operations"]["inner"]["seconds"] >= 0.01
+    assert summary["phases"][1]["error"] == "ValueError: boom"
+    assert summary["counters"] == {"files": 2}
+    assert [(e["span"], e["message"]) for e in summary["errors"]] == [
+        ("outer", "warned"), ("failing", "ValueError: boom")]
+
+    events = {e["name"]: e for e in tracer.chrome_trace()["traceEvents"] if e["ph"] == "X"}
+    spans = {s["name"]: s for s in tracer.spans}
+    for name, event in events.items():
+        assert event["dur"] == spans[name]["dur_ns"] / 1000
+        assert event["ts"] == spans[name]["start_ns"] / 1000
+    assert events["inner"]["args"] == {"path": "x"}
+    assert events["outer"]["ts"] <= events["inner"]["ts"]
+    assert events["inner"]["ts"] + events["inner"]["dur"] <= events["outer"]["ts"] + events["outer"]["dur"]
+
+
+def test_library_trace_lists_phases(move):
+    result = move()
+    assert [p["name"] for p in result.trace["phases"]] == PHASES
+    assert result.trace["counters"]["files_moved"] == 6
+
+
+def test_cli_writes_chrome_trace_and_profile(workspace, tmp_path):
+    # コマンドラインから --trace（chrome形式）と --profile を指定して移動する
+    script = workspace / "move_pico_project.py"
+    shutil.copy(mpp.__file__, script)
+    trace, profile = tmp_path / "trace.json", tmp_path / "move.pstats"
+    env = dict(os.environ, PROJECT_NAME="beta")
+    subprocess.run([sys.executable, str(script), "temp_project", "--trace", str(trace),
+                    "--trace-format", "chrome", "--profile", str(profile)],
+                   check=True, capture_output=True, env=env, cwd=tmp_path)
+    assert (workspace / "beta.c").exists()
+
+    events = json.loads(trace.read_text(encoding="utf-8"))["traceEvents"]
+    phases = sorted((e for e in events if e.get("cat") == "phase"), key=lambda e: e["ts"])
+    assert [e["name"] for e in phases] == PHASES
+    for before, after in zip(phases, phases[1:]):
+        assert before["dur"] > 0 and before["ts"] + before["dur"] <= after["ts"]
+    cmake = phases[PHASES.index("cmake")]
+    rewrites = [e for e in events if e["name"] == "cmake_rewrite"]
+    assert rewrites and all(cmake["ts"] <= e["ts"] and e["ts"] + e["dur"] <= cmake["ts"] + cmake["dur"]
+                            for e in rewrites)
+    counters = [e for e in events if e["ph"] == "C"]
+    assert counters[0]["args"]["files_moved"] == 6
+    assert not [e for e in events if e["name"] == "error"]
+
+    functions = {(Path(file).name, name) for file, _, name in pstats.Stats(str(profile)).stats}
+    assert ("move_pico_project.py", "execute") in functions
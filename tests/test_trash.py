@@ -0,0 +1,47 @@
+import move_pico_project as mpp
+
+
+def _fill(root, breadth=6, depth=3):
+    # 各階層にファイルとサブディレクトリを持つツリーを作る
+    root.mkdir(parents=True)
+    for i in range(breadth):
+        (root / f"f{i}.o").write_bytes(b"x" * 10)
+    if depth:
+        for i in range(breadth):
+            _fill(root / f"d{i}", breadth, depth - 1)
+
+
+def test_collect_tasks_returns_only_leaves(tmp_path):
+    _fill(tmp_path / "build", breadth=3, depth=3)
+    reclaimer = mpp.TrashReclaimer(tmp_path, progress=False)
+
+    tasks = reclaimer._collect_tasks(tmp_path / "build")
+
+    assert tasks
+    for task in tasks:
+        assert not any(other != task and other in task.parents for other in tasks)
+
+
+def test_reclaim_removes_everything_without_errors(tmp_path):
+    trash = tmp_path / mpp.TRASH_DIR_NAME
+    for name in ("build-1", "build-2"):
+        _fill(trash / name)
+    (trash / "stray.txt").write_text("x")
+
+    reclaimer = mpp.TrashReclaimer(trash, workers=16, progress=False)
+
+    assert reclaimer.reclaim()
+    assert reclaimer.errors == []
+    assert not (trash / "build-1").exists() and not (trash / "build-2").exists()
+    assert not (trash / "stray.txt").exists()
+
+
+def test_reclaim_keeps_its_log(tmp_path):
+    trash = tmp_path / mpp.TRASH_DIR_NAME
+    _fill(trash / "build-1", depth=1)
+    (trash / mpp.TrashReclaimer.LOG_FILE).write_text("started\n")
+
+    assert mpp.TrashReclaimer(trash, progress=False).reclaim()
+
+    assert (trash / mpp.TrashReclaimer.LOG_FILE).read_text() == "started\n"
+    assert not (trash / "build-1").exists()
@@ -0,0 +1,97 @@
+import os
+import sys
+import threading
+
+import pytest
+
+import move_pico_project as mpp
+from conftest import make_project
+
+pytestmark = pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotifyはLinuxのみ")
+
+
+def _library(root, name="vendor_lib"):
+    # Picoの生成物ではないCMakeプロジェクト
+    (root / name).mkdir()
+    (root / name / "CMakeLists.txt").write_text("cmake_minimum_required(VERSION 3.13)\nproject(vendor C)\n")
+    return root / name
+
+
+def test_is_generated_project(tmp_path):
+    assert mpp.ProjectWatcher.is_generated_project(make_project(tmp_path))
+    assert not mpp.ProjectWatcher.is_generated_project(_library(tmp_path))
+
+
+def test_watcher_skips_non_pico_cmake_projects(tmp_path):
+    _library(tmp_path)
+    make_project(tmp_path)
+    started = []
+
+    def run_project(name):
+        started.append(name)
+        return True
+
+    watcher = mpp.ProjectWatcher(tmp_path, run_project, quiet=0.01)
+    assert watcher.run(once=True, existing=True) == 0
+    assert started == ["temp_project"]
+
+
+def test_watcher_name_allow_list(tmp_path):
+    _library(tmp_path)
+    make_project(tmp_path)
+    started = []
+
+    def run_project(name):
+        started.append(name)
+        return True
+
+    watcher = mpp.ProjectWatcher(tmp_path, run_project, quiet=0.01, names=["vendor_lib"])
+    assert watcher.run(once=True, existing=True) == 0
+    assert started == ["vendor_lib"]
+
+
+def _run_until_interrupted(watcher, started, guard_after=3.0):
+    # run_projectがKeyboardInterruptで止めるまで監視する
+    # （検出されない場合に備え、一定時間後に zz_guard を作り、それを展開しようとした時点で終わらせる）
+    timer = threading.Timer(guard_after, make_project, (watcher.root_dir, "zz_guard"))
+    timer.start()
+    try:
+        watcher.run(existing=True)
+    finally:
+        timer.cancel()
+    return started
+
+
+def test_project_generated_during_expansion_is_detected(tmp_path):
+    make_project(tmp_path)
+    started = []
+
+    def run_project(name):
+        started.append(name)
+        if name != "temp_project":
+            raise KeyboardInterrupt
+        # 展開処理と同じく中身をワークスペース直下へ移し、その間に拡張機能が次のプロジェクトを生成する
+        for child in os.listdir(tmp_path / name):
+            os.rename(tmp_path / name / child, tmp_path / child)
+        (tmp_path / name).rmdir()
+        make_project(tmp_path, "second")
+        return True
+
+    watcher = mpp.ProjectWatcher(tmp_path, run_project, quiet=0.05)
+    assert _run_until_interrupted(watcher, started) == ["temp_project", "second"]
+
+
+def test_failed_project_is_retried_after_change(tmp_path):
+    make_project(tmp_path)
+    started = []
+
+    def run_project(name):
+        started.append(name)
+        if len(started) == 1:
+            # 失敗した後で利用者が修正して保存する
+            threading.Timer(0.2, lambda: (tmp_path / name / "CMakeLists.txt").open("a").write("\n")).start()
+            return False
+        raise KeyboardInterrupt
+
+    watcher = mpp.ProjectWatcher(tmp_path, run_project, quiet=0.05)
+    assert _run_until_interrupted(watcher, started) == ["temp_project", "temp_project"]